@@ -10,6 +10,15 @@ import json
 from streamlit_extras.stylable_container import stylable_container
 import time
 from components import kpi_card
+from db.backend import get_backend
+from db.batch import QueryBatch
+from db.cache import cached, pending_refreshes
+from db.governor import PRIORITY_SIDEBAR, get_governor
+from db.query import query_data
+from db.rollup import start_rollup_refresher
+from db.schema import get_catalog
+from db.sql import build_where_clause
+from db.watermark import start_watermark_monitor
 
 # Configure page settings for better performance
 st.set_page_config(
@@ -39,127 +48,50 @@ def init_session_state():
 
 init_session_state()
 
-# Load secrets
-host = st.secrets["mysql"]["host"]
-database = st.secrets["mysql"]["database"]
-user = st.secrets["mysql"]["user"]
-password = st.secrets["mysql"]["password"]
-
-# Connect to database
+# Database backend shared by all sessions (MySQL pool or local engine, created once per server process)
 try:
-    connection = mysql.connector.connect(
-        host=host,
-        database=database,
-        user=user,
-        password=password)
-    cursor = connection.cursor()
-except Error as e:
-    st.error(f"Error connecting to MySQL: {e}")
-
-# Enhanced query function with progress indicator
-@st.cache_data
-def query_data(
-    columns: list,
-    tablename: str,
-    filters: dict,
-    start_date=None,
-    end_date=None,
-    aggregations: dict = None,  # e.g., {"Impression": "SUM", "Cost": "AVG"}
-    group_by: list = None       # e.g., ["Region", "Platform"]
-):
-    # Build SELECT clause
-    if aggregations:
-        select_parts = [
-            f"{aggregations[col]}({col}) AS {col}" if col in aggregations else col
-            for col in columns
-        ]
-    else:
-        select_parts = columns
-
-    column_str = ", ".join(select_parts)
-
-    # Build WHERE clause
-    where_clauses = []
-    values = []
-
-    for col, value in filters.items():
-        where_clauses.append(f"{col} = %s")
-        values.append(value)
-
-    if start_date:
-        where_clauses.append("report_date >= %s")
-        values.append(start_date)
-
-    if end_date:
-        where_clauses.append("report_date <= %s")
-        values.append(end_date)
+    backend = get_backend()
+except (Error, OSError, ValueError) as e:
+    st.error(f"Error connecting to the database: {e}")
+    st.stop()
 
-    where_clause = " AND ".join(where_clauses)
-
-    # Construct query
-    query = f"SELECT {column_str} FROM {tablename}"
-    if where_clause:
-        query += f" WHERE {where_clause}"
-    if aggregations and group_by:
-        query += " GROUP BY " + ", ".join(group_by)
-
-    # Execute query
-    cursor.execute(query, values)
-    data = cursor.fetchall()
-
-    # Determine result columns for DataFrame
-    if aggregations:
-        result_columns = group_by + [col for col in columns if col in aggregations]
-    else:
-        result_columns = columns
-
-    return pd.DataFrame(data, columns=result_columns)
+# Invalidate cached results per table and campaign as the report data changes
+start_watermark_monitor()
 
+# Keep the pre-aggregated rollup tables current (only if [rollups] refresh_interval is set)
+start_rollup_refresher()
 
 TABLE_NAME = "report_campaign_creative"
 
-# === Helpers ===
-def build_where_clause(filters, start_date=None, end_date=None):
-    where_clauses = []
-    values = []
-
-    for col, val in filters.items():
-        # REMOVED quotes around "col"
-        where_clauses.append(f'{col} = %s')
-        values.append(val)
-
-    if start_date:
-        where_clauses.append("report_date >= %s")
-        values.append(start_date)
-    if end_date:
-        where_clauses.append("report_date <= %s")
-        values.append(end_date)
+# ?debug=1 (or debug = true in secrets) shows which engine answered each query
+DEBUG = st.query_params.get("debug") == "1" or st.secrets.get("debug", False)
 
-    clause = f" WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
-    return clause, values
-
-
-@st.cache_data
+# === Helpers ===
+@cached
 def get_filtered_list(column, tablename, filters=None, start_date=None, end_date=None):
     filters = filters or {}
-    where_clause, values = build_where_clause(filters, start_date, end_date)
+    get_catalog().validate(tablename, [column], filters)
+    dialect = backend.dialect
+    where_clause, values = build_where_clause(filters, start_date, end_date, dialect)
 
     # Use TRIM() to clean the data being selected. Order by the column number.
-    query = f'SELECT DISTINCT ({column}) FROM {tablename}{where_clause} ORDER BY 1'
+    query = f'SELECT DISTINCT {dialect.quote(column)} FROM {tablename}{where_clause} ORDER BY 1'
     
-    cursor.execute(query, tuple(values))
+    with get_governor().slot(PRIORITY_SIDEBAR), backend.connection() as cnx, backend.execute(cnx, query, values) as cursor:
+        rows = cursor.fetchall()
     # Filter out potential None or empty string results from TRIM
-    return [row[0] for row in cursor.fetchall() if row[0]]
+    return [row[0] for row in rows if row[0]]
 
 
-@st.cache_data
+@cached
 def get_filtered_date_range(tablename, filters=None):
     filters = filters or {}
-    where_clause, values = build_where_clause(filters)
+    get_catalog().validate(tablename, filters=filters)
+    where_clause, values = build_where_clause(filters, dialect=backend.dialect)
 
     query = f"SELECT MIN(report_date), MAX(report_date) FROM {tablename}{where_clause}"
-    cursor.execute(query, tuple(values))
-    return cursor.fetchone()
+    with get_governor().slot(PRIORITY_SIDEBAR), backend.connection() as cnx, backend.execute(cnx, query, values) as cursor:
+        return cursor.fetchone()
 
 
 def get_date_input(min_date, max_date):
@@ -202,15 +134,19 @@ with st.sidebar:
 
 
     # Step 1: Brand
+    # Multi-value filters are sent as lists and compiled to IN (...); none selected means all
     brand_list = get_filtered_list("Brand", TABLE_NAME)
-    selected_brand = st.selectbox("Select Brand", ["All"] + brand_list)
-    if selected_brand != "All":
-        active_filters["Brand"] = selected_brand
+    selected_brands = st.multiselect("Select Brand", brand_list, placeholder="All")
+    if selected_brands:
+        active_filters["Brand"] = selected_brands
 
     # Step 2: Campaign Code
     campaign_list = get_filtered_list("Campaign_code", TABLE_NAME, filters=active_filters)
-    selected_campaign = st.selectbox("Select Campaign Code", campaign_list)
-    active_filters["Campaign_code"] = selected_campaign
+    selected_campaigns = st.multiselect("Select Campaign Code", campaign_list, default=campaign_list[:1])
+    if not selected_campaigns:
+        st.warning("Please select at least one campaign.")
+        st.stop()
+    active_filters["Campaign_code"] = selected_campaigns
 
     # Step 3: Date Range
     min_date, max_date = get_filtered_date_range(TABLE_NAME, filters=active_filters)
@@ -224,17 +160,22 @@ with st.sidebar:
     platform_list = get_filtered_list(
         "Platform", TABLE_NAME, filters=active_filters, start_date=start_date, end_date=end_date
     )
-    selected_platform = st.selectbox("Select Platform", ["All"] + platform_list)
-    if selected_platform != "All":
-        active_filters["Platform"] = selected_platform
+    selected_platforms = st.multiselect("Select Platform", platform_list, placeholder="All")
+    if selected_platforms:
+        active_filters["Platform"] = selected_platforms
 from st_aggrid import JsCode, AgGrid, GridOptionsBuilder
 from st_aggrid.shared import GridUpdateMode    
 
 # Enhanced tab switching with a real-time loading animation
-def display_tab_with_loading(tab_name, display_func, *args):
-    """Displays a real-time CSS loading animation while data is being fetched."""
+def display_tab_with_loading(tab_name, tab, *args):
+    """Displays a real-time CSS loading animation while data is being fetched.
+
+    The tab's declared queries are started together before rendering, so
+    the wait is roughly the slowest query rather than the sum of them all.
+    """
     
-    loading_html = f"""
+    def loading_html(message):
+        return f"""
     <style>
     .loader {{
       border: 5px solid #f3f3f3; /* Light grey */
@@ -253,21 +194,54 @@ def display_tab_with_loading(tab_name, display_func, *args):
     <div style="text-align: center; padding: 3rem;">
         <div class="loader"></div>
         <h2 style="color: #2E86AB; margin-bottom: 1rem;">Loading {tab_name}...</h2>
-        <p style="color: #666; font-size: 1.1rem;">Preparing your dashboard, please wait.</p>
+        <p style="color: #666; font-size: 1.1rem;">{message}</p>
     </div>
     """
     
     # Placeholder for the loading animation
     loading_placeholder = st.empty()
+
+    def show_progress():
+        # Tell the user when the database is busy rather than just spinning
+        queued = batch.queued()
+        if queued:
+            message = f"Queued: the database is busy, {queued} of this tab's queries are waiting for a slot."
+        else:
+            message = "Preparing your dashboard, please wait."
+        loading_placeholder.markdown(loading_html(message), unsafe_allow_html=True)
     
     try:
         # Display the CSS-based loading animation
-        loading_placeholder.markdown(loading_html, unsafe_allow_html=True)
+        loading_placeholder.markdown(loading_html("Preparing your dashboard, please wait."), unsafe_allow_html=True)
         
-        # Call the function to load data and display content.
+        # Run every query the tab declares concurrently, then render.
         # The CSS animation will continue to spin in the browser
         # while this function blocks and fetches data.
-        display_func(*args)
+        # Re-rendering the placeholder while waiting lets Streamlit stop this
+        # run as soon as the user switches tab or filters; the batch then
+        # cancels its queries on the database.
+        batch = QueryBatch(query_data)
+        batch.submit(tab.queries(*args))
+        batch.wait(on_tick=show_progress)
+        tab.display(batch.query_data, *args)
+        if DEBUG:
+            with st.expander("Debug: query engines"):
+                st.dataframe(pd.DataFrame(batch.engines()), hide_index=True)
+                monitor = getattr(backend, "monitor", None)
+                if monitor is not None:
+                    st.caption("Replicas: " + ", ".join(f"{name} {status}" for name, status in monitor.status.items()))
+                statements = backend.statement_stats()
+                if statements is not None:
+                    st.caption(
+                        f"Prepared statements: {statements['hit_rate']:.0%} hit rate "
+                        f"({statements['hits']:,} hits, {statements['misses']:,} prepared, {statements['statements']} cached)"
+                    )
+                governor = get_governor().stats()
+                st.caption(
+                    f"Query slots: {governor['running']} running, {governor['queue_depth']} queued "
+                    f"(peak {governor['max_queue_depth']}); {governor['queued_total']:,} of {governor['admitted']:,} "
+                    f"admitted queries waited, avg {governor['avg_wait_seconds']:.2f}s, max {governor['max_wait_seconds']:.2f}s"
+                )
         
         # Clear the loading animation once the content is loaded and displayed
         loading_placeholder.empty()
@@ -281,16 +255,39 @@ def display_tab_with_loading(tab_name, display_func, *args):
         st.error(f"Error loading {tab_name}: {str(e)}")
         st.info("Please try refreshing the page or contact support if the issue persists.")
 
+def wait_for_refresh():
+    """Mark the page as refreshing while expired results are re-queried in the background.
+
+    Cached results past their TTL are shown straight away; once their
+    refreshes finish the script reruns so the new numbers replace them.
+    """
+    refreshes = pending_refreshes()
+    if not refreshes:
+        return
+
+    status_placeholder = st.sidebar.empty()
+    while not all(future.done() for future in refreshes):
+        # Re-rendering the badge also lets Streamlit interrupt this loop
+        # as soon as the user changes a filter or tab.
+        status_placeholder.caption("🔄 Refreshing data... showing the last cached results.")
+        time.sleep(0.5)
+    status_placeholder.empty()
+
+    if any(future.exception() is None for future in refreshes):
+        st.rerun()
+
 # Display the selected tab with enhanced loading
 if selected == "Overall":
-    display_tab_with_loading("Overall", overall.display, query_data, active_filters, start_date, end_date)
+    display_tab_with_loading("Overall", overall, active_filters, start_date, end_date)
 elif selected == "Region":
-    display_tab_with_loading("Region", region.display, query_data, active_filters, start_date, end_date)
+    display_tab_with_loading("Region", region, active_filters, start_date, end_date)
 elif selected == "Creative":
-    display_tab_with_loading("Creative", creative.display, query_data, active_filters, start_date, end_date)
+    display_tab_with_loading("Creative", creative, active_filters, start_date, end_date)
 elif selected == "Audience":
-    display_tab_with_loading("Audience", audience.display, query_data, active_filters, start_date, end_date, selected_platform)
+    display_tab_with_loading("Audience", audience, active_filters, start_date, end_date, selected_platforms)
 elif selected == "Test Overall":
-    display_tab_with_loading("Test Overall", test_overall.display, query_data, active_filters, start_date, end_date)
+    display_tab_with_loading("Test Overall", test_overall, active_filters, start_date, end_date)
 elif selected == "Test Overall Enhanced":
-    display_tab_with_loading("Test Overall Enhanced", test_overall_enhanced.display, query_data, active_filters, start_date, end_date)
\ No newline at end of file
+    display_tab_with_loading("Test Overall Enhanced", test_overall_enhanced, active_filters, start_date, end_date)
+
+wait_for_refresh()
@@ -1,6 +1,14 @@
 import streamlit as st
 import re
 
+def campaign_title(active_filters):
+    """Header text for the selected campaign code(s)."""
+    campaigns = active_filters.get("Campaign_code", "All Campaigns")
+    if isinstance(campaigns, (list, tuple)):
+        return ", ".join(str(c) for c in campaigns)
+    return campaigns
+
+
 def kpi_card(
     title: str,
     value: int,
@@ -0,0 +1,400 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import streamlit as st
+
+from db.backend import get_backend
+from db.spec import QuerySpec
+from db.sql import build_query, build_where_clause
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOG = "query_templates.json"
+DEFAULT_REPORT = "index_report.md"
+SAVE_INTERVAL = 60  # seconds between writes of the template log
+MAX_INDEX_COLUMNS = 16  # MySQL's limit on key parts per index
+MAX_KEY_BYTES = 3072  # InnoDB's limit on an index key (DYNAMIC/COMPRESSED row format)
+TEMPLATE_WIDTH = 160  # characters of SQL shown per template in the report
+
+EXPLAIN_PREFIXES = {"mysql": "EXPLAIN FORMAT=JSON ", "duckdb": "EXPLAIN (FORMAT json) "}
+INDEX_QUERIES = {
+    "mysql": (
+        "SELECT INDEX_NAME, COLUMN_NAME FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s ORDER BY INDEX_NAME, SEQ_IN_INDEX"
+    ),
+    "duckdb": "SELECT index_name, expressions FROM duckdb_indexes() WHERE table_name = ?",
+}
+COLUMN_WIDTHS_QUERY = (
+    "SELECT COLUMN_NAME, DATA_TYPE, CHARACTER_OCTET_LENGTH FROM information_schema.COLUMNS "
+    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s"
+)
+# Bytes a key part of each fixed-width MySQL type takes (string types use their octet length)
+FIXED_WIDTHS = {
+    "tinyint": 1, "smallint": 2, "mediumint": 3, "int": 4, "integer": 4, "bigint": 8, "bit": 8, "year": 1,
+    "float": 4, "double": 8, "real": 8, "decimal": 16,
+    "date": 3, "time": 6, "datetime": 8, "timestamp": 7,
+}
+
+
+def template_key(spec):
+    """Shape of a spec's SQL: everything but the filter values and dates."""
+    return json.dumps([
+        spec.table,
+        sorted(f"{col} IN" if isinstance(value, tuple) else col for col, value in spec.filters),
+        spec.start_date is not None,
+        spec.end_date is not None,
+        list(spec.columns),
+        [list(measure) for measure in spec.measures],
+        list(spec.group_by),
+        [[alias, func, col, [c for c, _ in when]] for alias, func, col, when in spec.conditionals],
+        [list(ratio) for ratio in spec.ratios],
+        [[name, operator] for name, operator, _ in spec.having],
+        [list(order) for order in spec.order_by],
+        spec.limit is not None,
+    ])
+
+
+def spec_to_json(spec):
+    return {
+        "table": spec.table,
+        "columns": list(spec.columns),
+        "filters": [list(f) for f in spec.filters],
+        "start_date": None if spec.start_date is None else str(spec.start_date),
+        "end_date": None if spec.end_date is None else str(spec.end_date),
+        "measures": [list(m) for m in spec.measures],
+        "group_by": list(spec.group_by),
+        "conditionals": [[alias, func, col, [list(w) for w in when]] for alias, func, col, when in spec.conditionals],
+        "ratios": [list(ratio) for ratio in spec.ratios],
+        "having": [list(h) for h in spec.having],
+        "order_by": [list(order) for order in spec.order_by],
+        "limit": spec.limit,
+    }
+
+
+def spec_from_json(data):
+    return QuerySpec(
+        data["table"],
+        tuple(data["columns"]),
+        tuple((col, tuple(value) if isinstance(value, list) else value) for col, value in data["filters"]),
+        data["start_date"],
+        data["end_date"],
+        tuple(tuple(m) for m in data["measures"]),
+        tuple(data["group_by"]),
+        tuple((alias, func, col, tuple(tuple(w) for w in when)) for alias, func, col, when in data.get("conditionals", [])),
+        tuple(tuple(ratio) for ratio in data.get("ratios", [])),
+        tuple(tuple(h) for h in data.get("having", [])),
+        tuple(tuple(order) for order in data.get("order_by", [])),
+        data.get("limit"),
+    )
+
+
+class TemplateRecorder:
+    """Counts the distinct query templates sent to the report tables, with their latency.
+
+    Each template keeps its most recent spec as a sample to EXPLAIN. The
+    log is merged into ``path`` every SAVE_INTERVAL seconds, so several app
+    processes can share one file and the advisor can read it offline.
+    """
+
+    def __init__(self, path=DEFAULT_LOG):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending = {}  # template key -> {"sample", "count", "seconds", "max_seconds"}
+        self._saved_at = time.monotonic()
+
+    def record(self, spec, seconds):
+        key = template_key(spec)
+        with self._lock:
+            entry = self._pending.setdefault(key, {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+            entry["sample"] = spec_to_json(spec)
+            entry["count"] += 1
+            entry["seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            due = time.monotonic() - self._saved_at >= SAVE_INTERVAL
+        if due:
+            self.save()
+
+    def save(self):
+        """Merge the templates recorded since the last save into the log file."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._saved_at = time.monotonic()
+        if not pending:
+            return
+        try:
+            templates = load_templates(self.path)
+            for key, entry in pending.items():
+                merged = templates.setdefault(key, {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+                merged["sample"] = entry["sample"]
+                merged["count"] += entry["count"]
+                merged["seconds"] += entry["seconds"]
+                merged["max_seconds"] = max(merged["max_seconds"], entry["max_seconds"])
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(templates, f, indent=1)
+            os.replace(tmp, self.path)
+        except OSError:
+            logger.exception("Could not write the query template log %s", self.path)
+
+
+def load_templates(path):
+    """Recorded templates: {template key: {"sample", "count", "seconds", "max_seconds"}}."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _scans(node):
+    """Every table access in an EXPLAIN JSON tree (MySQL "table" blocks, DuckDB scan operators)."""
+    if isinstance(node, list):
+        for child in node:
+            yield from _scans(child)
+    elif isinstance(node, dict):
+        if "table_name" in node or node.get("name", "").endswith("_SCAN"):
+            yield node
+        for child in node.values():
+            yield from _scans(child)
+
+
+def rows_examined(dialect, plan, table_rows):
+    """(access type, estimated rows read) of the table scan in an EXPLAIN FORMAT=JSON plan."""
+    for scan in _scans(plan):
+        if dialect.name == "mysql":
+            return scan.get("access_type", "?"), int(scan.get("rows_examined_per_scan", 0))
+        info = scan.get("extra_info", {})
+        access = info.get("Type", scan["name"])
+        # DuckDB's scan estimate is after its filters; a sequential scan still reads every row
+        if access == "Sequential Scan":
+            return access, table_rows
+        return access, int(info.get("Estimated Cardinality", 0))
+    return "?", table_rows
+
+
+def existing_indexes(cursor, dialect, table):
+    """{index name: [columns]} of a table."""
+    cursor.execute(INDEX_QUERIES[dialect.name], (table,))
+    indexes = {}
+    for name, columns in cursor.fetchall():
+        if dialect.name == "duckdb":
+            # expressions come back as text such as [Campaign_code, '"23s_Video_Views"']
+            indexes[name] = [col.strip(" '\"") for col in columns.strip("[]").split(",")]
+        else:
+            indexes.setdefault(name, []).append(columns)
+    return indexes
+
+
+def column_widths(cursor, dialect, table):
+    """{column: estimated key bytes} on MySQL; None elsewhere (DuckDB has no key size limit)."""
+    if dialect.name != "mysql":
+        return None
+    cursor.execute(COLUMN_WIDTHS_QUERY, (table,))
+    return {
+        # TEXT/BLOB columns report 65535+ bytes, so they never fit without a prefix
+        col: int(octets) if octets is not None else FIXED_WIDTHS.get(data_type, MAX_KEY_BYTES + 1)
+        for col, data_type, octets in cursor.fetchall()
+    }
+
+
+def index_columns(spec, equality_order, widths=None):
+    """Composite index for a template: equality columns, then report_date, then the rest to cover it.
+
+    Returns (columns, covering). Covering indexes are only proposed when
+    they fit in MAX_INDEX_COLUMNS key parts and, given ``widths``, in
+    MAX_KEY_BYTES; otherwise the leading columns are trimmed to the
+    longest prefix that fits.
+    """
+    filtered = {col for col, _ in spec.filters}
+    key = sorted(filtered, key=equality_order.index)
+    if spec.start_date is not None or spec.end_date is not None:
+        key.append("report_date")
+    referenced = {col for col, _ in spec.measures} | set(spec.group_by) | set(spec.columns)
+    for _, _, col, when in spec.conditionals:
+        referenced |= {col} | {c for c, _ in when}
+    rest = sorted(referenced - set(key))
+
+    def fits(columns):
+        if len(columns) > MAX_INDEX_COLUMNS:
+            return False
+        return widths is None or sum(widths.get(col, MAX_KEY_BYTES + 1) for col in columns) <= MAX_KEY_BYTES
+
+    if fits(key + rest):
+        return key + rest, True
+    while key and not fits(key):
+        key = key[:-1]
+    return key, False
+
+
+class IndexAdvisor:
+    """Proposes composite/covering indexes for the recorded query templates.
+
+    Equality filter columns lead each index, ordered by how many templates
+    of the table use them so related templates share a leftmost prefix,
+    followed by the report_date range and then the selected columns so the
+    query can be answered from the index alone, as long as the key stays
+    within InnoDB's MAX_KEY_BYTES. Rows examined are the server's EXPLAIN
+    estimate for a sample of each template; rows matching is an actual
+    COUNT(*) of the rows its WHERE clause selects, which is what a range
+    scan of an index on all of its filters reads.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.dialect = backend.dialect
+
+    def _explain(self, cursor, spec, table_rows):
+        query, values = build_query(spec, self.dialect)
+        cursor.execute(EXPLAIN_PREFIXES[self.dialect.name] + query, values)
+        row = cursor.fetchone()
+        return rows_examined(self.dialect, json.loads(row[-1]), table_rows)
+
+    def _matching_rows(self, cursor, spec):
+        where_clause, values = build_where_clause(spec.filter_dict, spec.start_date, spec.end_date, self.dialect)
+        cursor.execute(f"SELECT COUNT(*) FROM {spec.table}{where_clause}", values)
+        return int(cursor.fetchone()[0])
+
+    def advise(self, templates):
+        """Per-table recommendations for ``templates`` (as recorded by TemplateRecorder)."""
+        by_table = {}
+        for entry in templates.values():
+            by_table.setdefault(entry["sample"]["table"], []).append(entry)
+        report = {}
+        for table, entries in by_table.items():
+            with self.backend.cursor() as cursor:
+                report[table] = self._advise_table(cursor, table, entries)
+        return report
+
+    def _advise_table(self, cursor, table, entries):
+        uses = {}
+        for entry in entries:
+            for col, _ in entry["sample"]["filters"]:
+                uses[col] = uses.get(col, 0) + entry["count"]
+        equality_order = sorted(uses, key=lambda col: (-uses[col], col))
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        table_rows = int(cursor.fetchone()[0])
+        existing = existing_indexes(cursor, self.dialect, table)
+        widths = column_widths(cursor, self.dialect, table)
+
+        rows = []
+        for entry in sorted(entries, key=lambda e: -e["seconds"]):
+            spec = spec_from_json(entry["sample"])
+            access, before = self._explain(cursor, spec, table_rows)
+            columns, covering = index_columns(spec, equality_order, widths)
+            rows.append({
+                "template": build_query(spec, self.dialect)[0],
+                "count": entry["count"],
+                "avg_ms": 1000 * entry["seconds"] / entry["count"],
+                "max_ms": 1000 * entry["max_seconds"],
+                "access": access,
+                "rows_before": before,
+                "rows_matching": self._matching_rows(cursor, spec),
+                "index": columns,
+                "covering": covering,
+            })
+
+        # An index also serves every template whose index is a leftmost prefix of it
+        proposed = []
+        for columns in sorted({tuple(row["index"]) for row in rows}, key=len, reverse=True):
+            if not columns or any(p[:len(columns)] == columns for p in proposed):
+                continue
+            if any(tuple(cols[:len(columns)]) == columns for cols in existing.values()):
+                continue
+            proposed.append(columns)
+        names = {}
+        for columns in proposed:
+            name = index_name(table, columns)
+            names[columns] = name if name not in names.values() else f"{name[:60]}_{len(names) + 1}"
+        for row in rows:
+            served = [p for p in proposed if p[:len(row["index"])] == tuple(row["index"])]
+            row["index"] = names[served[0]] if served else "(existing index)"
+        return {
+            "rows": table_rows,
+            "existing": existing,
+            "proposed": [(names[cols], list(cols)) for cols in proposed],
+            "templates": rows,
+        }
+
+
+def index_name(table, columns):
+    name = "ix_" + table.removeprefix("report_campaign_") + "__" + "_".join(c.lower() for c in columns[:3])
+    return name[:64]  # MySQL's identifier length limit
+
+
+def format_report(report, dialect):
+    """Markdown report of ``IndexAdvisor.advise`` output, with the DDL to apply."""
+    q = dialect.quote
+    lines = [f"# Index advisor report ({datetime.now():%Y-%m-%d %H:%M}, {dialect.name})", ""]
+    for table, found in report.items():
+        lines += [f"## {table} ({found['rows']:,} rows)", ""]
+        if found["existing"]:
+            for name, columns in found["existing"].items():
+                lines.append(f"- existing `{name}` ({', '.join(columns)})")
+            lines.append("")
+        if found["proposed"]:
+            lines.append("```sql")
+            for name, columns in found["proposed"]:
+                lines.append(f"CREATE INDEX {name} ON {table} ({', '.join(q(c) for c in columns)});")
+            lines += ["```", ""]
+        lines += [
+            "| runs | avg ms | max ms | access | rows examined (estimate) | rows matching (count) | index | covering | template |",
+            "|---:|---:|---:|---|---:|---:|---|---|---|",
+        ]
+        for row in found["templates"]:
+            template = row["template"]
+            if len(template) > TEMPLATE_WIDTH:
+                template = template[:TEMPLATE_WIDTH] + "…"
+            lines.append(
+                f"| {row['count']} | {row['avg_ms']:.0f} | {row['max_ms']:.0f} | {row['access']} "
+                f"| {row['rows_before']:,} | {row['rows_matching']:,} | {row['index']} "
+                f"| {'yes' if row['covering'] else 'no'} | `{template}` |"
+            )
+        lines.append("")
+    return "\n".join(lines)
+
+
+@st.cache_resource
+def get_recorder():
+    """Template recorder if ``[advisor] record = true``, else None."""
+    settings = st.secrets.get("advisor", {})
+    if not settings.get("record", False):
+        return None
+    return TemplateRecorder(settings.get("log", DEFAULT_LOG))
+
+
+def main():
+    """Admin entry point: ``python -m db.advisor [--log FILE] [--out FILE]``.
+
+    Point ``[backend] engine`` at "duckdb" to try it on the local stand-in
+    database; EXPLAIN and the row counts then come from DuckDB.
+    """
+    settings = st.secrets.get("advisor", {})
+    parser = argparse.ArgumentParser(description="Recommend indexes for the recorded query templates.")
+    parser.add_argument("--log", default=settings.get("log", DEFAULT_LOG))
+    parser.add_argument("--out", default=DEFAULT_REPORT)
+    parser.add_argument("--table", action="append", help="default: every table in the log")
+    args = parser.parse_args()
+
+    templates = {
+        key: entry for key, entry in load_templates(args.log).items()
+        if not args.table or entry["sample"]["table"] in args.table
+    }
+    if not templates:
+        print(f"No query templates recorded in {args.log}; set [advisor] record = true and use the dashboard")
+        return
+    backend = get_backend()
+    report = IndexAdvisor(backend).advise(templates)
+    with open(args.out, "w") as f:
+        f.write(format_report(report, backend.dialect))
+    for table, found in report.items():
+        print(f"{table}: {len(found['templates'])} template(s), {len(found['proposed'])} index(es) proposed")
+    print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
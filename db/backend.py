@@ -0,0 +1,303 @@
+import itertools
+import logging
+import os
+import threading
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+
+import duckdb
+import streamlit as st
+from mysql.connector import Error
+
+from db.pool import get_pool, get_replica_pools
+from db.replica import DEFAULT_INTERVAL, DEFAULT_MAX_LAG, ReplicaMonitor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENGINE = "mysql"
+DEFAULT_LOCAL_PATH = "local_reports.duckdb"
+DEFAULT_LOCAL_WORKERS = 4
+
+
+@dataclass(frozen=True)
+class Dialect:
+    """The bits of SQL that differ between the engines we run report queries on."""
+
+    name: str
+    placeholder: str
+    quote_char: str
+    execution_time_hint: bool = False
+    case_insensitive: bool = False  # whether text compares like MySQL's default _ci collations
+
+    def quote(self, identifier):
+        # Report columns such as 23s_Video_Views aren't valid bare identifiers everywhere
+        q = self.quote_char
+        return f"{q}{identifier.replace(q, q + q)}{q}"
+
+    def collation_key(self, value):
+        """``value`` as the engine's default collation compares it: with _ci ones, case and trailing spaces don't count."""
+        if self.case_insensitive and isinstance(value, str):
+            return value.rstrip(" ").casefold()
+        return value
+
+    def timeout_hint(self, timeout):
+        """Optimizer hint that makes the server abort a SELECT after ``timeout`` seconds."""
+        if not timeout or not self.execution_time_hint:
+            return ""
+        return f"/*+ MAX_EXECUTION_TIME({int(timeout * 1000)}) */ "
+
+
+MYSQL = Dialect("mysql", placeholder="%s", quote_char="`", execution_time_hint=True, case_insensitive=True)
+DUCKDB = Dialect("duckdb", placeholder="?", quote_char='"')
+
+
+class Backend:
+    """Where the report tables are queried: the production MySQL server or a local engine.
+
+    Everything that talks to the database (query_data, the sidebar lookups,
+    the schema catalog, the watermark monitor) goes through ``get_backend()``
+    and writes SQL through its ``dialect``, so the dashboard, benchmarks and
+    tests can run against a local copy without the production DB.
+    """
+
+    name = None
+    dialect = None
+    size = 1  # how many queries may usefully run at once
+    query_timeout = None
+    max_read_lag = 0  # seconds reads may be behind writes (replicas)
+
+    @property
+    def primary(self):
+        """Backend for writes and for reads that must see them (rollup maintenance, admin tools)."""
+        return self
+
+    @contextmanager
+    def connection(self):
+        raise NotImplementedError
+
+    @contextmanager
+    def cursor(self):
+        """Cursor on a connection of its own, closed when the block exits."""
+        with self.connection() as cnx:
+            cursor = cnx.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def transaction(self):
+        """Cursor whose statements are committed together when the block exits."""
+        with self.connection() as cnx:
+            cursor = cnx.cursor()
+            try:
+                yield cursor
+                cnx.commit()
+            except BaseException:
+                cnx.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def execute(self, cnx, query, values=()):
+        """Cursor on ``cnx`` that has executed ``query``, for the block to fetch from."""
+        cursor = cnx.cursor()
+        try:
+            cursor.execute(query, values)
+            yield cursor
+        finally:
+            cursor.close()
+
+    def statement_stats(self):
+        """Prepared statement cache counters, or None if statements aren't cached."""
+        return None
+
+    def cancel_handle(self, cnx):
+        """Something ``cancel`` can use to abort the statement running on ``cnx``."""
+        return None
+
+    def cancel(self, handle):
+        raise NotImplementedError
+
+    def engine_name(self, cnx):
+        """What to report as the engine that ran a query on ``cnx``."""
+        return self.name
+
+
+class MySQLBackend(Backend):
+    """The production reporting database, through the shared connection pool."""
+
+    name = "mysql"
+    dialect = MYSQL
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.size = pool.size
+        self.query_timeout = pool.query_timeout
+
+    def connection(self):
+        return self.pool.connection()
+
+    def execute(self, cnx, query, values=()):
+        statements = self.pools_by_name().get(cnx.pool_name, self.pool).statements
+        if statements is None:
+            return super().execute(cnx, query, values)
+        return statements.execute(cnx, query, values)
+
+    def pools_by_name(self):
+        return {self.pool.name: self.pool}
+
+    def statement_stats(self):
+        stats = [pool.statements.stats() for pool in self.pools_by_name().values() if pool.statements is not None]
+        if not stats:
+            return None
+        hits, misses = sum(s["hits"] for s in stats), sum(s["misses"] for s in stats)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "statements": sum(s["statements"] for s in stats),
+        }
+
+    def cancel_handle(self, cnx):
+        return cnx.connection_id
+
+    def cancel(self, handle):
+        self.pool.kill_query(handle)
+
+
+class ReplicatedBackend(MySQLBackend):
+    """The primary MySQL server plus read replicas.
+
+    Reads (``connection`` and ``cursor``: query_data, the sidebar lookups,
+    the catalog and watermarks) are spread over the replicas the monitor
+    currently finds within the lag bound, falling back to the primary;
+    ``transaction`` and ``primary`` always use the primary. A replica that
+    fails at checkout is taken out of rotation until its next check, and
+    the read moves on to the next replica or the primary.
+    """
+
+    def __init__(self, pool, replicas, monitor):
+        super().__init__(pool)
+        self._primary = MySQLBackend(pool)
+        self.pools = {pool.name: pool for pool in [pool, *replicas]}
+        self.monitor = monitor
+        self.max_read_lag = monitor.max_lag
+        self._turn = itertools.count()
+
+    @property
+    def primary(self):
+        return self._primary
+
+    @contextmanager
+    def connection(self):
+        current = self.monitor.current()
+        turn = next(self._turn)
+        candidates = [current[(turn + i) % len(current)] for i in range(len(current))] + [self.pool]
+        with ExitStack() as stack:
+            for pool in candidates:
+                try:
+                    cnx = stack.enter_context(pool.connection())
+                except Error as e:
+                    if pool is self.pool:
+                        raise
+                    logger.warning("Replica %s failed at checkout, reading elsewhere: %s", pool.name, e)
+                    self.monitor.mark_unreachable(pool, e)
+                    continue
+                break
+            yield cnx
+
+    def transaction(self):
+        return self._primary.transaction()
+
+    def pools_by_name(self):
+        return self.pools
+
+    def cancel_handle(self, cnx):
+        return cnx.pool_name, cnx.connection_id
+
+    def cancel(self, handle):
+        pool_name, connection_id = handle
+        self.pools[pool_name].kill_query(connection_id)
+
+    def engine_name(self, cnx):
+        return f"{self.name} ({cnx.pool_name})"
+
+
+class LocalBackend(Backend):
+    """Embedded DuckDB database file holding a copy of the report tables.
+
+    Fill it with ``python -m db.localload`` (from MySQL or with synthetic
+    rows). DuckDB runs each query on all cores, so only a few need to run
+    at once; each one gets its own cursor on the shared database.
+    """
+
+    name = "duckdb"
+    dialect = DUCKDB
+
+    def __init__(self, path=DEFAULT_LOCAL_PATH, size=DEFAULT_LOCAL_WORKERS, read_only=True):
+        if read_only and not os.path.exists(path):
+            raise FileNotFoundError(f"Local database {path!r} not found; create it with `python -m db.localload`")
+        self.path = path
+        self.size = max(1, int(size))
+        self._db = duckdb.connect(path, read_only=read_only)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        # A DuckDB cursor is an independent connection to the same database
+        with self._lock:
+            cnx = self._db.cursor()
+        try:
+            yield cnx
+        finally:
+            cnx.close()
+
+    @contextmanager
+    def transaction(self):
+        # A DuckDB cursor is a connection of its own, so run the statements on it directly
+        with self.connection() as cnx:
+            cnx.begin()
+            try:
+                yield cnx
+                cnx.commit()
+            except BaseException:
+                cnx.rollback()
+                raise
+
+    def cancel_handle(self, cnx):
+        return cnx
+
+    def cancel(self, handle):
+        handle.interrupt()
+
+
+@st.cache_resource
+def get_backend():
+    """Backend selected by ``[backend] engine`` ("mysql", the default, or "duckdb").
+
+    With ``[[mysql.replicas]]`` configured, MySQL reads go to replicas no
+    more than ``[mysql] max_replica_lag`` seconds behind the primary.
+    """
+    settings = st.secrets.get("backend", {})
+    engine = settings.get("engine", DEFAULT_ENGINE)
+    if engine == "mysql":
+        replicas = get_replica_pools()
+        if not replicas:
+            return MySQLBackend(get_pool())
+        mysql = st.secrets["mysql"]
+        monitor = ReplicaMonitor(
+            replicas,
+            max_lag=mysql.get("max_replica_lag", DEFAULT_MAX_LAG),
+            interval=mysql.get("replica_check_interval", DEFAULT_INTERVAL),
+        ).start()
+        return ReplicatedBackend(get_pool(), [pool for pool, _ in replicas], monitor)
+    if engine == "duckdb":
+        return LocalBackend(
+            settings.get("local_path", DEFAULT_LOCAL_PATH),
+            size=settings.get("local_workers", DEFAULT_LOCAL_WORKERS),
+            # Writable only if the app maintains rollup tables in it
+            read_only=settings.get("local_read_only", True),
+        )
+    raise ValueError(f"Unknown backend engine: {engine!r}")
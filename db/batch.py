@@ -0,0 +1,289 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from db.backend import MYSQL, get_backend
+from db.cancel import get_tracker, owned_by
+from db.governor import get_governor
+from db.reaggregate import matching
+from db.spec import QuerySpec
+
+# Positional order of query_data's parameters, so calls written either way
+# (region.py passes them positionally) map onto the same spec.
+QUERY_PARAMS = (
+    "columns", "tablename", "filters", "start_date", "end_date", "aggregations", "group_by",
+    "conditions", "ratios", "having", "order_by", "limit",
+)
+
+
+def as_spec(*args, **kwargs):
+    """Turn a query_data(...) call into a dict of keyword arguments."""
+    spec = dict(zip(QUERY_PARAMS, args))
+    spec.update(kwargs)
+    for param in QUERY_PARAMS:
+        spec.setdefault(param, None)
+    return spec
+
+
+def spec_key(spec):
+    """Hashable identity of a query spec (dates and other values rendered as strings)."""
+    return json.dumps(spec, sort_keys=True, default=str)
+
+
+def aggregated(spec):
+    """True if a query_data call aggregates (like QuerySpec.aggregated), rather than returning raw rows."""
+    return bool(spec["aggregations"] or spec["conditions"])
+
+
+def result_columns(spec):
+    return QuerySpec.result_columns(spec["columns"], spec["aggregations"], spec["group_by"], spec["conditions"], spec["ratios"])
+
+
+def fuse_platform_queries(specs, dialect=MYSQL):
+    """Combine declared queries that differ only in their ``Platform`` filter.
+
+    Tabs often fan out one query per platform; each group of such siblings
+    becomes one query filtered on all of their platforms and grouped by (or,
+    for raw rows, selecting) Platform as well. Returns ``(specs, derived)``:
+    the specs to run, and {key of a fused sibling: (key of its fused spec,
+    function slicing its rows out of the fused result)}. Siblings with a
+    LIMIT, or ungrouped aggregates (one row even for a platform without
+    data), are left as they are.
+    """
+    groups = {}
+    for spec in specs:
+        platform = (spec["filters"] or {}).get("Platform")
+        if platform is None or isinstance(platform, (list, tuple)) or spec["limit"] is not None:
+            continue
+        if aggregated(spec) and not spec["group_by"]:
+            continue
+        shape = dict(spec, filters={col: value for col, value in spec["filters"].items() if col != "Platform"})
+        groups.setdefault(spec_key(shape), []).append((spec, platform))
+
+    fused_specs, derived = [], {}
+    for siblings in groups.values():
+        if len(siblings) < 2:
+            continue
+        spec, _ = siblings[0]
+        fused = dict(spec, filters=dict(spec["filters"], Platform=sorted(platform for _, platform in siblings)))
+        if aggregated(spec):
+            fused["group_by"] = list(dict.fromkeys(list(spec["group_by"]) + ["Platform"]))
+        else:
+            fused["columns"] = list(dict.fromkeys(list(spec["columns"]) + ["Platform"]))
+        fused_specs.append(fused)
+        for sibling, platform in siblings:
+            derived[spec_key(sibling)] = (spec_key(fused), partial(platform_part, spec=sibling, platform=platform, dialect=dialect))
+    return [spec for spec in specs if spec_key(spec) not in derived] + fused_specs, derived
+
+
+def platform_part(frame, spec, platform, dialect=MYSQL):
+    """The rows of a fused result that answer ``spec``, filtered on one platform.
+
+    Compared as the fused query's IN and GROUP BY did: on MySQL "Tiktok"
+    also selects the rows (and the group label) spelled "TikTok".
+    """
+    part = frame[matching(frame["Platform"], platform, dialect)]
+    return part[result_columns(spec)].reset_index(drop=True)
+
+
+def output_definitions(spec):
+    """{output column: what computes it} of a query_data call, to tell whether two calls can share a SELECT."""
+    if not aggregated(spec):
+        return {col: ("column",) for col in spec["columns"]}
+    outputs = {col: ("column",) for col in spec["group_by"] or []}
+    outputs.update((col, ("aggregate", spec["aggregations"][col])) for col in spec["columns"] if col in (spec["aggregations"] or {}))
+    outputs.update((alias, ("conditional", condition)) for alias, condition in (spec["conditions"] or {}).items())
+    outputs.update((alias, ("ratio", ratio)) for alias, ratio in (spec["ratios"] or {}).items())
+    return outputs
+
+
+def compatible(outputs, other):
+    """True if no output column is defined differently in ``outputs`` and ``other``."""
+    return all(outputs.get(col, definition) == definition for col, definition in other.items())
+
+
+def merged_spec(spec, outputs):
+    """``spec`` widened to select exactly ``outputs``, the combined output definitions of its siblings.
+
+    Only the selected outputs are carried over: an aggregation a sibling
+    declares for a column it doesn't select must not replace another
+    sibling's function for that column.
+    """
+    merged = dict(spec, columns=[col for col, definition in outputs.items() if definition[0] in ("column", "aggregate")])
+    for param, kind in (("aggregations", "aggregate"), ("conditions", "conditional"), ("ratios", "ratio")):
+        merged[param] = {col: definition[1] for col, definition in outputs.items() if definition[0] == kind} or None
+    return merged
+
+
+def merge_sibling_queries(specs):
+    """Widen declared queries over the same rows into one SELECT of all their columns.
+
+    Queries of a table with the same filters, dates, grain (raw rows, or
+    aggregates grouped by the same columns) and ORDER BY differ only in
+    the columns they select, so one query over the union of those columns
+    answers all of them. Queries with HAVING or LIMIT, which change the
+    rows, are left as they are, as are ones that would give an output
+    column two different definitions. Returns ``(specs, derived)`` like
+    fuse_platform_queries, each merged query projected back to its columns.
+    """
+    groups = {}
+    for spec in specs:
+        if spec["having"] or spec["limit"] is not None:
+            continue
+        grain = [spec[param] for param in ("tablename", "filters", "start_date", "end_date", "order_by")]
+        grain += [aggregated(spec), sorted(spec["group_by"] or [])]
+        groups.setdefault(spec_key(grain), []).append(spec)
+
+    merged_specs, derived = [], {}
+    for siblings in groups.values():
+        # Each sibling joins the first merge it doesn't conflict with
+        merges = []  # [(outputs, [spec])]
+        for spec in siblings:
+            outputs = output_definitions(spec)
+            for merged_outputs, members in merges:
+                if compatible(merged_outputs, outputs):
+                    merged_outputs.update(outputs)
+                    members.append(spec)
+                    break
+            else:
+                merges.append((outputs, [spec]))
+        for outputs, members in merges:
+            if len(members) < 2:
+                continue
+            merged_specs.append(merged_spec(members[0], outputs))
+            for spec in members:
+                derived[spec_key(spec)] = (spec_key(merged_specs[-1]), partial(project, columns=result_columns(spec)))
+    return [spec for spec in specs if spec_key(spec) not in derived] + merged_specs, derived
+
+
+def project(frame, columns):
+    """The columns of a merged result one of its queries asked for."""
+    return frame[columns]
+
+
+def plan(specs, dialect=MYSQL):
+    """Queries to run for a batch's declared specs, and how to answer each spec that isn't run itself.
+
+    Per-platform siblings are fused first, then queries over the same rows
+    (fused ones included) are merged. Returns ``(specs, derived)`` with
+    derived = {key: (key of the query answering it, function computing
+    its result from that query's)}.
+    """
+    specs, derived = fuse_platform_queries(specs, dialect)
+    specs, merged = merge_sibling_queries(specs)
+    derived.update(merged)
+    return specs, derived
+
+
+@st.cache_resource
+def get_executor():
+    """Thread pool shared by all sessions; one worker per backend connection."""
+    return ThreadPoolExecutor(max_workers=get_backend().size, thread_name_prefix="query")
+
+
+class QueryBatch:
+    """The set of queries one tab needs for a render, executed concurrently.
+
+    Tabs declare their queries up front; the batch submits them all to the
+    shared thread pool so each runs on its own pooled connection, and the
+    tab's display() then reads the results through ``batch.query_data``.
+    Render latency becomes roughly the slowest query instead of the sum.
+    Before they are submitted, ``plan`` fuses per-platform siblings and
+    merges queries that only select different columns of the same rows,
+    and their results are split back on the way out, so a render scans
+    each set of rows once.
+    """
+
+    def __init__(self, query_fn):
+        self._query_fn = query_fn
+        self._futures = {}
+        self._specs = {}
+        self._derived = {}  # key of a planned-away spec -> (key of the query answering it, derive function)
+        self._lock = threading.Lock()
+        # Worker threads need the session's context to use st.cache_data
+        self._ctx = get_script_run_ctx()
+
+    def _run(self, spec):
+        add_script_run_ctx(threading.current_thread(), self._ctx)
+        with owned_by(self):
+            return self._query_fn(**spec)
+
+    def submit(self, specs):
+        """Start every declared query that is not already running."""
+        executor = get_executor()
+        specs = [as_spec(**spec) for spec in specs]
+        with self._lock:
+            specs = [spec for spec in specs if spec_key(spec) not in self._futures and spec_key(spec) not in self._derived]
+            specs, derived = plan(specs, get_backend().dialect)
+            self._derived.update(derived)
+            for spec in specs:
+                key = spec_key(spec)
+                if key not in self._futures:
+                    self._specs[key] = spec
+                    self._futures[key] = executor.submit(self._run, spec)
+
+    def wait(self, on_tick=None, interval=0.25):
+        """Block until every submitted query has finished (successfully or not).
+
+        ``on_tick`` is called every ``interval`` seconds while waiting. When
+        it makes a Streamlit call, a superseded rerun (the user picked another
+        tab or filter) is interrupted here, and the batch's queries are
+        cancelled instead of running on to completion.
+        """
+        try:
+            pending = list(self._futures.values())
+            while pending:
+                _, pending = wait(pending, timeout=interval)
+                if pending and on_tick is not None:
+                    on_tick()
+        except BaseException:
+            self.cancel()
+            raise
+
+    def cancel(self):
+        """Drop queries not started yet and KILL running ones no other session is waiting for."""
+        for future in self._futures.values():
+            future.cancel()
+        get_governor().abandon(get_tracker().release(self))
+
+    def queued(self):
+        """Number of this batch's queries waiting for a database slot."""
+        return get_governor().queued(self)
+
+    def engines(self):
+        """Table, engine, table read and row count of each finished declared query, for debug output."""
+        rows = []
+        for key, future in self._futures.items():
+            if not future.done() or future.cancelled() or future.exception() is not None:
+                continue
+            frame = future.result()
+            rows.append({
+                "table": self._specs[key]["tablename"],
+                "engine": frame.attrs.get("engine", "unknown"),
+                "read from": frame.attrs.get("table", "unknown"),
+                "rows": len(frame),
+            })
+        return rows
+
+    def query_data(self, *args, **kwargs):
+        """Drop-in replacement for query_data that serves declared results.
+
+        Queries a tab did not declare still work; they just run inline.
+        Errors raised by a declared query surface here, in the caller.
+        """
+        spec = as_spec(*args, **kwargs)
+        key = spec_key(spec)
+        if key not in self._futures and key not in self._derived:
+            return self._query_fn(**spec)
+        # Shallow copy so a tab adding columns doesn't alter the shared result
+        return self._result(key).copy(deep=False)
+
+    def _result(self, key):
+        if key in self._derived:
+            source, derive = self._derived[key]
+            return derive(self._result(source))
+        return self._futures[key].result()
@@ -0,0 +1,353 @@
+import functools
+import inspect
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from db.batch import spec_key
+from db.cancel import current_owner, get_tracker, in_flight
+from db.diskcache import DEFAULT_DIRECTORY as DISK_DIRECTORY, DEFAULT_MAX_MB as DISK_MAX_MB, DiskCache
+from db.schema import get_catalog
+from db.singleflight import get_single_flight
+from db.spec import normalize_filter
+
+DEFAULT_MAX_MB = 512
+DEFAULT_TTL = 60 * 60  # seconds
+DEFAULT_STALE_TTL = 24 * 60 * 60  # how long an expired result may still be served
+REFRESH_RETRY = 60  # seconds before retrying a failed background refresh
+REFRESH_WORKERS = 4
+
+MISS = object()
+
+logger = logging.getLogger(__name__)
+
+
+def size_of(value):
+    """Approximate memory footprint of a cached result in bytes."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True, index=True).sum())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def copy_of(value):
+    """Copy handed to callers so tabs can't mutate the cached frame."""
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, list):
+        return list(value)
+    return value
+
+
+class CacheEntry:
+    __slots__ = ("value", "size", "table", "campaign", "expires_at", "stale_until", "pinned")
+
+    def __init__(self, value, size, table, campaign, expires_at, stale_until, pinned):
+        self.value = value
+        self.size = size
+        self.table = table
+        self.campaign = campaign
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+        self.pinned = pinned
+
+
+class ResultCache:
+    """Process-wide query result cache bounded by memory, with TTL and LRU eviction.
+
+    Every entry is sized with ``memory_usage(deep=True)``; once the total goes
+    over ``max_bytes`` the least recently used entries are evicted first.
+    Entries for pinned (high-priority) campaigns are never evicted for space,
+    only when they expire. TTLs can be set per report table.
+
+    An expired entry is kept for a further ``stale_ttl`` seconds so it can be
+    served while a background refresh replaces it (stale-while-revalidate).
+    """
+
+    def __init__(self, max_bytes, default_ttl=DEFAULT_TTL, table_ttls=None, pinned_campaigns=(), stale_ttl=DEFAULT_STALE_TTL):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.table_ttls = dict(table_ttls or {})
+        self.pinned_campaigns = set(pinned_campaigns)
+        self.stale_ttl = stale_ttl
+        self.watched_tables = set()
+        self.watched_max_age = None
+        self.disk = None  # optional DiskCache shared with other worker processes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = {}  # key -> Future of the background refresh
+        self._refresher = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="cache-refresh")
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def watch(self, tables, max_age=None):
+        """Hand freshness of these tables' entries over to watermark invalidation.
+
+        Their entries then live for ``max_age`` seconds (forever if None)
+        instead of the table TTL, since they are dropped as soon as the
+        underlying data changes.
+        """
+        self.watched_tables = set(tables)
+        self.watched_max_age = max_age
+
+    def ttl_for(self, table):
+        if table in self.watched_tables:
+            return float("inf") if self.watched_max_age is None else self.watched_max_age
+        return self.table_ttls.get(table, self.default_ttl)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry.size
+
+    def get(self, key):
+        """Return ``(value, stale)`` for ``key``; value is MISS if absent or too old to serve."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.stale_until <= now:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return MISS, False
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value, entry.expires_at <= now
+
+    def put(self, key, value, table=None, campaign=None, age=0, persist=True):
+        """Store a value; ``age`` is how old it already is (for values read back from disk)."""
+        if persist and self.disk is not None:
+            try:
+                self.disk.put(key, value, table=table, campaign=campaign)
+            except Exception:
+                # e.g. a full disk, or a frame pyarrow can't serialize; the memory tier still has it
+                logger.exception("Could not write cached result to disk")
+        size = size_of(value)
+        pinned = campaign in self.pinned_campaigns
+        if size > self.max_bytes and not pinned:
+            return
+        expires_at = time.monotonic() + self.ttl_for(table) - age
+        entry = CacheEntry(value, size, table, campaign, expires_at, expires_at + self.stale_ttl, pinned)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.total_bytes += size
+            self._evict()
+
+    def _evict(self):
+        # Oldest first; pinned entries are skipped, so the budget can be
+        # exceeded if pinned campaigns alone don't fit in it.
+        for key in list(self._entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if not self._entries[key].pinned:
+                self._remove(key)
+                self.evictions += 1
+
+    def load_from_disk(self, key, table=None, campaign=None):
+        """Promote an entry from the disk cache into memory; returns ``(value, stale)`` like get()."""
+        if self.disk is None:
+            return MISS, False
+        value, age = self.disk.get(key, table=table, campaign=campaign)
+        ttl = self.ttl_for(table)
+        if value is None or age > ttl + self.stale_ttl:
+            return MISS, False
+        self.put(key, value, table=table, campaign=campaign, age=age, persist=False)
+        return value, age > ttl
+
+    def peek(self, key, table=None, campaign=None):
+        """Fresh value for ``key`` from memory or disk, or MISS; never calls a loader."""
+        value, stale = self.get(key)
+        if value is MISS:
+            value, stale = self.load_from_disk(key, table=table, campaign=campaign)
+        return MISS if stale else value
+
+    def refresh(self, key, loader, table=None, campaign=None):
+        """Re-run ``loader`` in the background and store its result under ``key``.
+
+        Only one refresh per key runs at a time; returns its Future.
+        """
+        with self._lock:
+            future = self._refreshing.get(key)
+            if future is not None:
+                return future
+            future = self._refresher.submit(self._run_refresh, key, loader, table, campaign)
+            self._refreshing[key] = future
+            return future
+
+    def _run_refresh(self, key, loader, table, campaign):
+        try:
+            self.put(key, loader(), table=table, campaign=campaign)
+        except Exception:
+            # Keep serving the old value, but don't retry on every request
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.expires_at = time.monotonic() + REFRESH_RETRY
+            raise
+        finally:
+            with self._lock:
+                self._refreshing.pop(key, None)
+
+    def find(self, predicate):
+        """First fresh ``(key, value)`` whose key satisfies ``predicate``, or None."""
+        now = time.monotonic()
+        with self._lock:
+            for key, entry in reversed(self._entries.items()):
+                if entry.expires_at > now and predicate(key):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return key, entry.value
+        return None
+
+    def invalidate(self, table=None, campaign=None):
+        """Drop entries for a table and/or campaign (everything if both are None)."""
+        if self.disk is not None:
+            self.disk.invalidate(table=table, campaign=campaign)
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if table is not None and entry.table != table:
+                    continue
+                if campaign is not None and entry.campaign not in (campaign, None):
+                    continue
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "refreshing": len(self._refreshing),
+            }
+
+
+@st.cache_resource
+def get_cache():
+    """Result cache shared by all sessions, configured from the optional [cache] secrets section."""
+    settings = st.secrets.get("cache", {})
+    cache = ResultCache(
+        max_bytes=int(settings.get("max_mb", DEFAULT_MAX_MB) * 1024 * 1024),
+        default_ttl=settings.get("ttl", DEFAULT_TTL),
+        table_ttls=settings.get("table_ttls", {}),
+        pinned_campaigns=settings.get("pinned_campaigns", []),
+        stale_ttl=settings.get("stale_ttl", DEFAULT_STALE_TTL),
+    )
+    # Shared with the other worker processes on this host; disk_dir = "" turns it off
+    disk_dir = settings.get("disk_dir", DISK_DIRECTORY)
+    if disk_dir:
+        cache.disk = DiskCache(
+            disk_dir,
+            max_bytes=int(settings.get("disk_max_mb", DISK_MAX_MB) * 1024 * 1024),
+            schema_version=get_catalog().version,
+        )
+    return cache
+
+
+# Background refreshes started on behalf of each browser session, so the
+# page can show that it is displaying stale data until they finish.
+_session_refreshes = defaultdict(set)
+_session_lock = threading.Lock()
+
+
+def _note_refresh(future):
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        return
+    with _session_lock:
+        _session_refreshes[ctx.session_id].add(future)
+
+
+def pending_refreshes():
+    """Background refreshes started by the current session, forgetting finished ones."""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        return []
+    with _session_lock:
+        futures = _session_refreshes.pop(ctx.session_id, set())
+        pending = [future for future in futures if not future.done()]
+        if pending:
+            _session_refreshes[ctx.session_id].update(pending)
+    return list(futures)
+
+
+def _load_and_store(cache, key, loader, table, campaign):
+    # A flight for this key may have finished between our miss and now
+    value, stale = cache.get(key)
+    if value is not MISS and not stale:
+        return value
+    # Another worker process (or this one before a restart) may have it
+    value, stale = cache.load_from_disk(key, table=table, campaign=campaign)
+    if value is not MISS:
+        if stale:
+            _note_refresh(cache.refresh(key, loader, table=table, campaign=campaign))
+        return value
+    with in_flight(key):
+        value = loader()
+    cache.put(key, value, table=table, campaign=campaign)
+    return value
+
+
+def fetch_cached(key, loader, table=None, campaign=None):
+    """Value for ``key`` from the shared cache, calling ``loader`` on a miss.
+
+    Expired values are returned immediately while a background refresh
+    fetches the new ones, and concurrent misses are coalesced. The
+    returned value is the cached object itself.
+    """
+    cache = get_cache()
+    value, stale = cache.get(key)
+    if value is MISS:
+        # Concurrent misses for the same key (e.g. a dozen sessions opening
+        # the same campaign at once) share a single execution, which is only
+        # cancelled once every caller waiting for it has been superseded.
+        with get_tracker().interest(key, current_owner()):
+            value = get_single_flight().do(key, lambda: _load_and_store(cache, key, loader, table, campaign))
+    elif stale:
+        _note_refresh(cache.refresh(key, loader, table=table, campaign=campaign))
+    return value
+
+
+def cached(func):
+    """Cache a data-layer function's results in the shared ResultCache.
+
+    The function's ``tablename`` and ``filters["Campaign_code"]`` arguments
+    tag each entry for per-table TTLs, campaign pinning and invalidation.
+    Filter values are normalized first, so a list in any order shares an
+    entry and a one-item list counts as that campaign. Expired results are
+    returned immediately while a background refresh fetches the new ones.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        params = dict(bound.arguments)
+        filters = {col: normalize_filter(value) for col, value in (params.get("filters") or {}).items()}
+        if "filters" in params:
+            params["filters"] = dict(sorted(filters.items()))
+        key = (func.__qualname__, spec_key(params))
+
+        table = params.get("tablename")
+        campaign = filters.get("Campaign_code")
+        if isinstance(campaign, tuple):
+            # Depends on several campaigns, so it is tagged like an unfiltered entry
+            campaign = None
+
+        return copy_of(fetch_cached(key, lambda: func(*args, **kwargs), table=table, campaign=campaign))
+
+    return wrapper
@@ -0,0 +1,114 @@
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+import streamlit as st
+
+from db.backend import get_backend
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+@contextmanager
+def owned_by(owner):
+    """Mark queries issued by this thread in the block as wanted by ``owner`` (e.g. a QueryBatch)."""
+    previous = getattr(_local, "owner", None)
+    _local.owner = owner
+    try:
+        yield
+    finally:
+        _local.owner = previous
+
+
+def current_owner():
+    """Owner of queries issued by this thread; None means nobody can cancel them."""
+    return getattr(_local, "owner", None)
+
+
+@contextmanager
+def in_flight(key):
+    """Mark the block as executing the single-flight call for ``key``."""
+    previous = getattr(_local, "flight_key", None)
+    _local.flight_key = key
+    try:
+        yield
+    finally:
+        _local.flight_key = previous
+
+
+def current_flight():
+    return getattr(_local, "flight_key", None)
+
+
+class QueryTracker:
+    """Which queries are running on which database connection, and who still wants them.
+
+    Several callers can wait on one query (see SingleFlight), so a query is
+    only killed once every owner that asked for it has given up on it, and
+    never while a caller that can't be cancelled (owner None) is waiting.
+    """
+
+    def __init__(self, kill):
+        self._kill = kill
+        self._owners = defaultdict(set)  # flight key -> owners waiting for it
+        self._connections = {}  # flight key -> backend handle to cancel it with
+        self._lock = threading.Lock()
+        self.killed = 0
+
+    @contextmanager
+    def interest(self, key, owner):
+        with self._lock:
+            self._owners[key].add(owner)
+        try:
+            yield
+        finally:
+            with self._lock:
+                owners = self._owners.get(key)
+                if owners is not None:
+                    owners.discard(owner)
+                    if not owners:
+                        del self._owners[key]
+
+    @contextmanager
+    def running(self, key, handle):
+        with self._lock:
+            self._connections[key] = handle
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._connections.pop(key, None)
+
+    def release(self, owner):
+        """``owner`` no longer wants its results; kill queries nobody else is waiting for.
+
+        Returns the keys that were abandoned, running or not.
+        """
+        abandoned, to_kill = [], []
+        with self._lock:
+            for key, owners in list(self._owners.items()):
+                if owner not in owners:
+                    continue
+                owners.discard(owner)
+                if not owners:
+                    del self._owners[key]
+                    abandoned.append(key)
+                    if key in self._connections:
+                        to_kill.append(self._connections[key])
+        for handle in to_kill:
+            try:
+                self._kill(handle)
+                self.killed += 1
+            except Exception:
+                # The query may simply have finished in the meantime
+                logger.warning("Could not cancel query %r", handle, exc_info=True)
+        return abandoned
+
+
+@st.cache_resource
+def get_tracker():
+    """Query tracker shared by every session of the server process."""
+    return QueryTracker(kill=get_backend().cancel)
@@ -0,0 +1,100 @@
+import threading
+import time
+
+import duckdb
+import streamlit as st
+
+from db.snapshot import DEFAULT_DIRECTORY, SnapshotStore, combine, same_fingerprint
+from db.watermark import start_watermark_monitor
+
+DEFAULT_MAX_AGE = 26 * 60 * 60  # seconds; the report tables are loaded daily
+ENGINE_NAME = "duckdb-snapshot"
+
+
+class ColumnarEngine:
+    """Runs query specs with in-process DuckDB over the local Parquet snapshot.
+
+    A spec is only answered locally when its table has been synced
+    recently, the campaign it filters on is in the snapshot, and (when the
+    watermark monitor has probed MySQL) the campaign's fingerprint there
+    still matches the snapshot. Otherwise ``unavailable`` says why and the
+    caller falls back to the database backend.
+    """
+
+    def __init__(self, store, max_age=DEFAULT_MAX_AGE, watermarks=None):
+        self.store = store
+        self.max_age = max_age
+        self.watermarks = watermarks  # WatermarkMonitor, if one is running
+        self._db = duckdb.connect()
+        self._lock = threading.Lock()
+        self._states = {}  # table -> (state file mtime, state)
+
+    def _state(self, table):
+        # Reloaded only when the sync job has rewritten it
+        try:
+            mtime = self.store.state_mtime(table)
+        except FileNotFoundError:
+            return None
+        cached = self._states.get(table)
+        if cached is None or cached[0] != mtime:
+            cached = self._states[table] = (mtime, self.store.load_state(table))
+        return cached[1]
+
+    def unavailable(self, spec):
+        """Why ``spec`` can't be answered from the snapshot, or None if it can."""
+        state = self._state(spec.table)
+        if state is None or not state["partitions"]:
+            return "table not synced"
+        if time.time() - (state["synced_at"] or 0) > self.max_age:
+            return "snapshot too old"
+        for campaign in spec.campaigns or ():
+            months = state["partitions"].get(str(campaign))
+            if months is None:
+                return "campaign not synced"
+            if self._changed_since_sync(spec.table, campaign, months):
+                return "campaign changed since sync"
+        return None
+
+    def _changed_since_sync(self, table, campaign, months):
+        if self.watermarks is None:
+            return False
+        probed = self.watermarks.watermarks.get(table, {}).get(campaign)
+        if probed is None:
+            return False
+        local = None
+        for fingerprint in months.values():
+            local = combine(local, fingerprint)
+        max_date, rows, total = probed
+        total = 0.0 if total in (None, "None") else float(total)
+        return not same_fingerprint(local, [max_date, int(rows), total])
+
+    def source(self, spec):
+        """FROM expression reading the snapshot files that can hold the spec's rows."""
+        if spec.campaigns is None:
+            files = self.store.files(spec.table, None, spec.start_date, spec.end_date)
+        else:
+            files = [
+                path for campaign in spec.campaigns
+                for path in self.store.files(spec.table, campaign, spec.start_date, spec.end_date)
+            ]
+        if not files:
+            return None
+        paths = ", ".join("'" + path.replace("'", "''") + "'" for path in files)
+        return f"read_parquet([{paths}], union_by_name = true)"
+
+    def cursor(self):
+        with self._lock:
+            return self._db.cursor()
+
+
+@st.cache_resource
+def get_columnar_engine():
+    """Snapshot engine if ``[snapshot] engine = true``, else None."""
+    settings = st.secrets.get("snapshot", {})
+    if not settings.get("engine", False):
+        return None
+    return ColumnarEngine(
+        SnapshotStore(settings.get("dir", DEFAULT_DIRECTORY)),
+        max_age=settings.get("max_age", DEFAULT_MAX_AGE),
+        watermarks=start_watermark_monitor(),
+    )
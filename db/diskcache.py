@@ -0,0 +1,186 @@
+import argparse
+import hashlib
+import io
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from urllib.parse import quote
+
+import pandas as pd
+import streamlit as st
+
+DEFAULT_DIRECTORY = "result_cache"
+DEFAULT_MAX_MB = 2048
+SCAN_INTERVAL = 30  # seconds between directory scans for eviction
+ALL_CAMPAIGNS = "_all"  # directory for entries not tied to one campaign
+
+
+class DiskCache:
+    """Result store on local disk shared by every worker process on the host.
+
+    Entries live under ``<directory>/<table>/<campaign>/<hash>`` where the
+    hash covers the cache key and the schema version, so a schema change
+    never serves frames with stale columns. DataFrames are written as
+    zstd-compressed Parquet, anything else as a compressed pickle. Writes
+    go through a temporary file and ``os.replace`` so readers in other
+    processes never see partial files. Once the directory grows past
+    ``max_bytes`` the least recently read files are removed.
+    """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=DEFAULT_MAX_MB * 1024 * 1024, schema_version=""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.schema_version = schema_version
+        self._lock = threading.Lock()
+        self._last_scan = 0.0
+        self._written_since_scan = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _group_dir(self, table, campaign):
+        return os.path.join(
+            self.directory,
+            quote(str(table or "_none"), safe=""),
+            ALL_CAMPAIGNS if campaign is None else quote(str(campaign), safe=""),
+        )
+
+    def _path(self, key, table, campaign):
+        digest = hashlib.sha256(repr((key, self.schema_version)).encode()).hexdigest()
+        return os.path.join(self._group_dir(table, campaign), digest)
+
+    def get(self, key, table=None, campaign=None):
+        """Return ``(value, age_in_seconds)``, or ``(None, None)`` if not stored."""
+        path = self._path(key, table, campaign)
+        try:
+            with open(path, "rb") as f:
+                payload = f.read()
+            written_at = os.stat(path).st_mtime
+            # Record the read for LRU eviction without touching the write time
+            os.utime(path, (time.time(), written_at))
+        except FileNotFoundError:
+            return None, None
+        try:
+            return _decode(payload), time.time() - written_at
+        except Exception:
+            # Corrupt or from an incompatible library version; drop it
+            _remove(path)
+            return None, None
+
+    def put(self, key, value, table=None, campaign=None):
+        path = self._path(key, table, campaign)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = _encode(value)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except BaseException:
+            _remove(tmp_path)
+            raise
+        with self._lock:
+            self._written_since_scan += len(payload)
+        self._maybe_evict()
+
+    def invalidate(self, table=None, campaign=None):
+        """Remove stored entries for a table and/or campaign (everything if both are None)."""
+        if table is None and campaign is None:
+            self.purge()
+            return
+        tables = [quote(str(table), safe="")] if table is not None else _listdir(self.directory)
+        for table_dir in tables:
+            table_path = os.path.join(self.directory, table_dir)
+            if campaign is None:
+                shutil.rmtree(table_path, ignore_errors=True)
+            else:
+                # Cross-campaign entries depend on every campaign's data
+                for campaign_dir in (quote(str(campaign), safe=""), ALL_CAMPAIGNS):
+                    shutil.rmtree(os.path.join(table_path, campaign_dir), ignore_errors=True)
+
+    def purge(self):
+        """Remove every stored entry."""
+        for name in _listdir(self.directory):
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            if root == self.directory:
+                # Bookkeeping files (e.g. watermarks) live at the top level
+                continue
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat
+
+    def total_bytes(self):
+        return sum(stat.st_size for _, stat in self._files())
+
+    def _maybe_evict(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_scan < SCAN_INTERVAL and self._written_since_scan < self.max_bytes // 10:
+                return
+            self._last_scan = now
+            self._written_since_scan = 0
+        files = sorted(self._files(), key=lambda item: item[1].st_atime)
+        total = sum(stat.st_size for _, stat in files)
+        for path, stat in files:
+            if total <= self.max_bytes:
+                break
+            _remove(path)
+            total -= stat.st_size
+
+
+def _encode(value):
+    if isinstance(value, pd.DataFrame):
+        buffer = io.BytesIO()
+        value.to_parquet(buffer, compression="zstd")
+        return b"P" + buffer.getvalue()
+    return b"Z" + zlib.compress(pickle.dumps(value))
+
+
+def _decode(payload):
+    if payload[:1] == b"P":
+        return pd.read_parquet(io.BytesIO(payload[1:]))
+    return pickle.loads(zlib.decompress(payload[1:]))
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _listdir(directory):
+    try:
+        return os.listdir(directory)
+    except FileNotFoundError:
+        return []
+
+
+def main():
+    """Admin entry point: ``python -m db.diskcache purge|size [--table T] [--campaign C]``."""
+    parser = argparse.ArgumentParser(description="Manage the shared on-disk query result cache.")
+    parser.add_argument("command", choices=["purge", "size"])
+    parser.add_argument("--table")
+    parser.add_argument("--campaign")
+    args = parser.parse_args()
+
+    settings = st.secrets.get("cache", {})
+    disk = DiskCache(settings.get("disk_dir", DEFAULT_DIRECTORY))
+    if args.command == "size":
+        print(f"{disk.total_bytes() / 1024 / 1024:.1f} MB in {disk.directory}")
+    else:
+        disk.invalidate(table=args.table, campaign=args.campaign)
+        print(f"Purged {args.table or 'all tables'} / {args.campaign or 'all campaigns'} from {disk.directory}")
+
+
+if __name__ == "__main__":
+    main()
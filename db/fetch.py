@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+from mysql.connector.constants import FieldType
+
+DEFAULT_BATCH_SIZE = 10_000  # rows pulled from the cursor per fetchmany() call
+INITIAL_CAPACITY = 1_024
+
+INTEGER_TYPES = {
+    FieldType.TINY, FieldType.SHORT, FieldType.LONG,
+    FieldType.LONGLONG, FieldType.INT24, FieldType.YEAR,
+}
+FLOAT_TYPES = {
+    FieldType.FLOAT, FieldType.DOUBLE, FieldType.DECIMAL, FieldType.NEWDECIMAL,
+}
+
+
+def _column_dtype(type_code):
+    """NumPy dtype used to accumulate a result column of the given MySQL type."""
+    if type_code in INTEGER_TYPES:
+        return np.dtype("int64")
+    if type_code in FLOAT_TYPES:
+        return np.dtype("float64")
+    return np.dtype(object)
+
+
+def _accumulator_dtype(type_code, target=None):
+    """Array dtype to collect a column in, given its catalog target dtype (if any)."""
+    if target in ("int64", "float64"):
+        return np.dtype(target)
+    if target is not None:
+        # datetime64 and category are converted from objects at the end
+        return np.dtype(object)
+    return _column_dtype(type_code)
+
+
+def _finish(array, target):
+    """Convert a collected column to its target dtype."""
+    if target is None or target == array.dtype:
+        return array
+    if target.startswith("datetime64"):
+        return pd.to_datetime(array, errors="coerce")
+    if target == "category":
+        return pd.Categorical(array)
+    return array
+
+
+def _store(array, offset, rows, index):
+    """Write column ``index`` of a batch of rows into ``array[offset:]``.
+
+    Returns the array, which is a new float64 one if an integer column
+    turned out to contain NULLs.
+    """
+    end = offset + len(rows)
+    try:
+        array[offset:end] = np.fromiter((row[index] for row in rows), dtype=array.dtype, count=len(rows))
+    except (TypeError, ValueError):
+        # NULLs can't go into a numeric array; ints widen to float64 so
+        # that NULL can be stored as NaN.
+        if array.dtype.kind == "i":
+            array = array.astype("float64")
+        array[offset:end] = [np.nan if row[index] is None else row[index] for row in rows]
+    return array
+
+
+def fetch_frame(cursor, columns, dtypes=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Stream an executed cursor's result into a DataFrame, column by column.
+
+    Rows are read in ``fetchmany`` batches and copied straight into typed
+    per-column arrays, so only one batch of Python tuples is alive at a
+    time instead of the whole result as a list of tuples plus the frame.
+    Arrays grow geometrically (or are sized exactly when the cursor is
+    buffered and knows its row count) and are trimmed in place at the end.
+
+    ``dtypes`` maps column names to target dtypes (see SchemaCatalog);
+    columns without one are typed from the cursor description.
+    """
+    dtypes = dtypes or {}
+    targets = [dtypes.get(col) for col in columns]
+    capacity = cursor.rowcount if cursor.rowcount and cursor.rowcount > 0 else INITIAL_CAPACITY
+    arrays = [
+        np.empty(capacity, dtype=_accumulator_dtype(description[1], target))
+        for description, target in zip(cursor.description, targets)
+    ]
+    size = 0
+
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        needed = size + len(rows)
+        if needed > capacity:
+            capacity = max(needed, capacity * 2)
+            for array in arrays:
+                array.resize(capacity, refcheck=False)
+        for i in range(len(arrays)):
+            arrays[i] = _store(arrays[i], size, rows, i)
+        size = needed
+        del rows
+
+    for array in arrays:
+        array.resize(size, refcheck=False)
+    arrays = [_finish(array, target) for array, target in zip(arrays, targets)]
+    # copy=False keeps each column in its own array rather than
+    # consolidating them, which would briefly double the memory again
+    return pd.DataFrame(dict(zip(columns, arrays)), copy=False)
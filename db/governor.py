@@ -0,0 +1,131 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+
+from db.cancel import current_flight, current_owner
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENT = 4
+SLOW_WAIT = 5  # seconds in the queue before a wait is logged
+
+# Lower runs first
+PRIORITY_SIDEBAR = 0
+PRIORITY_KPI = 1
+PRIORITY_GRID = 2
+
+
+class QueryCancelled(Exception):
+    """A queued query was abandoned by everyone waiting for it before it got a slot."""
+
+
+class _Waiter:
+    __slots__ = ("owner", "key", "granted", "cancelled")
+
+    def __init__(self, owner, key):
+        self.owner = owner
+        self.key = key
+        self.granted = False
+        self.cancelled = False
+
+
+class QueryGovernor:
+    """Caps how many dashboard queries run against MySQL at once.
+
+    The reporting database is shared with other jobs, so a burst of tab
+    loads must not turn into a burst of heavy GROUP BYs. Queries beyond
+    ``max_concurrent`` wait in a priority queue: sidebar lookups first,
+    then KPI totals, then grid queries; equal priorities run in arrival order.
+    """
+
+    def __init__(self, max_concurrent=DEFAULT_MAX_CONCURRENT):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self._running = 0
+        self._queue = []  # heap of (priority, sequence, waiter)
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        # Counters
+        self.admitted = 0
+        self.queued_total = 0
+        self.max_depth = 0
+        self.wait_seconds = 0.0
+        self.max_wait = 0.0
+
+    def _grant_next(self):
+        # Caller holds self._cond
+        while self._queue and self._running < self.max_concurrent:
+            _, _, waiter = heapq.heappop(self._queue)
+            if waiter.cancelled:
+                continue
+            waiter.granted = True
+            self._running += 1
+        self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority=PRIORITY_GRID):
+        """Hold one of the concurrent query slots for the duration of the block."""
+        waiter = _Waiter(current_owner(), current_flight())
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._queue, (priority, next(self._sequence), waiter))
+            self._grant_next()
+            if not waiter.granted:
+                self.queued_total += 1
+                self.max_depth = max(self.max_depth, len(self._queue))
+            while not waiter.granted and not waiter.cancelled:
+                self._cond.wait()
+            if not waiter.granted:
+                raise QueryCancelled("Query was cancelled while queued")
+            waited = time.monotonic() - started
+            self.admitted += 1
+            self.wait_seconds += waited
+            self.max_wait = max(self.max_wait, waited)
+        if waited > SLOW_WAIT:
+            logger.info("Query waited %.1fs for a database slot (priority %s)", waited, priority)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running -= 1
+                self._grant_next()
+
+    def abandon(self, keys):
+        """Drop queued queries for single-flight keys nobody is waiting for any more."""
+        keys = set(keys)
+        if not keys:
+            return
+        with self._cond:
+            for _, _, waiter in self._queue:
+                if waiter.key in keys:
+                    waiter.cancelled = True
+            self._cond.notify_all()
+
+    def queued(self, owner):
+        """Number of queries issued by ``owner`` that are waiting for a slot."""
+        with self._cond:
+            return sum(1 for _, _, w in self._queue if w.owner is owner and not w.cancelled)
+
+    def stats(self):
+        with self._cond:
+            depth = sum(1 for _, _, w in self._queue if not w.cancelled)
+            return {
+                "running": self._running,
+                "queue_depth": depth,
+                "max_queue_depth": self.max_depth,
+                "admitted": self.admitted,
+                "queued_total": self.queued_total,
+                "avg_wait_seconds": self.wait_seconds / self.admitted if self.admitted else 0.0,
+                "max_wait_seconds": self.max_wait,
+            }
+
+
+@st.cache_resource
+def get_governor():
+    """Governor shared by every session of the server process ([mysql] max_concurrent_queries)."""
+    settings = st.secrets.get("mysql", {})
+    return QueryGovernor(settings.get("max_concurrent_queries", DEFAULT_MAX_CONCURRENT))
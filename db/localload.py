@@ -0,0 +1,190 @@
+import argparse
+from datetime import date, timedelta
+
+import duckdb
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from db.backend import DEFAULT_LOCAL_PATH, DUCKDB, MYSQL
+from db.pool import get_pool
+from db.sql import build_where_clause
+
+COPY_BATCH_SIZE = 50_000
+
+# information_schema DATA_TYPE -> DuckDB column type
+MYSQL_TO_DUCKDB = {
+    "tinyint": "BIGINT", "smallint": "BIGINT", "mediumint": "BIGINT", "int": "BIGINT",
+    "bigint": "BIGINT", "year": "BIGINT", "bit": "BIGINT",
+    "decimal": "DOUBLE", "float": "DOUBLE", "double": "DOUBLE",
+    "date": "DATE", "datetime": "TIMESTAMP", "timestamp": "TIMESTAMP",
+}
+
+# Columns of the report tables the dashboard reads, for synthetic databases.
+# Plan dates are text in MySQL, so they are text here as well.
+_KEYS = [("Brand", "VARCHAR"), ("Campaign_code", "VARCHAR"), ("Platform", "VARCHAR"), ("report_date", "DATE")]
+_OVERALL = _KEYS + [
+    ("Funnel", "VARCHAR"), ("Region", "VARCHAR"), ("Format", "VARCHAR"), ("Audience", "VARCHAR"),
+    ("Buying_Type", "VARCHAR"), ("KPI_Metric", "VARCHAR"), ("Plan_Start_Date", "VARCHAR"), ("Plan_End_Date", "VARCHAR"),
+    ("net_media_cost", "DOUBLE"), ("Cost", "DOUBLE"), ("plan_active_day", "BIGINT"), ("active_day", "BIGINT"),
+    ("KPI", "DOUBLE"), ("KPI_actual", "DOUBLE"), ("Impression", "BIGINT"), ("Engagements", "BIGINT"),
+    ("Clicks", "BIGINT"), ("Views", "BIGINT"), ("reach", "BIGINT"), ("23s_Video_Views", "BIGINT"),
+    ("Video_Plays_100", "BIGINT"), ("impression_plan", "DOUBLE"), ("engagement_plan", "DOUBLE"),
+    ("click_plan", "DOUBLE"), ("views_plan", "DOUBLE"), ("reach_plan", "DOUBLE"),
+    ("ctr_estimate", "DOUBLE"), ("er_estimate", "DOUBLE"),
+    ("sessions", "BIGINT"), ("add_to_carts", "BIGINT"), ("ecommerce_purchases", "BIGINT"),
+]
+REPORT_SCHEMAS = {
+    "report_campaign_overall_total": _OVERALL,
+    "report_campaign_overall_total_notcs": _OVERALL,
+    "report_campaign_creative": _KEYS + [
+        ("Format", "VARCHAR"), ("Creative_Type", "VARCHAR"), ("Creative_Length", "VARCHAR"),
+        ("Content", "VARCHAR"), ("Region", "VARCHAR"), ("Audience", "VARCHAR"),
+        ("Cost", "DOUBLE"), ("Impression", "BIGINT"), ("Clicks", "BIGINT"), ("ctr_bm", "DOUBLE"),
+    ],
+    "report_campaign_region_api2": _KEYS + [
+        ("Region", "VARCHAR"), ("Code", "VARCHAR"),
+        ("Cost", "DOUBLE"), ("Impression", "BIGINT"), ("Clicks", "BIGINT"),
+    ],
+}
+REPORT_TABLES = list(REPORT_SCHEMAS)
+
+# Value pools for synthetic text columns
+SYNTHETIC_VALUES = {
+    "Brand": ["Brand A", "Brand B", "Brand C", "Brand D"],
+    "Platform": ["Facebook", "YouTube", "TikTok", "Google", "Tiktok"],
+    "Region": ["Bangkok", "Central", "North", "Northeast", "South", "East", "West"],
+    "Code": ["TH-10", "TH-13", "TH-50", "TH-40", "TH-90", "TH-20", "TH-70"],
+    "Funnel": ["Awareness", "Consideration", "Conversion"],
+    "Format": ["Video", "Image", "Carousel", "Story"],
+    "Audience": ["Broad", "Lookalike", "Retargeting", "Interest"],
+    "Buying_Type": ["Auction", "Reach & Frequency"],
+    "KPI_Metric": ["Impression", "Views", "Clicks", "Engagements"],
+    "Creative_Type": ["Static", "Motion", "UGC"],
+    "Creative_Length": ["6s", "15s", "30s", "N/A"],
+}
+
+
+def create_tables(con, schemas):
+    """(Re)create the given tables in the local database: {table: [(column, type), ...]}."""
+    for table, columns in schemas.items():
+        definition = ", ".join(f"{DUCKDB.quote(col)} {col_type}" for col, col_type in columns)
+        con.execute(f"CREATE OR REPLACE TABLE {table} ({definition})")
+
+
+def mysql_schemas(cursor, tables):
+    """Column definitions of report tables in MySQL, mapped to DuckDB types, in table order."""
+    cursor.execute(
+        "SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({}) "
+        "ORDER BY TABLE_NAME, ORDINAL_POSITION".format(", ".join(["%s"] * len(tables))),
+        tuple(tables),
+    )
+    schemas = {}
+    for row in cursor.fetchall():
+        table, column, data_type = (v.decode() if isinstance(v, (bytes, bytearray)) else v for v in row)
+        schemas.setdefault(table, []).append((column, MYSQL_TO_DUCKDB.get(data_type.lower(), "VARCHAR")))
+    return schemas
+
+
+def _typed_frame(rows, columns):
+    """DataFrame of a batch of MySQL rows, converted to types DuckDB can append directly."""
+    frame = pd.DataFrame.from_records(rows, columns=[col for col, _ in columns])
+    for col, col_type in columns:
+        if col_type == "BIGINT":
+            frame[col] = pd.array(frame[col], dtype="Int64")
+        elif col_type == "DOUBLE":
+            frame[col] = pd.to_numeric(frame[col], errors="coerce").astype("float64")
+        elif col_type in ("DATE", "TIMESTAMP"):
+            frame[col] = pd.to_datetime(frame[col], errors="coerce")
+        else:
+            frame[col] = frame[col].astype(object)
+    return frame
+
+
+def copy_from_mysql(con, cursor, tables=REPORT_TABLES, filters=None, start_date=None, end_date=None):
+    """Copy report tables (optionally only some campaigns/dates) from MySQL into the local database."""
+    schemas = mysql_schemas(cursor, tables)
+    create_tables(con, schemas)
+    counts = {}
+    for table, columns in schemas.items():
+        where_clause, values = build_where_clause(filters or {}, start_date, end_date, MYSQL)
+        select = ", ".join(MYSQL.quote(col) for col, _ in columns)
+        cursor.execute(f"SELECT {select} FROM {table}{where_clause}", tuple(values))
+        counts[table] = 0
+        while True:
+            rows = cursor.fetchmany(COPY_BATCH_SIZE)
+            if not rows:
+                break
+            con.append(table, _typed_frame(rows, columns))
+            counts[table] += len(rows)
+    return counts
+
+
+def synthetic_frame(columns, rows, campaigns=20, days=180, seed=0):
+    """Random report rows with the given columns, spread over campaigns and days."""
+    rng = np.random.default_rng(seed)
+    start = date.today() - timedelta(days=days)
+    data = {}
+    for col, col_type in columns:
+        if col == "Campaign_code":
+            data[col] = np.array([f"CMP{n:04d}" for n in range(campaigns)], dtype=object)[rng.integers(0, campaigns, rows)]
+        elif col == "report_date":
+            data[col] = pd.to_datetime(start) + pd.to_timedelta(rng.integers(0, days, rows), unit="D")
+        elif col in ("Plan_Start_Date", "Plan_End_Date"):
+            offset = 0 if col == "Plan_Start_Date" else days
+            data[col] = np.full(rows, (start + timedelta(days=offset)).isoformat(), dtype=object)
+        elif col_type == "VARCHAR":
+            pool = SYNTHETIC_VALUES.get(col, [f"{col} {n}" for n in range(8)])
+            data[col] = np.array(pool, dtype=object)[rng.integers(0, len(pool), rows)]
+        elif col_type == "BIGINT":
+            data[col] = rng.integers(0, 50_000, rows)
+        else:
+            data[col] = rng.gamma(2.0, 500.0, rows).round(2)
+    return pd.DataFrame(data)
+
+
+def load_synthetic(con, rows, campaigns=20, days=180, seed=0, tables=REPORT_TABLES):
+    """Fill the local database with random rows in the report table schemas."""
+    schemas = {table: REPORT_SCHEMAS[table] for table in tables}
+    create_tables(con, schemas)
+    for i, (table, columns) in enumerate(schemas.items()):
+        frame = synthetic_frame(columns, rows, campaigns=campaigns, days=days, seed=seed + i)
+        con.append(table, frame)
+    return {table: rows for table in schemas}
+
+
+def main():
+    """Admin entry point: ``python -m db.localload mysql|synthetic [options]``.
+
+    Run it while the dashboard is stopped; DuckDB allows a single writer.
+    """
+    parser = argparse.ArgumentParser(description="Fill the local DuckDB database with the report tables.")
+    parser.add_argument("source", choices=["mysql", "synthetic"])
+    parser.add_argument("--path", default=st.secrets.get("backend", {}).get("local_path", DEFAULT_LOCAL_PATH))
+    parser.add_argument("--table", action="append", choices=REPORT_TABLES, help="default: all report tables")
+    parser.add_argument("--campaign", help="mysql: copy a single campaign")
+    parser.add_argument("--since", type=date.fromisoformat, help="mysql: copy rows from this report_date on")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="synthetic: rows per table")
+    parser.add_argument("--campaigns", type=int, default=20, help="synthetic: number of campaigns")
+    parser.add_argument("--days", type=int, default=180, help="synthetic: days of report dates")
+    args = parser.parse_args()
+
+    tables = args.table or REPORT_TABLES
+    con = duckdb.connect(args.path)
+    try:
+        if args.source == "mysql":
+            filters = {"Campaign_code": args.campaign} if args.campaign else {}
+            with get_pool().cursor() as cursor:
+                counts = copy_from_mysql(con, cursor, tables, filters, start_date=args.since)
+        else:
+            counts = load_synthetic(con, args.rows, campaigns=args.campaigns, days=args.days, tables=tables)
+    finally:
+        con.close()
+    for table, count in counts.items():
+        print(f"{table}: {count:,} rows")
+    print(f"Loaded into {args.path}")
+
+
+if __name__ == "__main__":
+    main()
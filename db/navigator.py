@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+
+import streamlit as st
+
+from db.backend import get_backend
+from db.rollup import EXTREME_FUNCTIONS, ROLLED_UP_FUNCTIONS, STATE_TABLE, TABLE_EXISTS_QUERIES, get_rollups, has_columns
+from db.snapshot import combine, same_fingerprint
+from db.watermark import start_watermark_monitor
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_TTL = 60 * 60  # seconds before rollup existence and sizes are re-read
+STATE_TTL = 60  # seconds before the rollups' recorded partition fingerprints are re-read
+
+
+def covers(rollup, spec):
+    """Whether ``spec`` can be answered exactly from ``rollup``."""
+    if spec.table != rollup.source or not spec.aggregated or not spec.simple:
+        return False
+    # Rollups leave out rows without a campaign or date, which only these filters exclude too
+    if spec.campaigns is None or not (spec.start_date or spec.end_date):
+        return False
+    dimensions = set(rollup.dimensions)
+    if not set(spec.group_by) <= dimensions or not set(spec.filter_dict) <= dimensions:
+        return False
+    return all(
+        (func in ROLLED_UP_FUNCTIONS and col in rollup.measures) or (func in EXTREME_FUNCTIONS and col in rollup.extremes)
+        for col, func in spec.measures
+    )
+
+
+class AggregateNavigator:
+    """Registry of the rollup tables that exist, smallest first.
+
+    ``route`` picks the smallest rollup that covers a spec, so e.g. a KPI
+    total reads the per-campaign-per-day rollup instead of scanning every
+    raw row of the campaign; specs no rollup covers go to their own table.
+
+    When the watermark monitor runs, a rollup is only used for campaigns
+    whose fingerprint recorded at the rollup's last refresh matches the
+    monitor's latest probe. The monitor invalidates a campaign's cached
+    results as soon as its source rows change, and the re-query must not
+    be answered from a rollup the refresher hasn't caught up on yet (the
+    result would then stay cached until the next change).
+    """
+
+    def __init__(self, rollups, sizes, backend=None, watermarks=None):
+        self.sizes = dict(sizes)  # rollup name -> rows
+        self.rollups = sorted(
+            (r for r in rollups if r.name in self.sizes), key=lambda r: (self.sizes[r.name], len(r.dimensions))
+        )
+        self.routed = {}  # rollup name (or source table) -> queries sent there
+        self.backend = backend
+        self.watermarks = watermarks  # WatermarkMonitor, if one is running
+        self._lock = threading.Lock()
+        self._fingerprints = {}  # rollup name -> {Campaign_code: fingerprint when last refreshed}
+        self._fingerprints_read = None
+
+    @classmethod
+    def load(cls, backend, rollups):
+        """Registry of the rollups that exist in ``backend`` (with all their columns), with their row counts."""
+        sizes = {}
+        with backend.cursor() as cursor:
+            for rollup in rollups:
+                if has_columns(cursor, backend.dialect, rollup):
+                    cursor.execute(f"SELECT COUNT(*) FROM {rollup.name}")
+                    sizes[rollup.name] = cursor.fetchone()[0]
+        return cls(rollups, sizes, backend=backend, watermarks=start_watermark_monitor())
+
+    def recorded_fingerprints(self):
+        """{rollup name: {Campaign_code: fingerprint}} as of each rollup's last refresh, re-read every STATE_TTL."""
+        with self._lock:
+            if self._fingerprints_read is not None and time.monotonic() - self._fingerprints_read < STATE_TTL:
+                return self._fingerprints
+            fingerprints = {}
+            with self.backend.cursor() as cursor:
+                cursor.execute(TABLE_EXISTS_QUERIES[self.backend.dialect.name], (STATE_TABLE,))
+                if cursor.fetchone()[0]:
+                    cursor.execute(f"SELECT rollup_name, Campaign_code, max_date, row_count, total FROM {STATE_TABLE}")
+                    for name, campaign, max_date, rows, total in cursor.fetchall():
+                        campaigns = fingerprints.setdefault(name, {})
+                        campaigns[campaign] = combine(campaigns.get(campaign), [max_date, int(rows), float(total)])
+            self._fingerprints = fingerprints
+            self._fingerprints_read = time.monotonic()
+            return fingerprints
+
+    def current(self, rollup, spec):
+        """Whether the rollup holds the source's latest rows for every campaign of ``spec``."""
+        if self.watermarks is None:
+            # Nothing invalidates cached results early, so they expire by TTL as before
+            return True
+        probed = self.watermarks.watermarks.get(rollup.source)
+        if probed is None:
+            return False
+        recorded = self.recorded_fingerprints().get(rollup.name, {})
+        for campaign in spec.campaigns:
+            watermark = probed.get(campaign)
+            if watermark is None or campaign not in recorded:
+                # A campaign absent from both has no rows anywhere, which the rollup answers correctly
+                if watermark is not None or campaign in recorded:
+                    return False
+                continue
+            max_date, rows, total = watermark
+            total = 0.0 if total in (None, "None") else float(total)
+            if not same_fingerprint(recorded[campaign], [max_date, int(rows), total]):
+                return False
+        return True
+
+    def route(self, spec):
+        """Smallest current rollup covering ``spec``, or None to query its own table."""
+        for rollup in self.rollups:
+            if covers(rollup, spec) and self.current(rollup, spec):
+                self.routed[rollup.name] = self.routed.get(rollup.name, 0) + 1
+                return rollup
+        self.routed[spec.table] = self.routed.get(spec.table, 0) + 1
+        return None
+
+
+@st.cache_resource(ttl=REGISTRY_TTL)
+def get_navigator():
+    """Navigator over the backend's rollups, if ``[rollups] navigator`` is on.
+
+    It defaults to on when this process also maintains the rollups
+    (``refresh_interval``), since only then are they known to be current.
+    """
+    settings = st.secrets.get("rollups", {})
+    if not settings.get("navigator", bool(settings.get("refresh_interval"))):
+        return None
+    return AggregateNavigator.load(get_backend(), get_rollups())
@@ -0,0 +1,305 @@
+import argparse
+import logging
+from datetime import date, timedelta
+
+import pandas as pd
+
+from db.backend import get_backend
+from db.rollup import ROW_COUNT, TABLE_EXISTS_QUERIES, measure_columns
+from db.schema import get_catalog
+from db.snapshot import month_bounds, remote_fingerprints
+from db.spec import count_column, sum_column
+
+logger = logging.getLogger(__name__)
+
+# The fact tables that grow without bound
+PARTITIONED_TABLES = ["report_campaign_creative", "report_campaign_overall_total"]
+DEFAULT_MONTHS_AHEAD = 3  # empty monthly partitions kept ready for new rows
+DEFAULT_CLOSED_DAYS = 90  # a campaign is closed out this long after its last report_date
+DEFAULT_KEEP_MONTHS = 13  # months always kept at daily grain, for year-on-year views
+FUTURE_PARTITION = "pmax"
+REPORT_MONTH = "report_month"
+
+PARTITIONS_QUERY = (
+    "SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS FROM information_schema.PARTITIONS "
+    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL "
+    "ORDER BY PARTITION_ORDINAL_POSITION"
+)
+UNIQUE_KEYS_QUERY = (
+    "SELECT INDEX_NAME, GROUP_CONCAT(COLUMN_NAME ORDER BY SEQ_IN_INDEX) FROM information_schema.STATISTICS "
+    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND NON_UNIQUE = 0 GROUP BY INDEX_NAME"
+)
+
+
+def archive_name(table):
+    # Outside the catalog's report_campaign_% pattern: the archive has no
+    # report_date, so it must not be taken for a report table
+    return f"archive_{table}_monthly"
+
+
+def partition_name(month):
+    """Partition holding a ``YYYY-MM`` month: p202401 for 2024-01."""
+    return "p" + month.replace("-", "")
+
+
+def next_month(month):
+    return (pd.Period(month, "M") + 1).strftime("%Y-%m")
+
+
+def month_of(day):
+    return f"{day.year:04d}-{day.month:02d}"
+
+
+def partition_clause(month):
+    return f"PARTITION {partition_name(month)} VALUES LESS THAN ('{next_month(month)}-01')"
+
+
+class PartitionManager:
+    """Keeps a report table RANGE COLUMNS(report_date) partitioned by month (MySQL only).
+
+    ``convert`` partitions an existing table once; it rebuilds the table, so
+    run it in a maintenance window. After that ``rotate`` is cheap and
+    online: it splits the empty ``pmax`` partition to add the coming months
+    and drops old partitions that archiving has emptied. The dashboard's
+    ``report_date >= %s AND report_date <= %s`` predicates then only touch
+    the partitions of the months they ask for.
+    """
+
+    def __init__(self, backend, table):
+        if backend.dialect.name != "mysql":
+            raise ValueError(f"Partitioning is only supported on MySQL, not {backend.dialect.name}")
+        self.backend = backend
+        self.table = table
+
+    def partitions(self):
+        """[(name, upper bound, estimated rows)] in order; empty if the table isn't partitioned."""
+        with self.backend.cursor() as cursor:
+            cursor.execute(PARTITIONS_QUERY, (self.table,))
+            return [(name, bound.strip("'"), rows) for name, bound, rows in cursor.fetchall()]
+
+    def blocking_keys(self):
+        """Unique keys that don't include report_date; MySQL refuses to partition while there are any."""
+        with self.backend.cursor() as cursor:
+            cursor.execute(UNIQUE_KEYS_QUERY, (self.table,))
+            return [name for name, columns in cursor.fetchall() if "report_date" not in columns.split(",")]
+
+    def convert_statement(self, ahead=DEFAULT_MONTHS_AHEAD):
+        """ALTER TABLE that partitions the table by month, from its first report_date to ``ahead`` months from now."""
+        with self.backend.cursor() as cursor:
+            cursor.execute(f"SELECT MIN(report_date) FROM {self.table}")
+            first = cursor.fetchone()[0] or date.today()
+        month, last = month_of(first), month_of(date.today())
+        for _ in range(ahead):
+            last = next_month(last)
+        clauses = []
+        while month <= last:
+            clauses.append(partition_clause(month))
+            month = next_month(month)
+        clauses.append(f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN (MAXVALUE)")
+        return f"ALTER TABLE {self.table} PARTITION BY RANGE COLUMNS(report_date) ({', '.join(clauses)})"
+
+    def convert(self, ahead=DEFAULT_MONTHS_AHEAD):
+        if self.partitions():
+            raise ValueError(f"{self.table} is already partitioned")
+        blocking = self.blocking_keys()
+        if blocking:
+            raise ValueError(f"{self.table}: add report_date to unique key(s) {', '.join(blocking)} first")
+        statement = self.convert_statement(ahead)
+        with self.backend.cursor() as cursor:
+            cursor.execute(statement)
+        return statement
+
+    def rotate(self, ahead=DEFAULT_MONTHS_AHEAD, drop_before=None):
+        """Add partitions up to ``ahead`` months from now and drop empty ones before ``drop_before`` (YYYY-MM).
+
+        Returns the statements run.
+        """
+        existing = self.partitions()
+        if not existing:
+            raise ValueError(f"{self.table} is not partitioned; run convert first")
+        monthly = [(name, bound) for name, bound, _ in existing if name != FUTURE_PARTITION]
+        last = month_of(date.fromisoformat(monthly[-1][1]) - timedelta(days=1)) if monthly else month_of(date.today())
+        target = month_of(date.today())
+        for _ in range(ahead):
+            target = next_month(target)
+
+        statements = []
+        new = []
+        while last < target:
+            last = next_month(last)
+            new.append(partition_clause(last))
+        if new:
+            # pmax is empty (new rows land in the monthly partitions), so splitting it moves no data
+            new.append(f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN (MAXVALUE)")
+            statements.append(
+                f"ALTER TABLE {self.table} REORGANIZE PARTITION {FUTURE_PARTITION} INTO ({', '.join(new)})"
+            )
+        if drop_before:
+            with self.backend.cursor() as cursor:
+                for name, bound in monthly:
+                    if bound > f"{drop_before}-01":
+                        break
+                    cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {self.table} PARTITION ({name}))")
+                    if not cursor.fetchone()[0]:
+                        statements.append(f"ALTER TABLE {self.table} DROP PARTITION {name}")
+        with self.backend.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+        return statements
+
+
+class MonthlyArchiver:
+    """Compacts closed-out campaign months of a report table into monthly summary rows.
+
+    The archive table ``archive_<table>_monthly`` has one row per campaign,
+    month and combination of the table's text columns, with each numeric
+    column ``m`` stored as ``m__sum``/``m__count`` like the rollups, so
+    SUM, COUNT and AVG per month stay exact. A (campaign, month) is moved
+    in one transaction: summary rows inserted, daily rows deleted. Only
+    months of campaigns whose last report_date is ``closed_days`` old, and
+    that are older than the ``keep_months`` most recent months, are moved.
+
+    The dashboard does not read the archive: archived months disappear from
+    every tab (and from the snapshot and rollups at their next sync or
+    refresh). They remain queryable in the archive table only.
+    """
+
+    def __init__(self, backend, catalog, table):
+        self.backend = backend
+        self.dialect = backend.dialect
+        self.table = table
+        self.archive = archive_name(table)
+        columns = catalog.columns(table)
+        self.measures = measure_columns(catalog, table, ("report_date",))
+        self.dimensions = tuple(col for col in columns if col not in self.measures and col != "report_date")
+        self.columns = columns
+
+    def _select(self, where, month):
+        q = self.dialect.quote
+        parts = [q(col) for col in self.dimensions] + [f"{month} AS {REPORT_MONTH}"]
+        for col in self.measures:
+            parts += [f"SUM({q(col)}) AS {q(sum_column(col))}", f"COUNT({q(col)}) AS {q(count_column(col))}"]
+        parts.append(f"COUNT(*) AS {ROW_COUNT}")
+        group_by = ", ".join(q(col) for col in self.dimensions)
+        return f"SELECT {', '.join(parts)} FROM {self.table} WHERE {where} GROUP BY {group_by}"
+
+    def ensure_archive(self):
+        with self.backend.transaction() as cursor:
+            cursor.execute(TABLE_EXISTS_QUERIES[self.dialect.name], (self.archive,))
+            if cursor.fetchone()[0]:
+                return
+            cursor.execute(f"CREATE TABLE {self.archive} AS {self._select('1 = 0', 'CAST(NULL AS CHAR(7))')}")
+            q = self.dialect.quote
+            cursor.execute(
+                f"CREATE INDEX ix_{self.archive} ON {self.archive} ({q('Campaign_code')}, {q(REPORT_MONTH)})"
+            )
+
+    def closed_months(self, closed_days=DEFAULT_CLOSED_DAYS, keep_months=DEFAULT_KEEP_MONTHS, today=None):
+        """[(Campaign_code, month)] that can be archived, oldest first."""
+        today = today or date.today()
+        cutoff = month_of(today)
+        for _ in range(keep_months):
+            cutoff = (pd.Period(cutoff, "M") - 1).strftime("%Y-%m")
+        with self.backend.cursor() as cursor:
+            partitions = remote_fingerprints(cursor, self.table, self.columns, self.dialect)
+        last_dates = {}
+        for (campaign, _), (max_date, _, _) in partitions.items():
+            last_dates[campaign] = max(last_dates.get(campaign, max_date), max_date)
+        closed = {
+            campaign for campaign, last in last_dates.items()
+            if date.fromisoformat(last[:10]) < today - timedelta(days=closed_days)
+        }
+        return sorted(
+            ((campaign, month) for campaign, month in partitions if campaign in closed and month < cutoff),
+            key=lambda key: (key[1], key[0]),
+        )
+
+    def archive_month(self, campaign, month):
+        """Move one campaign month into the archive; returns the daily rows removed."""
+        p = self.dialect.placeholder
+        first, last = month_bounds(month)
+        where = f"Campaign_code = {p} AND report_date BETWEEN {p} AND {p}"
+        columns = list(self.dimensions) + [REPORT_MONTH]
+        for col in self.measures:
+            columns += [sum_column(col), count_column(col)]
+        columns.append(ROW_COUNT)
+        q = self.dialect.quote
+        with self.backend.transaction() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {self.table} WHERE {where}", (campaign, first, last))
+            rows = cursor.fetchone()[0]
+            cursor.execute(
+                f"INSERT INTO {self.archive} ({', '.join(q(col) for col in columns)}) {self._select(where, p)}",
+                (month, campaign, first, last),
+            )
+            cursor.execute(f"DELETE FROM {self.table} WHERE {where}", (campaign, first, last))
+        return rows
+
+    def run(self, closed_days=DEFAULT_CLOSED_DAYS, keep_months=DEFAULT_KEEP_MONTHS, limit=None):
+        """Archive closed campaign months (at most ``limit``); returns {(campaign, month): rows moved}."""
+        self.ensure_archive()
+        moved = {}
+        for campaign, month in self.closed_months(closed_days, keep_months)[:limit]:
+            moved[(campaign, month)] = self.archive_month(campaign, month)
+            logger.info("Archived %s %s of %s (%d rows)", campaign, month, self.table, moved[(campaign, month)])
+        return moved
+
+
+def main():
+    """Admin entry point: ``python -m db.partition status|convert|rotate|archive [options]``.
+
+    Typically ``convert`` once per table, then ``archive`` and ``rotate``
+    monthly from cron. ``archive`` also works on the local DuckDB backend;
+    the partition commands need MySQL.
+    """
+    parser = argparse.ArgumentParser(
+        description="Partition and archive the report fact tables.",
+        epilog=(
+            "archive moves closed campaign months out of the daily tables into archive_<table>_monthly. "
+            "The dashboard does not read the archive, so those months no longer appear in it."
+        ),
+    )
+    parser.add_argument("command", choices=["status", "convert", "rotate", "archive"])
+    parser.add_argument("--table", action="append", choices=PARTITIONED_TABLES, help="default: all of them")
+    parser.add_argument("--ahead", type=int, default=DEFAULT_MONTHS_AHEAD, help="months of partitions to keep ready")
+    parser.add_argument("--closed-days", type=int, default=DEFAULT_CLOSED_DAYS)
+    parser.add_argument("--keep-months", type=int, default=DEFAULT_KEEP_MONTHS)
+    parser.add_argument("--limit", type=int, help="archive: at most this many campaign months per table")
+    parser.add_argument("--dry-run", action="store_true", help="print what would be done")
+    args = parser.parse_args()
+
+    backend = get_backend().primary
+    for table in args.table or PARTITIONED_TABLES:
+        if args.command == "archive":
+            archiver = MonthlyArchiver(backend, get_catalog(), table)
+            if args.dry_run:
+                for campaign, month in archiver.closed_months(args.closed_days, args.keep_months)[:args.limit]:
+                    print(f"{table}: would archive {campaign} {month}")
+                continue
+            moved = archiver.run(args.closed_days, args.keep_months, args.limit)
+            print(f"{table}: archived {len(moved)} campaign month(s), {sum(moved.values()):,} rows")
+            continue
+
+        manager = PartitionManager(backend, table)
+        if args.command == "status":
+            partitions = manager.partitions()
+            if not partitions:
+                print(f"{table}: not partitioned")
+            for name, bound, rows in partitions:
+                print(f"{table}: {name} < {bound} (~{rows:,} rows)")
+        elif args.command == "convert":
+            if args.dry_run:
+                print(manager.convert_statement(args.ahead) + ";")
+            else:
+                manager.convert(args.ahead)
+                print(f"{table}: partitioned by month")
+        else:
+            drop_before = month_of(date.today() - timedelta(days=31 * args.keep_months))
+            if args.dry_run:
+                print(f"{table}: would add partitions {args.ahead} month(s) ahead and drop empty ones before {drop_before}")
+                continue
+            for statement in manager.rotate(args.ahead, drop_before):
+                print(statement + ";")
+
+
+if __name__ == "__main__":
+    main()
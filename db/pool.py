@@ -0,0 +1,149 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+import mysql.connector
+from mysql.connector import Error, errors, pooling
+
+from db.prepared import DEFAULT_CAPACITY, StatementCache
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CHECKOUT_TIMEOUT = 30  # seconds to wait for a free connection
+DEFAULT_QUERY_TIMEOUT = 120  # seconds a dashboard query may run on the server
+RECONNECT_ATTEMPTS = 3
+RECONNECT_DELAY = 1  # seconds between reconnect attempts
+
+
+class ConnectionPool:
+    """Bounded pool of MySQL connections shared by every session of the server process.
+
+    Callers check a connection out for the duration of one query and hand it
+    back straight away, so queries from different sessions run in parallel
+    on separate sockets instead of sharing one global cursor.
+    """
+
+    def __init__(self, config: dict, size: int = DEFAULT_POOL_SIZE, checkout_timeout: float = DEFAULT_CHECKOUT_TIMEOUT,
+                 query_timeout: float = DEFAULT_QUERY_TIMEOUT, name: str = "dashboard",
+                 prepared_statements: int = DEFAULT_CAPACITY):
+        # mysql.connector refuses pools larger than CNX_POOL_MAXSIZE
+        self.size = max(1, min(int(size), pooling.CNX_POOL_MAXSIZE))
+        self.checkout_timeout = checkout_timeout
+        self.query_timeout = query_timeout
+        self.name = name  # also the pool_name of its connections
+        self._config = config
+        # Prepared statements live in the session, so sessions can't be reset
+        # on check-in while they are cached; connection() ends the
+        # connection's transaction instead.
+        self.statements = StatementCache(self.size, prepared_statements) if prepared_statements else None
+        self._pool = pooling.MySQLConnectionPool(
+            pool_name=name,
+            pool_size=self.size,
+            pool_reset_session=self.statements is None,
+            **config,
+        )
+        # The connector raises PoolError as soon as the pool is empty; the
+        # semaphore makes callers queue for a free connection instead.
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    def _checkout(self):
+        # get_connection() pings the connection and reconnects it if MySQL
+        # closed it (e.g. after wait_timeout); retry a few times in case the
+        # server is briefly unreachable.
+        for attempt in range(1, RECONNECT_ATTEMPTS + 1):
+            try:
+                return self._pool.get_connection()
+            except errors.InterfaceError:
+                if attempt == RECONNECT_ATTEMPTS:
+                    raise
+                time.sleep(RECONNECT_DELAY)
+
+    @contextmanager
+    def connection(self):
+        """Check a healthy connection out of the pool for the duration of the block."""
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise errors.PoolError(
+                f"Timed out after {self.checkout_timeout}s waiting for a free MySQL connection"
+            )
+        try:
+            cnx = self._checkout()
+            try:
+                yield cnx
+            finally:
+                if self.statements is not None:
+                    self._end_transaction(cnx)
+                # Returns the connection to the pool rather than closing it
+                cnx.close()
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _end_transaction(cnx):
+        # Without autocommit even a SELECT opens a transaction, whose snapshot
+        # the next borrower would otherwise keep reading from
+        try:
+            cnx.rollback()
+        except Error:
+            # Half-read results or a dead socket: reconnect on next checkout
+            cnx.disconnect()
+
+    @contextmanager
+    def cursor(self, **kwargs):
+        """Shortcut for a cursor on a pooled connection, closed when the block exits."""
+        with self.connection() as cnx:
+            cursor = cnx.cursor(**kwargs)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    def kill_query(self, connection_id):
+        """Abort the statement running on another connection (KILL QUERY).
+
+        Uses its own short-lived connection so it works even when every
+        pooled connection is busy.
+        """
+        cnx = mysql.connector.connect(**self._config)
+        try:
+            cursor = cnx.cursor()
+            cursor.execute(f"KILL QUERY {int(connection_id)}")
+            cursor.close()
+        finally:
+            cnx.close()
+
+
+CONNECTION_KEYS = ("host", "port", "database", "user", "password")
+
+
+def _make_pool(settings, overrides=None, name="dashboard"):
+    config = {key: settings[key] for key in CONNECTION_KEYS if key in settings}
+    config.update({key: overrides[key] for key in CONNECTION_KEYS if key in (overrides or {})})
+    return ConnectionPool(
+        config,
+        size=settings.get("pool_size", DEFAULT_POOL_SIZE),
+        checkout_timeout=settings.get("pool_timeout", DEFAULT_CHECKOUT_TIMEOUT),
+        query_timeout=settings.get("query_timeout", DEFAULT_QUERY_TIMEOUT),
+        name=name,
+        # 0 turns the prepared statement cache off
+        prepared_statements=settings.get("prepared_statements", DEFAULT_CAPACITY),
+    )
+
+
+@st.cache_resource
+def get_pool():
+    """Create the connection pool once per server process from st.secrets["mysql"]."""
+    return _make_pool(st.secrets["mysql"])
+
+
+@st.cache_resource
+def get_replica_pools():
+    """Pools for the read replicas listed as ``[[mysql.replicas]]`` in st.secrets.
+
+    Each entry needs a ``host``; other connection settings default to the
+    primary's. Returns [(pool, replica settings)].
+    """
+    settings = st.secrets["mysql"]
+    return [
+        (_make_pool(settings, replica, name=replica.get("name", f"replica-{i}")), replica)
+        for i, replica in enumerate(settings.get("replicas", []), start=1)
+    ]
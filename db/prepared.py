@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from mysql.connector import Error
+
+DEFAULT_CAPACITY = 64  # statements kept prepared per connection
+
+
+class StatementCache:
+    """Server-side prepared statements of a connection pool, per connection and SQL template.
+
+    query_data and the sidebar lookups generate a handful of templates whose
+    values are bound as parameters, so after the first use on a connection
+    a template is executed by statement id and MySQL skips parsing and
+    planning it again. Each connection keeps its ``capacity`` most recently
+    used templates.
+
+    Statements belong to the server session: the pool must not reset
+    sessions on check-in (COM_RESET_CONNECTION deallocates them). Entries
+    are keyed by the connection object as well as its ``connection_id``: a
+    reconnected connection gets a new id, and after a pool restart another
+    connection can come back with an id already seen, whose cursors still
+    belong to the old one.
+    """
+
+    def __init__(self, pool_size, capacity=DEFAULT_CAPACITY):
+        self.pool_size = pool_size
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # (connection, connection_id) -> OrderedDict(template -> (template, prepared cursor)), least recently used first
+        self._connections = OrderedDict()
+
+    def _statements(self, cnx):
+        # Each checkout wraps the pool's connection in a new PooledMySQLConnection
+        key = (getattr(cnx, "_cnx", cnx), cnx.connection_id)
+        with self._lock:
+            statements = self._connections.get(key)
+            if statements is None:
+                statements = self._connections[key] = OrderedDict()
+                # More keys than connections means some were reconnected or replaced; their statements are gone
+                while len(self._connections) > self.pool_size:
+                    self._connections.popitem(last=False)
+            self._connections.move_to_end(key)
+            return statements
+
+    @contextmanager
+    def execute(self, cnx, query, values=()):
+        """Execute ``query`` on ``cnx`` as a prepared statement; yields the cursor to fetch from."""
+        statements = self._statements(cnx)
+        entry = statements.get(query)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if entry is None:
+            entry = (query, cnx.cursor(prepared=True))
+            statements[query] = entry
+            while len(statements) > self.capacity:
+                _, (_, evicted) = statements.popitem(last=False)
+                evicted.close()
+        statements.move_to_end(query)
+        # The connector only reuses a cursor's statement when executed with the
+        # very string object it was prepared from, not an equal one
+        template, cursor = entry
+        try:
+            cursor.execute(template, tuple(values))
+            yield cursor
+            if cnx.unread_result:
+                cursor.fetchall()
+        except BaseException:
+            # The statement may be half-read or its session gone; prepare it afresh next time
+            statements.pop(query, None)
+            try:
+                cursor.close()
+            except Error:
+                pass
+            raise
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "statements": sum(len(statements) for statements in self._connections.values()),
+            }
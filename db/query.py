@@ -0,0 +1,237 @@
+import logging
+import time
+from contextlib import nullcontext
+from dataclasses import replace
+
+import pandas as pd
+
+from db.advisor import get_recorder
+from db.backend import DUCKDB, get_backend
+from db.cache import MISS, fetch_cached, get_cache
+from db.columnar import ENGINE_NAME, get_columnar_engine
+from db.cancel import current_flight, get_tracker
+from db.fetch import fetch_frame
+from db.governor import PRIORITY_GRID, PRIORITY_KPI, get_governor
+from db.navigator import get_navigator
+from db.reaggregate import covers, matching, reaggregate
+from db.schema import get_catalog
+from db.spec import QuerySpec, count_column, sum_column
+from db.sql import build_query, build_rollup_query
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAMESPACE = "query_data"
+
+
+def result_dtypes(catalog, spec):
+    """Target dtypes of every stored column of a spec's result."""
+    measures = dict(spec.measures)
+    dtypes = catalog.result_dtypes(spec.table, list(spec.group_by) + list(spec.columns) + list(measures), measures)
+    for col, func in spec.measures:
+        if func == "AVG":
+            dtypes[sum_column(col)] = "float64"
+            dtypes[count_column(col)] = "int64"
+    for alias, func, col, _ in spec.conditionals:
+        # Same types as the plain aggregate of the column
+        dtypes[alias] = catalog.result_dtypes(spec.table, [col], {col: func})[col]
+    for alias, *_ in spec.ratios:
+        dtypes[alias] = "float64"
+    return dtypes
+
+
+def cast_to(frame, dtypes):
+    """Give a frame computed in memory the dtypes fetch_frame gives a database result.
+
+    As there, an integer column holding NULLs stays float64.
+    """
+    for col, dtype in dtypes.items():
+        if dtype is None or col not in frame:
+            # Typed from the cursor description, so nothing to match
+            continue
+        if dtype == "int64" and frame[col].isna().any():
+            dtype = "float64"
+        if str(frame[col].dtype) != dtype:
+            frame[col] = frame[col].astype(dtype)
+    return frame
+
+
+def _cancellable(backend, cnx):
+    """Register the connection as running the current single-flight call so it can be cancelled."""
+    key = current_flight()
+    if key is None:
+        return nullcontext()
+    return get_tracker().running(key, backend.cancel_handle(cnx))
+
+
+def query_priority(spec):
+    """Governor priority: totals and single-dimension breakdowns (KPIs, charts) go before grids."""
+    if spec.aggregated and len(spec.group_by) <= 1:
+        return PRIORITY_KPI
+    return PRIORITY_GRID
+
+
+def _finish_averages(spec, frame):
+    for col, func in spec.measures:
+        if func == "AVG":
+            # Same as MySQL's AVG(): NULLs are ignored and an all-NULL group gives NULL
+            frame[col] = frame[sum_column(col)] / frame[count_column(col)]
+    return frame
+
+
+def execute_on_backend(spec):
+    """Run a spec against the database backend, reading the smallest covering rollup if there is one."""
+    backend = get_backend()
+    navigator = get_navigator()
+    rollup = navigator.route(spec) if navigator is not None else None
+    if rollup is not None:
+        query, values = build_rollup_query(spec, rollup, backend.dialect, timeout=backend.query_timeout)
+    else:
+        query, values = build_query(spec, backend.dialect, timeout=backend.query_timeout)
+    # Wait for a governor slot, then execute on a connection of our own (as a
+    # prepared statement where the backend caches them) and stream the rows
+    # into typed columns
+    with get_governor().slot(query_priority(spec)), backend.connection() as cnx, _cancellable(backend, cnx):
+        started = time.perf_counter()
+        with backend.execute(cnx, query, values) as cursor:
+            frame = fetch_frame(cursor, spec.stored_columns(), result_dtypes(get_catalog(), spec))
+        elapsed = time.perf_counter() - started
+        engine = backend.engine_name(cnx)
+    recorder = get_recorder()
+    if recorder is not None and rollup is None:
+        # Rollups come with their own index; only the report tables need advice
+        recorder.record(spec, elapsed)
+    frame.attrs["engine"] = engine
+    frame.attrs["table"] = rollup.name if rollup is not None else spec.table
+    return _finish_averages(spec, frame)
+
+
+def execute_on_snapshot(engine, spec, source):
+    """Run a spec with the columnar engine over the local Parquet snapshot."""
+    query, values = build_query(spec, DUCKDB, source=source)
+    cursor = engine.cursor()
+    try:
+        cursor.execute(query, values)
+        frame = fetch_frame(cursor, spec.stored_columns(), result_dtypes(get_catalog(), spec))
+    finally:
+        cursor.close()
+    frame.attrs["engine"] = ENGINE_NAME
+    frame.attrs["table"] = spec.table
+    return _finish_averages(spec, frame)
+
+
+def execute(spec):
+    """Run a spec; returns a frame in ``spec.stored_columns()`` layout.
+
+    Uses the local snapshot when the columnar engine is enabled and has
+    current data for the spec, otherwise the database backend. The engine
+    and table that answered are recorded in ``frame.attrs``.
+    """
+    engine = get_columnar_engine()
+    if engine is not None:
+        reason = engine.unavailable(spec)
+        source = engine.source(spec) if reason is None else None
+        if source is not None:
+            return execute_on_snapshot(engine, spec, source)
+        logger.debug("Snapshot can't answer %s query (%s); using the backend", spec.table, reason or "no files in range")
+    return execute_on_backend(spec)
+
+
+def answer_from_cache(spec):
+    """Compute an aggregated spec by re-aggregating a cached finer-grained result, if one exists."""
+    if not spec.aggregated:
+        return None
+    found = get_cache().find(
+        lambda key: key[0] == CACHE_NAMESPACE and key[1] != spec and covers(key[1], spec)
+    )
+    if found is None:
+        return None
+    (_, fine), frame = found
+    result = reaggregate(frame, fine, spec, get_backend().dialect)
+    result.attrs["engine"] = f"cache ({frame.attrs.get('engine', 'unknown')})"
+    result.attrs["table"] = frame.attrs.get("table", fine.table)
+    return result
+
+
+def assemble_campaigns(spec):
+    """Compute a multi-campaign spec from per-campaign results, if some are cached.
+
+    Every re-aggregatable measure combines across disjoint campaigns, so
+    the answer for campaigns A and B is the roll-up of A's and B's. Cached
+    single-campaign results are reused as they are; the missing campaigns
+    are fetched in one query grouped by Campaign_code as well, and each of
+    their slices is cached under its own single-campaign spec for next time.
+    """
+    campaigns = spec.campaigns
+    if not (spec.aggregated and spec.simple) or campaigns is None or len(campaigns) < 2:
+        return None
+    cache = get_cache()
+    singles = {campaign: spec.with_filter("Campaign_code", campaign) for campaign in campaigns}
+    pieces = {}
+    for campaign, single in singles.items():
+        frame = cache.peek((CACHE_NAMESPACE, single), table=spec.table, campaign=campaign)
+        if frame is not MISS:
+            pieces[campaign] = frame
+    if not pieces:
+        # Nothing to reuse: a single IN query is cheaper than a per-campaign breakdown
+        return None
+
+    missing = [campaign for campaign in campaigns if campaign not in pieces]
+    if missing:
+        fused = replace(spec.with_filter("Campaign_code", missing), group_by=tuple(sorted({*spec.group_by, "Campaign_code"})))
+        frame = execute(fused)
+        dialect = get_backend().dialect
+        for campaign in missing:
+            # Split as the IN and GROUP BY compared the codes
+            rows = frame[matching(frame["Campaign_code"], campaign, dialect)]
+            piece = reaggregate(rows, fused, singles[campaign], dialect)
+            piece.attrs.update(frame.attrs)
+            cache.put((CACHE_NAMESPACE, singles[campaign]), piece, table=spec.table, campaign=campaign)
+            pieces[campaign] = piece
+
+    combined = pd.concat([pieces[campaign] for campaign in campaigns], ignore_index=True)
+    result = reaggregate(combined, singles[campaigns[0]], spec, get_backend().dialect)
+    result = cast_to(result, result_dtypes(get_catalog(), spec))
+    result.attrs["engine"] = f"assembled ({len(campaigns) - len(missing)} cached, {len(missing)} fetched)"
+    result.attrs["table"] = spec.table
+    return result
+
+
+def load(spec):
+    """Result of a spec, from a finer cached result when possible, else from the backend."""
+    frame = answer_from_cache(spec)
+    if frame is None:
+        frame = assemble_campaigns(spec)
+    if frame is None:
+        frame = execute(spec)
+    return frame
+
+
+def run_query(spec, result_columns):
+    """Cached result of ``spec`` projected to ``result_columns``."""
+    frame = fetch_cached((CACHE_NAMESPACE, spec), lambda: load(spec), table=spec.table, campaign=spec.campaign)
+    # Selecting the columns returns a new frame, so callers can't alter the cached one
+    return frame[result_columns]
+
+
+def query_data(
+    columns: list,
+    tablename: str,
+    filters: dict,
+    start_date=None,
+    end_date=None,
+    aggregations: dict = None,  # e.g., {"Impression": "SUM", "Cost": "AVG"}
+    group_by: list = None,      # e.g., ["Region", "Platform"]
+    conditions: dict = None,    # e.g., {"committed_Clicks": ("SUM", "Clicks", {"KPI_Metric": "Click"})}
+    ratios: dict = None,        # e.g., {"CTR": ("Clicks", "Impression", 100)}, over measure names
+    having: list = None,        # e.g., [("Cost", ">", 0)]
+    order_by: list = None,      # e.g., [("Impression", "DESC")]
+    limit: int = None,
+):
+    # Reject unknown identifiers, functions and operators before they are interpolated into SQL
+    get_catalog().validate(tablename, columns, filters, aggregations, group_by, conditions, ratios, having, order_by, limit)
+
+    spec = QuerySpec.from_call(
+        columns, tablename, filters, start_date, end_date, aggregations, group_by,
+        conditions, ratios, having, order_by, limit,
+    )
+    return run_query(spec, QuerySpec.result_columns(columns, aggregations, group_by, conditions, ratios))
@@ -0,0 +1,102 @@
+import pandas as pd
+
+from db.backend import MYSQL
+
+from db.spec import count_column, sum_column
+
+# Aggregates whose partial results combine with the same function again
+# (COUNT partials are added up).
+ROLLUP_FUNCTIONS = {"SUM": "sum", "MIN": "min", "MAX": "max", "COUNT": "sum"}
+
+
+def available_measures(spec):
+    """{(column, FUNC)} that can be derived from a cached result of ``spec``."""
+    available = set()
+    for col, func in spec.measures:
+        available.add((col, func))
+        if func == "AVG":
+            # Stored SUM and COUNT give the AVG and also both of those
+            available |= {(col, "SUM"), (col, "COUNT")}
+    return available
+
+
+def covers(fine, coarse):
+    """True if ``coarse`` can be computed from a cached result of ``fine``.
+
+    Both must aggregate the same table and date range. ``coarse`` may group
+    by fewer dimensions, and may filter on extra columns as long as ``fine``
+    grouped by them (those filters are applied in memory).
+    """
+    if not (fine.aggregated and coarse.aggregated and fine.simple and coarse.simple):
+        return False
+    if (fine.table, fine.start_date, fine.end_date) != (coarse.table, coarse.start_date, coarse.end_date):
+        return False
+    fine_filters = fine.filter_dict
+    coarse_filters = coarse.filter_dict
+    if any(coarse_filters.get(col, object()) != value for col, value in fine_filters.items()):
+        return False
+    extra_filters = set(coarse_filters) - set(fine_filters)
+    if not extra_filters.union(coarse.group_by) <= set(fine.group_by):
+        return False
+    return set(coarse.measures) <= available_measures(fine)
+
+
+def matching(column, value, dialect=MYSQL):
+    """Mask of the rows of ``column`` equal to ``value`` (or in it, for a tuple) as the database compares them.
+
+    MySQL's default collations ignore case and trailing spaces, so an
+    in-memory filter must too, or it would drop rows the same WHERE
+    clause keeps.
+    """
+    values = value if isinstance(value, tuple) else (value,)
+    keys = {dialect.collation_key(v) for v in values}
+    if not dialect.case_insensitive:
+        return column.isin(keys)
+    return column.astype(object).map(dialect.collation_key).isin(keys)
+
+
+def reaggregate(frame, fine, coarse, dialect=MYSQL):
+    """Answer ``coarse`` from ``frame``, the cached result of a covering ``fine`` spec.
+
+    Extra filters of ``coarse`` are applied in memory, comparing text like
+    ``dialect`` does. Returns a frame in ``coarse.stored_columns()``
+    layout, so it can be cached and rolled up again in turn.
+    """
+    fine_measures = dict(fine.measures)
+    for col, value in coarse.filters:
+        if col not in fine.filter_dict:
+            frame = frame[matching(frame[col], value, dialect)]
+
+    # Partial columns to combine: (source column, output column, combine function)
+    parts = []
+    for col, func in coarse.measures:
+        if func == "AVG" or (fine_measures.get(col) == "AVG" and func in ("SUM", "COUNT")):
+            parts.append((sum_column(col), sum_column(col), "sum"))
+            parts.append((count_column(col), count_column(col), "sum"))
+        else:
+            parts.append((col, col, ROLLUP_FUNCTIONS[func]))
+    parts = list(dict.fromkeys(parts))
+
+    if coarse.group_by:
+        grouped = frame.groupby(list(coarse.group_by), dropna=False, observed=True, sort=False)
+        result = pd.DataFrame({
+            output: grouped[source].sum(min_count=1) if how == "sum" else grouped[source].agg(how)
+            for source, output, how in parts
+        }).reset_index()
+    else:
+        # Like SQL, an ungrouped aggregate is one row even over no input rows
+        result = pd.DataFrame({
+            output: [frame[source].sum(min_count=1) if how == "sum" else frame[source].agg(how)]
+            for source, output, how in parts
+        })
+
+    for col, func in coarse.measures:
+        if func == "AVG":
+            result[col] = result[sum_column(col)] / result[count_column(col)]
+        elif fine_measures.get(col) == "AVG":
+            source = sum_column(col) if func == "SUM" else count_column(col)
+            result[col] = result[source]
+        if func == "COUNT":
+            # As in SQL, counting no rows gives 0 rather than NULL
+            result[col] = result[col].fillna(0)
+    return result[coarse.stored_columns()]
@@ -0,0 +1,100 @@
+import logging
+import threading
+
+from mysql.connector import Error, errors
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_LAG = 60  # seconds a replica may be behind the primary and still serve reads
+DEFAULT_INTERVAL = 10  # seconds between lag checks
+
+
+def replication_lag(cursor):
+    """Seconds the server is behind its source, or None if it isn't replicating.
+
+    SHOW REPLICA STATUS is MySQL 8.0.22+; older servers only know the SLAVE
+    spelling and column names.
+    """
+    try:
+        cursor.execute("SHOW REPLICA STATUS")
+        column = "Seconds_Behind_Source"
+    except errors.ProgrammingError:
+        cursor.execute("SHOW SLAVE STATUS")
+        column = "Seconds_Behind_Master"
+    row = cursor.fetchone()
+    cursor.fetchall()
+    if row is None:
+        return None
+    # NULL while the replication threads are stopped
+    return row[column]
+
+
+class ReplicaMonitor:
+    """Background thread that checks how far each read replica is behind the primary.
+
+    A replica serves reads only while its last check succeeded and found it
+    at most ``max_lag`` seconds behind; until the first check, or when every
+    replica is lagging or unreachable, reads go to the primary. Replicas
+    configured with ``lag_check = false`` (e.g. a second local instance in
+    tests, which isn't replicating) are only checked for reachability.
+    """
+
+    def __init__(self, replicas, max_lag=DEFAULT_MAX_LAG, interval=DEFAULT_INTERVAL):
+        self.replicas = list(replicas)  # [(pool, settings)]
+        self.max_lag = max_lag
+        self.interval = interval
+        self.status = {pool.name: "not checked yet" for pool, _ in self.replicas}
+        self._current = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="replica-monitor", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def current(self):
+        """Pools of the replicas that may serve reads right now."""
+        return self._current
+
+    def mark_unreachable(self, pool, error):
+        """Stop reading from a replica that failed between checks; the next check may restore it."""
+        self.status[pool.name] = f"unreachable ({error})"
+        self._current = [p for p in self._current if p is not pool]
+
+    def check(self):
+        current = []
+        for pool, settings in self.replicas:
+            try:
+                with pool.cursor(dictionary=True) as cursor:
+                    if settings.get("lag_check", True):
+                        lag = replication_lag(cursor)
+                    else:
+                        cursor.execute("SELECT 1")
+                        cursor.fetchall()
+                        lag = 0
+            except Error as e:
+                self.status[pool.name] = f"unreachable ({e})"
+                continue
+            if lag is None:
+                self.status[pool.name] = "not replicating"
+            elif lag > self.max_lag:
+                self.status[pool.name] = f"{lag}s behind"
+            else:
+                self.status[pool.name] = "current" if not lag else f"{lag}s behind (current enough)"
+                current.append(pool)
+        if len(current) < len(self._current):
+            logger.warning("Replica(s) unavailable for reads: %s", self.status)
+        self._current = current
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Replica lag check failed")
+                self._current = []
+            if self._stop.wait(self.interval):
+                return
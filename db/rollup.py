@@ -0,0 +1,291 @@
+import argparse
+import logging
+import threading
+from dataclasses import dataclass
+
+import streamlit as st
+
+from db.backend import get_backend
+from db.schema import DATA_TYPE_DTYPES, get_catalog
+from db.snapshot import month_bounds, remote_fingerprints, same_fingerprint
+from db.spec import count_column, max_column, min_column, sum_column
+from db.watermark import WATCHED_TABLES
+
+logger = logging.getLogger(__name__)
+
+# Every rollup keeps these: the sidebar filters on Brand and Campaign_code
+# (a campaign belongs to one brand, so Brand adds no rows) and tabs filter
+# on report_date ranges, so rollups stay daily.
+BASE_DIMENSIONS = ("Brand", "Campaign_code", "report_date")
+GRAINS = {
+    "campaign": (),
+    "campaign_platform": ("Platform",),
+    "campaign_platform_region": ("Platform", "Region"),
+    "campaign_audience_region": ("Audience", "Region"),
+}
+ROW_COUNT = "row_count"
+# Aggregates that can be answered from the __sum/__count columns
+ROLLED_UP_FUNCTIONS = {"SUM", "COUNT", "AVG"}
+# Non-numeric columns kept as their MIN and MAX per row (the Overall KPI
+# cards show the plan's date range), and the aggregates answered from them
+EXTREME_COLUMNS = ("Plan_Start_Date", "Plan_End_Date")
+EXTREME_FUNCTIONS = {"MIN", "MAX"}
+STATE_TABLE = "rollup_partitions"
+DEFAULT_INTERVAL = 15 * 60  # seconds between background refreshes
+
+TABLE_EXISTS_QUERIES = {
+    "mysql": "SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+    "duckdb": "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = current_schema() AND table_name = ?",
+}
+TABLE_COLUMNS_QUERIES = {
+    "mysql": "SELECT COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+    "duckdb": "SELECT column_name FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = ?",
+}
+
+
+@dataclass(frozen=True)
+class Rollup:
+    """A summary of a report table at a fixed grain, one row per dimension values and day.
+
+    Each numeric column ``m`` of the source is stored as ``m__sum`` and
+    ``m__count`` (non-NULL rows), so SUM, COUNT and AVG over any coarser
+    grain or date range can be computed from it exactly; each extreme
+    column ``e`` as ``e__min`` and ``e__max`` for MIN and MAX.
+    """
+
+    name: str
+    source: str
+    dimensions: tuple  # includes BASE_DIMENSIONS
+    measures: tuple
+    extremes: tuple = ()
+
+
+def rollup_name(source, grain):
+    return f"rollup_{source.removeprefix('report_campaign_')}__{grain}"
+
+
+def measure_columns(catalog, table, dimensions=()):
+    """Numeric columns of a table that can be summed."""
+    return tuple(
+        col for col, data_type in catalog.columns(table).items()
+        if col not in dimensions and DATA_TYPE_DTYPES.get(data_type) in ("int64", "float64")
+    )
+
+
+def define_rollups(catalog, tables=WATCHED_TABLES, grains=GRAINS):
+    """Every (table, grain) rollup whose dimensions exist in the table."""
+    rollups = []
+    for table in tables:
+        known = catalog.tables.get(table, {})
+        for grain, extra in grains.items():
+            dimensions = BASE_DIMENSIONS + tuple(extra)
+            if all(col in known for col in dimensions):
+                extremes = tuple(col for col in EXTREME_COLUMNS if col in known and col not in dimensions)
+                rollups.append(Rollup(
+                    rollup_name(table, grain), table, dimensions, measure_columns(catalog, table, dimensions), extremes
+                ))
+    return rollups
+
+
+def has_columns(cursor, dialect, rollup):
+    """Whether a rollup table exists with every column its definition has (it may predate a new one)."""
+    cursor.execute(TABLE_COLUMNS_QUERIES[dialect.name], (rollup.name,))
+    existing = {row[0] for row in cursor.fetchall()}
+    return set(RollupBuilder.columns(rollup)) <= existing
+
+
+class RollupBuilder:
+    """Creates rollup tables in the backend database and keeps them up to date.
+
+    Rollups are refreshed per (Campaign_code, month) partition: the
+    source's per-partition fingerprint (latest date, rows, total Cost) is
+    compared with the one recorded in ``rollup_partitions`` when the
+    partition was last built, and only partitions that differ (new
+    report_date rows or restated ones) are deleted and re-aggregated.
+    """
+
+    def __init__(self, backend, catalog, rollups):
+        self.backend = backend
+        self.catalog = catalog
+        self.rollups = list(rollups)
+        self.dialect = backend.dialect
+
+    def _exists(self, cursor, table):
+        cursor.execute(TABLE_EXISTS_QUERIES[self.dialect.name], (table,))
+        return cursor.fetchone()[0] > 0
+
+    def _select(self, rollup, where):
+        """Aggregating SELECT that produces a rollup's rows from its source."""
+        q = self.dialect.quote
+        parts = [q(col) for col in rollup.dimensions]
+        for col in rollup.measures:
+            parts += [f"SUM({q(col)}) AS {q(sum_column(col))}", f"COUNT({q(col)}) AS {q(count_column(col))}"]
+        for col in rollup.extremes:
+            parts += [f"MIN({q(col)}) AS {q(min_column(col))}", f"MAX({q(col)}) AS {q(max_column(col))}"]
+        parts.append(f"COUNT(*) AS {ROW_COUNT}")
+        group_by = ", ".join(q(col) for col in rollup.dimensions)
+        return f"SELECT {', '.join(parts)} FROM {rollup.source} WHERE {where} GROUP BY {group_by}"
+
+    def create(self, rollup, fingerprints):
+        """(Re)create a rollup table filled from the whole source, recording ``fingerprints``.
+
+        The fingerprints are read before the rollup is filled, so rows that
+        arrive in between only make the next refresh rebuild their partition.
+        """
+        q = self.dialect.quote
+        p = self.dialect.placeholder
+        with self.backend.transaction() as cursor:
+            if not self._exists(cursor, STATE_TABLE):
+                cursor.execute(
+                    f"CREATE TABLE {STATE_TABLE} (rollup_name VARCHAR(128), Campaign_code VARCHAR(255), "
+                    "report_month CHAR(7), max_date VARCHAR(32), row_count BIGINT, total DOUBLE, "
+                    "PRIMARY KEY (rollup_name, Campaign_code, report_month))"
+                )
+            cursor.execute(f"DELETE FROM {STATE_TABLE} WHERE rollup_name = {self.dialect.placeholder}", (rollup.name,))
+            cursor.execute(f"DROP TABLE IF EXISTS {rollup.name}")
+            # Let the database pick the column types of the aggregates
+            cursor.execute(f"CREATE TABLE {rollup.name} AS {self._select(rollup, '1 = 0')}")
+            columns = ", ".join(q(col) for col in self.columns(rollup))
+            select = self._select(rollup, "Campaign_code IS NOT NULL AND report_date IS NOT NULL")
+            cursor.execute(f"INSERT INTO {rollup.name} ({columns}) {select}")
+            cursor.execute(f"CREATE INDEX ix_{rollup.name} ON {rollup.name} ({q('Campaign_code')}, {q('report_date')})")
+            cursor.executemany(
+                f"INSERT INTO {STATE_TABLE} (rollup_name, Campaign_code, report_month, max_date, row_count, total) "
+                f"VALUES ({p}, {p}, {p}, {p}, {p}, {p})",
+                [(rollup.name, campaign, month, *fp) for (campaign, month), fp in fingerprints.items()],
+            )
+
+    def _recorded(self, cursor, rollup):
+        cursor.execute(
+            f"SELECT Campaign_code, report_month, max_date, row_count, total FROM {STATE_TABLE} "
+            f"WHERE rollup_name = {self.dialect.placeholder}",
+            (rollup.name,),
+        )
+        return {(campaign, month): [max_date, int(rows), float(total)] for campaign, month, max_date, rows, total in cursor.fetchall()}
+
+    def _rebuild(self, rollup, campaign, month, fingerprint):
+        p = self.dialect.placeholder
+        first, last = month_bounds(month)
+        with self.backend.transaction() as cursor:
+            cursor.execute(
+                f"DELETE FROM {rollup.name} WHERE Campaign_code = {p} AND report_date BETWEEN {p} AND {p}",
+                (campaign, first, last),
+            )
+            cursor.execute(
+                f"DELETE FROM {STATE_TABLE} WHERE rollup_name = {p} AND Campaign_code = {p} AND report_month = {p}",
+                (rollup.name, campaign, month),
+            )
+            if fingerprint is None:
+                return
+            columns = ", ".join(self.dialect.quote(col) for col in self.columns(rollup))
+            select = self._select(rollup, f"Campaign_code = {p} AND report_date BETWEEN {p} AND {p}")
+            cursor.execute(f"INSERT INTO {rollup.name} ({columns}) {select}", (campaign, first, last))
+            cursor.execute(
+                f"INSERT INTO {STATE_TABLE} (rollup_name, Campaign_code, report_month, max_date, row_count, total) "
+                f"VALUES ({p}, {p}, {p}, {p}, {p}, {p})",
+                (rollup.name, campaign, month, *fingerprint),
+            )
+
+    @staticmethod
+    def columns(rollup):
+        """Columns of a rollup table, in order."""
+        columns = list(rollup.dimensions)
+        for col in rollup.measures:
+            columns += [sum_column(col), count_column(col)]
+        for col in rollup.extremes:
+            columns += [min_column(col), max_column(col)]
+        return columns + [ROW_COUNT]
+
+    def refresh(self, full=False):
+        """Bring every rollup up to date; returns {rollup name: partitions rebuilt}."""
+        rebuilt = {}
+        fingerprints = {}  # source table -> partition fingerprints, shared by its rollups
+        for rollup in self.rollups:
+            with self.backend.cursor() as cursor:
+                missing = (
+                    full or not has_columns(cursor, self.dialect, rollup) or not self._exists(cursor, STATE_TABLE)
+                )
+                if rollup.source not in fingerprints:
+                    fingerprints[rollup.source] = remote_fingerprints(
+                        cursor, rollup.source, self.catalog.columns(rollup.source), self.dialect
+                    )
+            source = fingerprints[rollup.source]
+            if missing:
+                self.create(rollup, source)
+                rebuilt[rollup.name] = len(source)
+                continue
+            with self.backend.cursor() as cursor:
+                recorded = self._recorded(cursor, rollup)
+            changed = [key for key, fp in source.items() if key not in recorded or not same_fingerprint(recorded[key], fp)]
+            removed = [key for key in recorded if key not in source]
+            for campaign, month in changed:
+                self._rebuild(rollup, campaign, month, source[(campaign, month)])
+            for campaign, month in removed:
+                self._rebuild(rollup, campaign, month, None)
+            rebuilt[rollup.name] = len(changed) + len(removed)
+        return rebuilt
+
+
+class RollupRefresher:
+    """Background thread that refreshes the rollups every ``interval`` seconds."""
+
+    def __init__(self, builder, interval=DEFAULT_INTERVAL):
+        self.builder = builder
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rollup-refresher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while True:
+            try:
+                for name, count in self.builder.refresh().items():
+                    if count:
+                        logger.info("Rebuilt %d partition(s) of %s", count, name)
+            except Exception:
+                logger.exception("Rollup refresh failed")
+            if self._stop.wait(self.interval):
+                return
+
+
+@st.cache_resource
+def get_rollups():
+    """Rollup definitions for the current schema."""
+    return define_rollups(get_catalog())
+
+
+@st.cache_resource
+def start_rollup_refresher():
+    """Maintain the rollups from this process if ``[rollups] refresh_interval`` is set (off by default)."""
+    interval = st.secrets.get("rollups", {}).get("refresh_interval", 0)
+    if not interval:
+        return None
+    return RollupRefresher(RollupBuilder(get_backend().primary, get_catalog(), get_rollups()), interval).start()
+
+
+def main():
+    """Admin entry point: ``python -m db.rollup refresh [--rollup NAME] [--full]``."""
+    parser = argparse.ArgumentParser(description="Build or refresh the rollup tables.")
+    parser.add_argument("command", choices=["refresh", "list"])
+    parser.add_argument("--rollup", action="append", help="default: all rollups")
+    parser.add_argument("--full", action="store_true", help="rebuild from scratch")
+    args = parser.parse_args()
+
+    rollups = [r for r in get_rollups() if not args.rollup or r.name in args.rollup]
+    if args.command == "list":
+        for rollup in rollups:
+            print(f"{rollup.name}: {rollup.source} by {', '.join(rollup.dimensions)} ({len(rollup.measures)} measures, {len(rollup.extremes)} extremes)")
+        return
+    builder = RollupBuilder(get_backend().primary, get_catalog(), rollups)
+    for name, count in builder.refresh(full=args.full).items():
+        print(f"{name}: {count} partition(s) rebuilt")
+
+
+if __name__ == "__main__":
+    main()
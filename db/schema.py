@@ -0,0 +1,206 @@
+import datetime
+import hashlib
+import math
+import re
+from numbers import Number
+
+import streamlit as st
+
+from db.backend import MYSQL, get_backend
+from db.spec import normalize_order
+
+TABLE_PATTERN = "report\\_campaign\\_%"
+AGGREGATE_FUNCTIONS = {"SUM", "AVG", "MIN", "MAX", "COUNT"}
+COMPARISON_OPERATORS = {"=", "<>", "!=", "<", "<=", ">", ">="}
+ORDER_DIRECTIONS = {"ASC", "DESC"}
+ALIAS_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")  # names of conditional and ratio measures
+MAX_LIMIT = 100_000
+# Columns that may be filtered on a list of values (IN), and how long the list may be
+MULTI_VALUE_COLUMNS = {"Brand", "Campaign_code", "Platform"}
+MAX_FILTER_VALUES = 200
+
+# information_schema DATA_TYPE -> pandas dtype of a raw (non-aggregated) column
+DATA_TYPE_DTYPES = {
+    "tinyint": "int64", "smallint": "int64", "mediumint": "int64",
+    "int": "int64", "bigint": "int64", "year": "int64", "bit": "int64",
+    "integer": "int64", "hugeint": "int64",  # DuckDB names
+    "decimal": "float64", "float": "float64", "double": "float64", "real": "float64",
+    "date": "datetime64[ns]", "datetime": "datetime64[ns]", "timestamp": "datetime64[ns]",
+}
+STRING_DTYPE = "category"
+
+# Columns stored as text in MySQL that actually hold dates
+DTYPE_OVERRIDES = {
+    "Plan_Start_Date": "datetime64[ns]",
+    "Plan_End_Date": "datetime64[ns]",
+}
+
+
+CATALOG_QUERIES = {
+    "mysql": (
+        "SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME LIKE %s"
+    ),
+    "duckdb": (
+        "SELECT table_name, column_name, data_type FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name LIKE ? ESCAPE '\\'"
+    ),
+}
+
+
+def _is_number(value):
+    return isinstance(value, Number) and not isinstance(value, bool)
+
+
+class UnknownColumnError(ValueError):
+    """A query referenced a table, column or aggregate the catalog doesn't know."""
+
+
+class SchemaCatalog:
+    """Column types of the report_campaign_* tables, loaded from information_schema.
+
+    Used to reject unknown identifiers before a query reaches MySQL (they are
+    interpolated into the SQL text) and to decide the dtype of every result
+    column, so frames come back as float64/int64/datetime64/category instead
+    of Decimal and str objects.
+    """
+
+    def __init__(self, tables: dict):
+        # {table: {column: information_schema DATA_TYPE}}
+        self.tables = tables
+        digest = hashlib.sha1(repr(sorted((t, sorted(c.items())) for t, c in tables.items())).encode())
+        self.version = digest.hexdigest()[:12]
+
+    def columns(self, tablename):
+        try:
+            return self.tables[tablename]
+        except KeyError:
+            raise UnknownColumnError(f"Unknown table: {tablename!r}") from None
+
+    def validate(self, tablename, columns=(), filters=None, aggregations=None, group_by=None,
+                 conditions=None, ratios=None, having=None, order_by=None, limit=None):
+        """Raise UnknownColumnError if any identifier, function or operator in a query spec isn't allowed.
+
+        Column names must be in the table; conditional and ratio measures
+        need plain identifiers as names that don't shadow a column, and
+        ratios, HAVING and ORDER BY may only refer to the query's outputs.
+        Filter and condition values must suit their column's dtype.
+        """
+        known = self.columns(tablename)
+        conditions = conditions or {}
+        ratios = ratios or {}
+        referenced = list(columns or []) + list(filters or {}) + list(aggregations or {}) + list(group_by or [])
+        for func, col, when in conditions.values():
+            referenced += [col, *when]
+        unknown = sorted({col for col in referenced if col not in known})
+        if unknown:
+            raise UnknownColumnError(f"Unknown column(s) for {tablename}: {', '.join(unknown)}")
+        for col, value in (filters or {}).items():
+            values = [value]
+            if isinstance(value, (list, tuple, set, frozenset)):
+                if col not in MULTI_VALUE_COLUMNS:
+                    raise UnknownColumnError(f"{col} can only be filtered on a single value")
+                if len(value) > MAX_FILTER_VALUES:
+                    raise UnknownColumnError(f"At most {MAX_FILTER_VALUES} values can be selected for {col}")
+                values = value
+            for v in values:
+                self._check_value(tablename, col, v, f"Filter on {col}")
+        for alias, (_, _, when) in conditions.items():
+            for col, value in when.items():
+                self._check_value(tablename, col, value, f"Condition of {alias!r} on {col}")
+        functions = list((aggregations or {}).values()) + [func for func, _, _ in conditions.values()]
+        bad_functions = sorted({func for func in functions if func.upper() not in AGGREGATE_FUNCTIONS})
+        if bad_functions:
+            raise UnknownColumnError(f"Unsupported aggregate function(s): {', '.join(bad_functions)}")
+
+        aliases = list(conditions) + list(ratios)
+        bad_aliases = sorted({
+            alias for alias in aliases
+            if not ALIAS_PATTERN.fullmatch(alias) or alias in known or aliases.count(alias) > 1
+        })
+        if bad_aliases:
+            raise UnknownColumnError(f"Invalid or clashing measure name(s): {', '.join(bad_aliases)}")
+        measures = [col for col in columns or [] if col in (aggregations or {})] + list(conditions)
+        for alias, ratio in ratios.items():
+            if len(ratio) not in (2, 3) or not set(ratio[:2]) <= set(measures):
+                raise UnknownColumnError(f"Ratio {alias!r} must divide two of the query's measures")
+            # The scale is inlined into the SQL as a float literal, which nan and inf are not
+            if len(ratio) == 3 and (not _is_number(ratio[2]) or not math.isfinite(ratio[2])):
+                raise UnknownColumnError(f"Ratio {alias!r} needs a finite numeric scale")
+
+        outputs = measures + list(ratios)
+        aggregated = bool(aggregations or conditions)
+        for name, operator, value in having or []:
+            if not aggregated or name not in outputs:
+                raise UnknownColumnError(f"HAVING can only compare the query's measures, not {name!r}")
+            if operator not in COMPARISON_OPERATORS:
+                raise UnknownColumnError(f"Unsupported comparison operator: {operator!r}")
+            if not isinstance(value, (Number, str)):
+                raise UnknownColumnError(f"HAVING {name} compares with an unsupported value: {value!r}")
+        sortable = list(group_by or []) + outputs if aggregated else list(columns or [])
+        for order in order_by or []:
+            name, direction = normalize_order(order)
+            if name not in sortable:
+                raise UnknownColumnError(f"Can only order by the query's output columns, not {name!r}")
+            if direction not in ORDER_DIRECTIONS:
+                raise UnknownColumnError(f"Unsupported sort direction: {direction!r}")
+        if limit is not None and (not isinstance(limit, int) or isinstance(limit, bool) or not 0 < limit <= MAX_LIMIT):
+            raise UnknownColumnError(f"LIMIT must be an integer between 1 and {MAX_LIMIT}")
+
+    def _check_value(self, tablename, column, value, what):
+        """Raise UnknownColumnError unless ``value`` can be compared with ``column`` as it is typed."""
+        dtype = self.column_dtype(tablename, column)
+        if dtype in ("int64", "float64"):
+            valid = _is_number(value)
+        elif dtype.startswith("datetime64"):
+            # Dates are also compared as 'YYYY-MM-DD' strings
+            valid = isinstance(value, (str, datetime.date))
+        else:
+            valid = isinstance(value, str)
+        if not valid:
+            raise UnknownColumnError(f"{what} compares a {dtype} column with an unsupported value: {value!r}")
+
+    def column_dtype(self, tablename, column):
+        """Target dtype of a raw column."""
+        if column in DTYPE_OVERRIDES:
+            return DTYPE_OVERRIDES[column]
+        return DATA_TYPE_DTYPES.get(self.columns(tablename).get(column), STRING_DTYPE)
+
+    def result_dtypes(self, tablename, result_columns, aggregations=None):
+        """Target dtype of every column query_data returns."""
+        aggregations = aggregations or {}
+        dtypes = {}
+        for col in result_columns:
+            func = aggregations.get(col, "").upper()
+            if func in ("SUM", "AVG"):
+                # MySQL returns DECIMAL for both, whatever the column type
+                dtypes[col] = "float64"
+            elif func == "COUNT":
+                dtypes[col] = "int64"
+            else:
+                dtypes[col] = self.column_dtype(tablename, col)
+                # Grouped results have one row per key, so there is nothing
+                # for a categorical to save; keep their labels as plain strings.
+                if dtypes[col] == STRING_DTYPE and aggregations:
+                    dtypes[col] = None
+        return dtypes
+
+
+def load_catalog(cursor, dialect=MYSQL):
+    """Read the report table columns visible to the current connection."""
+    cursor.execute(CATALOG_QUERIES[dialect.name], (TABLE_PATTERN,))
+    tables = {}
+    for row in cursor.fetchall():
+        # Some server/connector combinations return information_schema text as bytes
+        table, column, data_type = (v.decode() if isinstance(v, (bytes, bytearray)) else v for v in row)
+        # DuckDB reports parameterised types, e.g. DECIMAL(18,2)
+        tables.setdefault(table, {})[column] = data_type.lower().split("(")[0]
+    return SchemaCatalog(tables)
+
+
+@st.cache_resource
+def get_catalog():
+    """Schema catalog, loaded once per server process."""
+    backend = get_backend()
+    with backend.cursor() as cursor:
+        return load_catalog(cursor, backend.dialect)
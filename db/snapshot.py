@@ -0,0 +1,354 @@
+import argparse
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+from urllib.parse import quote, unquote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import streamlit as st
+
+from db.backend import MYSQL
+from db.fetch import fetch_frame
+from db.pool import get_pool
+from db.sql import build_where_clause
+from db.schema import load_catalog
+from db.watermark import FINGERPRINT_COLUMN
+
+DEFAULT_DIRECTORY = "snapshot"
+STATE_FILE = "_state.json"
+MAX_PARTS = 8  # files per partition before they are compacted into one
+
+
+def month_bounds(month):
+    """First and last day of a ``YYYY-MM`` month."""
+    first = date.fromisoformat(f"{month}-01")
+    last = (pd.Timestamp(first) + pd.offsets.MonthEnd(0)).date()
+    return first, last
+
+
+def frame_fingerprint(frame):
+    """(max report_date, rows, total) of a partition's rows, comparable with remote_fingerprints."""
+    total = float(frame[FINGERPRINT_COLUMN].sum()) if FINGERPRINT_COLUMN in frame else 0.0
+    return [str(pd.Timestamp(frame["report_date"].max()).date()), len(frame), total]
+
+
+def combine(a, b):
+    """Fingerprint of two disjoint sets of rows together."""
+    if a is None:
+        return b
+    return [max(a[0], b[0]), a[1] + b[1], a[2] + b[2]]
+
+
+def same_fingerprint(a, b):
+    # Totals are summed in a different order locally, so compare them with a tolerance
+    return a[0] == b[0] and a[1] == b[1] and math.isclose(a[2], b[2], rel_tol=1e-9, abs_tol=1e-6)
+
+
+def remote_fingerprints(cursor, table, columns, dialect=MYSQL):
+    """{(Campaign_code, month): [max report_date, rows, total]} of a table in the source database."""
+    total = f"SUM({dialect.quote(FINGERPRINT_COLUMN)})" if FINGERPRINT_COLUMN in columns else "0"
+    cursor.execute(
+        f"SELECT Campaign_code, YEAR(report_date), MONTH(report_date), MAX(report_date), COUNT(*), {total} "
+        f"FROM {table} WHERE Campaign_code IS NOT NULL AND report_date IS NOT NULL "
+        "GROUP BY Campaign_code, YEAR(report_date), MONTH(report_date)"
+    )
+    return {
+        (campaign, f"{year:04d}-{month:02d}"): [str(max_date), int(rows), float(total or 0)]
+        for campaign, year, month, max_date, rows, total in cursor.fetchall()
+    }
+
+
+class SnapshotStore:
+    """Parquet copy of the report tables on the app host.
+
+    Files live under ``<directory>/<table>/campaign=<code>/month=<YYYY-MM>/``,
+    so a query for one campaign and date range only opens the files of
+    those partitions. Each table's ``_state.json`` records the fingerprint
+    of every partition and the last synced report_date. Files are written
+    to a temporary name and renamed, so readers never see partial files.
+    """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def table_dir(self, table):
+        return os.path.join(self.directory, table)
+
+    def partition_dir(self, table, campaign, month):
+        return os.path.join(self.table_dir(table), f"campaign={quote(str(campaign), safe='')}", f"month={month}")
+
+    def load_state(self, table):
+        try:
+            with open(os.path.join(self.table_dir(table), STATE_FILE)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {"synced_through": None, "synced_at": None, "partitions": {}}
+
+    def state_mtime(self, table):
+        return os.stat(os.path.join(self.table_dir(table), STATE_FILE)).st_mtime
+
+    def save_state(self, table, state):
+        os.makedirs(self.table_dir(table), exist_ok=True)
+        path = os.path.join(self.table_dir(table), STATE_FILE)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def tables(self):
+        """Tables that have been synced at least once."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(n for n in names if os.path.exists(os.path.join(self.directory, n, STATE_FILE)))
+
+    def _write(self, directory, frame):
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        os.close(fd)
+        try:
+            frame.to_parquet(tmp_path, compression="zstd", index=False)
+            os.replace(tmp_path, os.path.join(directory, f"part-{time.time_ns()}.parquet"))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def append(self, table, campaign, month, frame):
+        """Add rows to a partition, compacting it once it has too many files."""
+        directory = self.partition_dir(table, campaign, month)
+        self._write(directory, frame)
+        parts = _parquet_files(directory)
+        if len(parts) > MAX_PARTS:
+            self.replace(table, campaign, month, pd.read_parquet(directory))
+
+    def replace(self, table, campaign, month, frame):
+        """Swap a partition's contents for ``frame``."""
+        directory = self.partition_dir(table, campaign, month)
+        os.makedirs(os.path.dirname(directory), exist_ok=True)
+        staging = tempfile.mkdtemp(dir=os.path.dirname(directory), prefix=".staging-")
+        try:
+            self._write(staging, frame)
+            old = None
+            if os.path.exists(directory):
+                old = f"{directory}.old-{time.time_ns()}"
+                os.replace(directory, old)
+            os.replace(staging, directory)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        if old is not None:
+            shutil.rmtree(old, ignore_errors=True)
+
+    def drop(self, table, campaign, month):
+        shutil.rmtree(self.partition_dir(table, campaign, month), ignore_errors=True)
+
+    def files(self, table, campaign=None, start_date=None, end_date=None):
+        """Parquet files that can hold rows for a campaign (or all) within a date range."""
+        table_dir = self.table_dir(table)
+        if campaign is not None:
+            campaign_dirs = [f"campaign={quote(str(campaign), safe='')}"]
+        else:
+            campaign_dirs = [n for n in _listdir(table_dir) if n.startswith("campaign=")]
+        files = []
+        for campaign_dir in campaign_dirs:
+            for month_dir in _listdir(os.path.join(table_dir, campaign_dir)):
+                if not month_dir.startswith("month=") or ".old-" in month_dir:
+                    continue
+                first, last = month_bounds(month_dir[len("month="):])
+                if (start_date and last < pd.Timestamp(start_date).date()) or (
+                    end_date and first > pd.Timestamp(end_date).date()
+                ):
+                    continue
+                files += _parquet_files(os.path.join(table_dir, campaign_dir, month_dir))
+        return files
+
+    def read(self, table, columns, campaign=None, start_date=None, end_date=None):
+        """Rows of a table from the snapshot, reading only the requested columns and partitions."""
+        files = self.files(table, campaign, start_date, end_date)
+        if not files:
+            return pd.DataFrame(columns=columns)
+        dataset = ds.dataset(files, format="parquet")
+        date_type = dataset.schema.field("report_date").type
+        condition = ds.scalar(True)
+        if start_date:
+            condition &= ds.field("report_date") >= pa.scalar(pd.Timestamp(start_date), type=date_type)
+        if end_date:
+            condition &= ds.field("report_date") <= pa.scalar(pd.Timestamp(end_date), type=date_type)
+        return dataset.to_table(columns=list(columns), filter=condition).to_pandas()
+
+    def partitions(self, table):
+        """{(campaign, month)} present on disk."""
+        found = set()
+        table_dir = self.table_dir(table)
+        for campaign_dir in _listdir(table_dir):
+            if not campaign_dir.startswith("campaign="):
+                continue
+            for month_dir in _listdir(os.path.join(table_dir, campaign_dir)):
+                if month_dir.startswith("month=") and ".old-" not in month_dir:
+                    found.add((unquote(campaign_dir[len("campaign="):]), month_dir[len("month="):]))
+        return found
+
+
+class SnapshotSync:
+    """Mirrors report tables from MySQL into a SnapshotStore.
+
+    Each run first pulls only rows newer than the last synced report_date
+    and appends them to their partitions, then compares every partition's
+    fingerprint (latest date, row count, total Cost) with MySQL and
+    re-pulls the partitions that still differ, e.g. because older rows
+    were restated or deleted.
+    """
+
+    def __init__(self, store, cursor, catalog, dialect=MYSQL):
+        self.store = store
+        self.cursor = cursor
+        self.catalog = catalog
+        self.dialect = dialect
+
+    def _pull(self, table, filters, start_date=None, end_date=None):
+        columns = list(self.catalog.columns(table))
+        where_clause, values = build_where_clause(filters, start_date, end_date, self.dialect)
+        conditions = "Campaign_code IS NOT NULL AND report_date IS NOT NULL"
+        where_clause = f"{where_clause} AND {conditions}" if where_clause else f" WHERE {conditions}"
+        self.cursor.execute(
+            f"SELECT {', '.join(self.dialect.quote(c) for c in columns)} FROM {table}{where_clause}", tuple(values)
+        )
+        dtypes = {c: self.catalog.column_dtype(table, c) for c in columns}
+        frame = fetch_frame(self.cursor, columns, dtypes)
+        for col, dtype in dtypes.items():
+            if dtype == "int64" and frame[col].dtype.kind == "f":
+                # Integer columns with NULLs; keep the Parquet type stable across files
+                frame[col] = frame[col].astype("Int64")
+            elif dtype == "category":
+                # Parquet dictionary-encodes strings anyway, and plain strings
+                # keep files written at different times compatible
+                frame[col] = frame[col].astype(object)
+        return frame
+
+    @staticmethod
+    def _split(frame):
+        """{(campaign, month): rows} of a pulled frame."""
+        if frame.empty:
+            return {}
+        months = frame["report_date"].dt.strftime("%Y-%m")
+        return {
+            (campaign, month): group.reset_index(drop=True)
+            for (campaign, month), group in frame.groupby([frame["Campaign_code"], months], sort=False)
+        }
+
+    def sync_table(self, table, full=False):
+        """Bring one table's snapshot up to date; returns counts of what was done."""
+        state = {"synced_through": None, "partitions": {}} if full else self.store.load_state(table)
+        expected = {
+            (campaign, month): fingerprint
+            for campaign, months in state["partitions"].items()
+            for month, fingerprint in months.items()
+        }
+        # Partitions on disk must match the state, or they can't be trusted
+        for campaign, month in self.store.partitions(table) - expected.keys():
+            self.store.drop(table, campaign, month)
+        stats = {"appended_rows": 0, "repulled": 0, "dropped": 0}
+
+        # 1. Rows newer than anything synced so far
+        if state["synced_through"] and expected:
+            since = date.fromisoformat(state["synced_through"]) + timedelta(days=1)
+            for (campaign, month), rows in self._split(self._pull(table, {}, start_date=since)).items():
+                self.store.append(table, campaign, month, rows)
+                expected[(campaign, month)] = combine(expected.get((campaign, month)), frame_fingerprint(rows))
+                stats["appended_rows"] += len(rows)
+
+        # 2. Partitions that still differ from MySQL are pulled again in full
+        remote = remote_fingerprints(self.cursor, table, self.catalog.columns(table), self.dialect)
+        for key in expected.keys() - remote.keys():
+            self.store.drop(table, *key)
+            del expected[key]
+            stats["dropped"] += 1
+        stale = {}
+        for key, fingerprint in remote.items():
+            if key not in expected or not same_fingerprint(expected[key], fingerprint):
+                stale.setdefault(key[0], []).append(key[1])
+        for campaign, months in stale.items():
+            # One query per campaign, covering all of its stale months
+            start, _ = month_bounds(min(months))
+            _, end = month_bounds(max(months))
+            pulled = self._split(self._pull(table, {"Campaign_code": campaign}, start, end))
+            for month in months:
+                rows = pulled.get((campaign, month))
+                if rows is None:
+                    self.store.drop(table, campaign, month)
+                    expected.pop((campaign, month), None)
+                    continue
+                self.store.replace(table, campaign, month, rows)
+                expected[(campaign, month)] = frame_fingerprint(rows)
+                stats["repulled"] += 1
+
+        partitions = {}
+        for (campaign, month), fingerprint in expected.items():
+            partitions.setdefault(campaign, {})[month] = fingerprint
+        self.store.save_state(table, {
+            "synced_through": max((fp[0] for fp in expected.values()), default=None),
+            "synced_at": time.time(),
+            "partitions": partitions,
+        })
+        return stats
+
+
+def _parquet_files(directory):
+    return sorted(os.path.join(directory, n) for n in _listdir(directory) if n.endswith(".parquet"))
+
+
+def _listdir(directory):
+    try:
+        return os.listdir(directory)
+    except FileNotFoundError:
+        return []
+
+
+@st.cache_resource
+def get_snapshot_store():
+    """Snapshot store configured by ``[snapshot] dir``."""
+    return SnapshotStore(st.secrets.get("snapshot", {}).get("dir", DEFAULT_DIRECTORY))
+
+
+def main():
+    """Admin entry point: ``python -m db.snapshot sync|status [--table T] [--full]``.
+
+    Run ``sync`` from cron (e.g. after the nightly report load).
+    """
+    parser = argparse.ArgumentParser(description="Mirror the report tables into local Parquet files.")
+    parser.add_argument("command", choices=["sync", "status"])
+    parser.add_argument("--table", action="append", help="default: every report_campaign_* table")
+    parser.add_argument("--full", action="store_true", help="re-pull every partition")
+    args = parser.parse_args()
+
+    store = SnapshotStore(st.secrets.get("snapshot", {}).get("dir", DEFAULT_DIRECTORY))
+    if args.command == "status":
+        for table in args.table or store.tables():
+            state = store.load_state(table)
+            synced_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(state["synced_at"])) if state["synced_at"] else "never"
+            partitions = sum(len(months) for months in state["partitions"].values())
+            print(f"{table}: {partitions} partitions through {state['synced_through']}, synced {synced_at}")
+        return
+
+    with get_pool().cursor() as cursor:
+        catalog = load_catalog(cursor)
+        sync = SnapshotSync(store, cursor, catalog)
+        for table in args.table or sorted(catalog.tables):
+            started = time.monotonic()
+            stats = sync.sync_table(table, full=args.full)
+            print(
+                f"{table}: {stats['appended_rows']} new rows, {stats['repulled']} partitions re-pulled, "
+                f"{stats['dropped']} dropped ({time.monotonic() - started:.1f}s)"
+            )
+
+
+if __name__ == "__main__":
+    main()
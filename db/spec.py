@@ -0,0 +1,153 @@
+from dataclasses import dataclass, replace
+
+
+def sum_column(col):
+    """Name of the hidden SUM(col) column stored alongside an AVG measure."""
+    return f"{col}__sum"
+
+
+def count_column(col):
+    """Name of the hidden COUNT(col) column stored alongside an AVG measure."""
+    return f"{col}__count"
+
+
+def min_column(col):
+    """Name of the MIN(col) column kept in rollup tables for extreme-value columns."""
+    return f"{col}__min"
+
+
+def max_column(col):
+    """Name of the MAX(col) column kept in rollup tables for extreme-value columns."""
+    return f"{col}__max"
+
+
+def normalize_filter(value):
+    """Canonical filter value: lists become sorted tuples, and a single-item list the item itself.
+
+    So ``["A"]`` and ``"A"`` share a cache entry, as do lists in any order.
+    """
+    if isinstance(value, (list, tuple, set, frozenset)):
+        values = tuple(sorted(set(value)))
+        return values[0] if len(values) == 1 else values
+    return value
+
+
+def normalize_order(order):
+    """(name, ASC|DESC) from an order_by entry, which may be just a name."""
+    if isinstance(order, str):
+        return order, "ASC"
+    name, direction = order
+    return name, direction.upper()
+
+
+@dataclass(frozen=True)
+class QuerySpec:
+    """Canonical form of a query_data call.
+
+    Column, filter, measure and group-by order never change what a query
+    returns, only how it is laid out, so they are stored sorted; two calls
+    that differ only in ordering get equal (and equally hashed) specs and
+    share one cache entry. The caller's column order is reapplied when the
+    result is projected (see ``result_columns``).
+    """
+
+    table: str
+    columns: tuple = ()       # raw (non-aggregated) columns
+    filters: tuple = ()       # (column, value) equality filters
+    start_date: object = None
+    end_date: object = None
+    measures: tuple = ()      # (column, FUNC) aggregates
+    group_by: tuple = ()
+    conditionals: tuple = ()  # (alias, FUNC, column, ((column, value), ...)): FUNC(CASE WHEN ... THEN column END)
+    ratios: tuple = ()        # (alias, numerator, denominator, scale) over measure or conditional names
+    having: tuple = ()        # (name, operator, value) on measure, conditional or ratio names
+    order_by: tuple = ()      # (name, ASC|DESC), in the caller's order
+    limit: int = None
+
+    @classmethod
+    def from_call(cls, columns, tablename, filters, start_date=None, end_date=None, aggregations=None, group_by=None,
+                  conditions=None, ratios=None, having=None, order_by=None, limit=None):
+        """Build the spec for a query_data(...) call."""
+        filters = tuple(sorted((col, normalize_filter(value)) for col, value in (filters or {}).items()))
+        extras = dict(
+            having=tuple(sorted(tuple(h) for h in having or ())),
+            order_by=tuple(normalize_order(order) for order in order_by or ()),
+            limit=limit,
+        )
+        if aggregations or conditions:
+            aggregations = aggregations or {}
+            measures = tuple(sorted((col, aggregations[col].upper()) for col in columns if col in aggregations))
+            return cls(
+                tablename, (), filters, start_date, end_date, measures, tuple(sorted(set(group_by or []))),
+                conditionals=tuple(sorted(
+                    (alias, func.upper(), col, tuple(sorted(when.items())))
+                    for alias, (func, col, when) in (conditions or {}).items()
+                )),
+                ratios=tuple(sorted(
+                    (alias, *ratio[:2], ratio[2] if len(ratio) > 2 else 1) for alias, ratio in (ratios or {}).items()
+                )),
+                **extras,
+            )
+        return cls(tablename, tuple(sorted(set(columns))), filters, start_date, end_date, **extras)
+
+    @staticmethod
+    def result_columns(columns, aggregations=None, group_by=None, conditions=None, ratios=None):
+        """Column order query_data has always returned for a call; conditional and ratio measures come last."""
+        if aggregations or conditions:
+            return (
+                list(group_by or []) + [col for col in columns if col in (aggregations or {})]
+                + list(conditions or {}) + list(ratios or {})
+            )
+        return list(columns)
+
+    @property
+    def aggregated(self):
+        return bool(self.measures or self.conditionals)
+
+    @property
+    def simple(self):
+        """True if the spec only has per-column aggregates, so its result can be rolled up or combined.
+
+        Conditional and ratio measures, HAVING, ORDER BY and LIMIT are only
+        ever computed by the database (or DuckDB over the snapshot).
+        """
+        return not (self.conditionals or self.ratios or self.having or self.order_by or self.limit is not None)
+
+    @property
+    def filter_dict(self):
+        return dict(self.filters)
+
+    @property
+    def campaign(self):
+        """The single Campaign_code the spec is restricted to, if any (used to tag cache entries)."""
+        campaign = self.filter_dict.get("Campaign_code")
+        return None if isinstance(campaign, tuple) else campaign
+
+    @property
+    def campaigns(self):
+        """Campaign_codes the spec is restricted to, as a tuple; None if it isn't."""
+        campaign = self.filter_dict.get("Campaign_code")
+        if campaign is None:
+            return None
+        return campaign if isinstance(campaign, tuple) else (campaign,)
+
+    def with_filter(self, column, value):
+        """Copy of the spec with ``column`` filtered on ``value`` instead."""
+        filters = dict(self.filters)
+        filters[column] = normalize_filter(value)
+        return replace(self, filters=tuple(sorted(filters.items())))
+
+    def stored_columns(self):
+        """Columns of the frame kept in the cache for this spec.
+
+        AVG measures carry their SUM and COUNT so coarser queries can be
+        answered from the result by re-aggregating it.
+        """
+        if not self.aggregated:
+            return list(self.columns)
+        stored = list(self.group_by) + [col for col, _ in self.measures]
+        stored += [alias for alias, *_ in self.conditionals] + [alias for alias, *_ in self.ratios]
+        for col, func in self.measures:
+            if func == "AVG":
+                stored += [sum_column(col), count_column(col)]
+        return stored
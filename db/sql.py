@@ -0,0 +1,135 @@
+from db.backend import MYSQL
+from db.spec import count_column, max_column, min_column, sum_column
+
+
+def build_where_clause(filters, start_date=None, end_date=None, dialect=MYSQL):
+    where_clauses = []
+    values = []
+    p = dialect.placeholder
+
+    for col, val in filters.items():
+        if isinstance(val, (list, tuple)):
+            # Multi-value filter; an empty list matches nothing
+            placeholders = ", ".join([p] * len(val))
+            where_clauses.append(f"{dialect.quote(col)} IN ({placeholders})" if val else "1 = 0")
+            values.extend(val)
+        else:
+            where_clauses.append(f'{dialect.quote(col)} = {p}')
+            values.append(val)
+
+    if start_date:
+        where_clauses.append(f"report_date >= {p}")
+        values.append(start_date)
+    if end_date:
+        where_clauses.append(f"report_date <= {p}")
+        values.append(end_date)
+
+    clause = f" WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+    return clause, values
+
+
+def measure_expressions(spec, dialect=MYSQL):
+    """{output name: (SQL expression, parameters)} of every measure of an aggregated spec.
+
+    Conditional measures compare with parameters, ratios reuse the
+    expressions they divide and yield NULL instead of dividing by zero.
+    """
+    q = dialect.quote
+    p = dialect.placeholder
+    expressions = {col: (f"{func}({q(col)})", []) for col, func in spec.measures}
+    for alias, func, col, when in spec.conditionals:
+        test = " AND ".join(f"{q(c)} = {p}" for c, _ in when)
+        expressions[alias] = (f"{func}(CASE WHEN {test} THEN {q(col)} END)", [value for _, value in when])
+    for alias, numerator, denominator, scale in spec.ratios:
+        (top, top_values), (bottom, bottom_values) = expressions[numerator], expressions[denominator]
+        expression = f"{top} / NULLIF({bottom}, 0)"
+        if scale != 1:
+            expression = f"{expression} * {float(scale)!r}"
+        expressions[alias] = (expression, top_values + bottom_values)
+    return expressions
+
+
+def build_query(spec, dialect=MYSQL, timeout=None, source=None):
+    """SQL text and parameters for a spec; selects ``spec.stored_columns()`` in order.
+
+    ``timeout`` (seconds) is enforced by the server where the dialect supports it.
+    ``source`` replaces the table name in the FROM clause (e.g. a Parquet scan).
+    """
+    q = dialect.quote
+    p = dialect.placeholder
+    select_values = []
+    expressions = {}
+    if spec.aggregated:
+        expressions = measure_expressions(spec, dialect)
+        select_parts = [q(col) for col in spec.group_by]
+        for name in spec.stored_columns()[len(spec.group_by):]:
+            if name in expressions:
+                expression, params = expressions[name]
+                select_parts.append(f"{expression} AS {q(name)}")
+                select_values += params
+        # AVG is computed from these after the fetch (see execute)
+        for col, func in spec.measures:
+            if func == "AVG":
+                select_parts += [f"SUM({q(col)}) AS {q(sum_column(col))}", f"COUNT({q(col)}) AS {q(count_column(col))}"]
+    else:
+        select_parts = [q(col) for col in spec.columns]
+
+    where_clause, values = build_where_clause(spec.filter_dict, spec.start_date, spec.end_date, dialect)
+    values = select_values + values
+    hint = dialect.timeout_hint(timeout)
+    query = f"SELECT {hint}{', '.join(select_parts)} FROM {source or spec.table}{where_clause}"
+    if spec.aggregated and spec.group_by:
+        query += " GROUP BY " + ", ".join(q(col) for col in spec.group_by)
+    if spec.having:
+        conditions = []
+        for name, operator, value in spec.having:
+            expression, params = expressions[name]
+            conditions.append(f"{expression} {operator} {p}")
+            values += params + [value]
+        query += " HAVING " + " AND ".join(conditions)
+    if spec.order_by:
+        orders = []
+        for name, direction in spec.order_by:
+            # Measures are ordered by their expression, which can't be confused with a column of the same name
+            expression, params = expressions.get(name, (q(name), []))
+            orders.append(f"{expression} {direction}")
+            values += params
+        query += " ORDER BY " + ", ".join(orders)
+    if spec.limit is not None:
+        query += f" LIMIT {int(spec.limit)}"
+    return query, values
+
+
+def build_rollup_query(spec, rollup, dialect=MYSQL, timeout=None):
+    """Like build_query, but reads the spec's answer from a covering rollup table (see db.navigator).
+
+    SUM comes from summing the rollup's ``__sum`` columns and COUNT from its
+    ``__count`` columns; AVG's helper columns are rebuilt the same way.
+    MIN and MAX of extreme columns come from their ``__min``/``__max`` columns.
+    """
+    q = dialect.quote
+    select_parts = [q(col) for col in spec.group_by]
+    for col, func in spec.measures:
+        if func == "COUNT":
+            select_parts.append(f"COALESCE(SUM({q(count_column(col))}), 0) AS {q(col)}")
+        elif func == "AVG":
+            select_parts.append(f"SUM({q(sum_column(col))}) / SUM({q(count_column(col))}) AS {q(col)}")
+        elif func == "MIN":
+            select_parts.append(f"MIN({q(min_column(col))}) AS {q(col)}")
+        elif func == "MAX":
+            select_parts.append(f"MAX({q(max_column(col))}) AS {q(col)}")
+        else:
+            select_parts.append(f"SUM({q(sum_column(col))}) AS {q(col)}")
+    for col, func in spec.measures:
+        if func == "AVG":
+            select_parts += [
+                f"SUM({q(sum_column(col))}) AS {q(sum_column(col))}",
+                f"SUM({q(count_column(col))}) AS {q(count_column(col))}",
+            ]
+
+    where_clause, values = build_where_clause(spec.filter_dict, spec.start_date, spec.end_date, dialect)
+    hint = dialect.timeout_hint(timeout)
+    query = f"SELECT {hint}{', '.join(select_parts)} FROM {rollup.name}{where_clause}"
+    if spec.group_by:
+        query += " GROUP BY " + ", ".join(q(col) for col in spec.group_by)
+    return query, values
@@ -0,0 +1,179 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import streamlit as st
+
+from db.cache import get_cache
+from db.backend import get_backend
+
+logger = logging.getLogger(__name__)
+
+# Report tables whose cached results are invalidated from watermarks
+WATCHED_TABLES = [
+    "report_campaign_overall_total",
+    "report_campaign_overall_total_notcs",
+    "report_campaign_creative",
+    "report_campaign_region_api2",
+]
+# Measure summed into each campaign's fingerprint so restated numbers are
+# noticed even when no rows are added
+FINGERPRINT_COLUMN = "Cost"
+DEFAULT_INTERVAL = 5 * 60  # seconds between probes
+WATERMARK_FILE = "_watermarks.json"  # kept next to the disk cache entries
+
+
+def probe(cursor, table):
+    """Per-campaign fingerprint of a report table: {Campaign_code: (max date, rows, total)}.
+
+    Values are kept as strings so fingerprints survive a JSON round trip.
+    """
+    cursor.execute(
+        f"SELECT Campaign_code, MAX(report_date), COUNT(*), SUM({FINGERPRINT_COLUMN}) "
+        f"FROM {table} GROUP BY Campaign_code"
+    )
+    return {
+        campaign: (str(max_date), str(rows), str(total))
+        for campaign, max_date, rows, total in cursor.fetchall()
+    }
+
+
+def changed_campaigns(previous, current):
+    """Campaigns whose fingerprint differs between two probes (including new and removed ones)."""
+    return {
+        campaign
+        for campaign in previous.keys() | current.keys()
+        if previous.get(campaign) != current.get(campaign)
+    }
+
+
+class WatermarkMonitor:
+    """Background poller that invalidates cached results when their data changes.
+
+    Each interval it fingerprints every watched table per Campaign_code and
+    drops only the cache entries for the (table, campaign) pairs that
+    changed, plus that table's cross-campaign entries. Results for
+    campaigns whose flight has ended never change, so they stay cached.
+
+    With read replicas, the probe and the re-query after an invalidation
+    may run on different replicas, each up to ``max_read_lag`` seconds
+    behind; the re-query could then cache the data from before the change.
+    So what is invalidated is invalidated again ``max_read_lag`` seconds
+    later, when every replica serving reads has the change.
+    """
+
+    def __init__(self, cache, interval=DEFAULT_INTERVAL, tables=WATCHED_TABLES, max_read_lag=0):
+        self.cache = cache
+        self.interval = interval
+        self.tables = list(tables)
+        self.max_read_lag = max_read_lag
+        self.watermarks = self._load()  # table -> last probe result
+        self._rechecks = []  # [(monotonic due time, table, campaign or None)] to invalidate again
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="watermark-monitor", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _watermark_path(self):
+        if self.cache.disk is None:
+            return None
+        return os.path.join(self.cache.disk.directory, WATERMARK_FILE)
+
+    def _load(self):
+        """Watermarks persisted with the disk cache, so a restart only invalidates real changes."""
+        path = self._watermark_path()
+        if path is None:
+            return {}
+        try:
+            with open(path) as f:
+                stored = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        return {
+            table: {campaign: tuple(fingerprint) for campaign, fingerprint in campaigns.items()}
+            for table, campaigns in stored.items()
+        }
+
+    def _save(self):
+        path = self._watermark_path()
+        if path is None:
+            return
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.watermarks, f)
+        os.replace(tmp_path, path)
+
+    def _invalidate(self, table, campaign=None):
+        self.cache.invalidate(table=table, campaign=campaign)
+        if self.max_read_lag:
+            self._rechecks.append((time.monotonic() + self.max_read_lag, table, campaign))
+
+    def invalidate_again(self):
+        """Repeat the invalidations that have waited out the replicas' lag; returns how many."""
+        now = time.monotonic()
+        due = [recheck for recheck in self._rechecks if recheck[0] <= now]
+        self._rechecks = [recheck for recheck in self._rechecks if recheck[0] > now]
+        for _, table, campaign in due:
+            self.cache.invalidate(table=table, campaign=campaign)
+        return len(due)
+
+    def poll(self, cursor):
+        """Probe every table once and invalidate what changed; returns {table: campaigns}."""
+        changes = {}
+        for table in self.tables:
+            current = probe(cursor, table)
+            previous = self.watermarks.get(table)
+            self.watermarks[table] = current
+            if previous is None:
+                # First probe establishes the baseline; anything cached
+                # before it can't be vouched for, so start clean.
+                self._invalidate(table)
+                continue
+            campaigns = changed_campaigns(previous, current)
+            for campaign in campaigns:
+                self._invalidate(table, campaign)
+            if campaigns:
+                changes[table] = campaigns
+        self._save()
+        return changes
+
+    def _run(self):
+        next_poll = time.monotonic()
+        while True:
+            if time.monotonic() >= next_poll:
+                next_poll = time.monotonic() + self.interval
+                try:
+                    with get_backend().cursor() as cursor:
+                        changes = self.poll(cursor)
+                    for table, campaigns in changes.items():
+                        logger.info("Invalidated cached %s results for %d campaign(s)", table, len(campaigns))
+                except Exception:
+                    logger.exception("Watermark probe failed")
+            try:
+                self.invalidate_again()
+            except Exception:
+                logger.exception("Repeated invalidation failed")
+            wake = min([next_poll] + [due for due, _, _ in self._rechecks])
+            if self._stop.wait(max(0.0, wake - time.monotonic())):
+                return
+
+
+@st.cache_resource
+def start_watermark_monitor():
+    """Start the watermark poller once per server process (disable with watermark_interval = 0)."""
+    settings = st.secrets.get("cache", {})
+    interval = settings.get("watermark_interval", DEFAULT_INTERVAL)
+    if not interval:
+        return None
+    cache = get_cache()
+    # Campaign results are now invalidated when their data changes, so the
+    # TTL only needs to bound how long a watched entry can possibly live.
+    cache.watch(WATCHED_TABLES, max_age=settings.get("watermark_max_age"))
+    return WatermarkMonitor(cache, interval=interval, max_read_lag=get_backend().max_read_lag).start()
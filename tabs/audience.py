@@ -3,6 +3,44 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from streamlit_extras.stylable_container import stylable_container
+from components import campaign_title
+
+def audience_query(active_filters, start_date, end_date):
+    """query_data arguments for the Audience x Region plan/actual breakdown."""
+    columns = [
+        "Audience", "Region", "impression_plan", "Impression", "reach_plan", "reach",
+        "net_media_cost", "Cost", "views_plan", "Views", "click_plan", "Clicks",
+        "plan_active_day", "active_day", "Engagements", "23s_Video_Views", 
+        "Video_Plays_100", "ctr_estimate", "er_estimate", "sessions", "add_to_carts", 
+        "ecommerce_purchases"
+    ]
+    
+    # Query data from database
+    return dict(
+        columns=columns,
+        tablename="report_campaign_overall_total",
+        filters=active_filters,
+        start_date=start_date,
+        end_date=end_date,
+        aggregations={
+            # Plan data (average)
+            "impression_plan": "AVG", "reach_plan": "AVG", "net_media_cost": "AVG",
+            "views_plan": "AVG", "click_plan": "AVG", "plan_active_day": "AVG",
+            "ctr_estimate": "AVG", "er_estimate": "AVG",
+            # Actual data (sum)
+            "Impression": "SUM", "reach": "SUM", "Cost": "SUM", "Views": "SUM", 
+            "Clicks": "SUM", "active_day": "SUM", "Engagements": "SUM", 
+            "23s_Video_Views": "SUM", "Video_Plays_100": "SUM", "sessions": "SUM",
+            "add_to_carts": "SUM", "ecommerce_purchases": "SUM"
+        },
+        group_by=["Audience", "Region"]
+    )
+
+
+def queries(active_filters, start_date, end_date, selected_platform):
+    """Every query display() makes, declared up front so they can run concurrently."""
+    return [audience_query(active_filters, start_date, end_date)]
+
 
 def display(query_data, active_filters, start_date, end_date, selected_platform):
     with stylable_container(
@@ -14,7 +52,7 @@ def display(query_data, active_filters, start_date, end_date, selected_platform)
             """,
     ):
         # Get campaign from active_filters or use default
-        campaign_name = active_filters.get("Campaign_code", "All Campaigns")
+        campaign_name = campaign_title(active_filters)
         
         # Stylable title with custom CSS
         st.markdown(
@@ -52,34 +90,7 @@ def display(query_data, active_filters, start_date, end_date, selected_platform)
         )
 
         # Get real audience data from database
-        columns = [
-            "Audience", "Region", "impression_plan", "Impression", "reach_plan", "reach",
-            "net_media_cost", "Cost", "views_plan", "Views", "click_plan", "Clicks",
-            "plan_active_day", "active_day", "Engagements", "23s_Video_Views", 
-            "Video_Plays_100", "ctr_estimate", "er_estimate", "sessions", "add_to_carts", 
-            "ecommerce_purchases"
-        ]
-        
-        # Query data from database
-        df = query_data(
-            columns=columns,
-            tablename="report_campaign_overall_total",
-            filters=active_filters,
-            start_date=start_date,
-            end_date=end_date,
-            aggregations={
-                # Plan data (average)
-                "impression_plan": "AVG", "reach_plan": "AVG", "net_media_cost": "AVG",
-                "views_plan": "AVG", "click_plan": "AVG", "plan_active_day": "AVG",
-                "ctr_estimate": "AVG", "er_estimate": "AVG",
-                # Actual data (sum)
-                "Impression": "SUM", "reach": "SUM", "Cost": "SUM", "Views": "SUM", 
-                "Clicks": "SUM", "active_day": "SUM", "Engagements": "SUM", 
-                "23s_Video_Views": "SUM", "Video_Plays_100": "SUM", "sessions": "SUM",
-                "add_to_carts": "SUM", "ecommerce_purchases": "SUM"
-            },
-            group_by=["Audience", "Region"]
-        )
+        df = query_data(**audience_query(active_filters, start_date, end_date))
         
         if df.empty:
             st.warning("No data available for the selected filters.")
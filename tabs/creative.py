@@ -3,6 +3,45 @@ import pandas as pd
 import altair as alt
 from streamlit_extras.stylable_container import stylable_container
 from st_aggrid import AgGrid, GridOptionsBuilder
+from components import campaign_title
+
+PLATFORMS = ["Facebook", "Google", "Tiktok"]
+
+
+def platform_query(platform_name, active_filters, start_date, end_date):
+    """query_data arguments for one platform's raw creative rows."""
+    platform_filters = active_filters.copy()
+    platform_filters["Platform"] = platform_name
+
+    query_columns = ["Format", "Creative_Type", "Creative_Length", "Content", "Clicks", "Impression", "ctr_bm"]
+    return dict(
+        columns=query_columns,
+        tablename="report_campaign_creative",
+        filters=platform_filters,
+        start_date=start_date,
+        end_date=end_date
+    )
+
+
+def grid_query(active_filters, start_date, end_date):
+    """query_data arguments for the creative performance AgGrid table."""
+    return dict(
+        columns=["Format", "Creative_Type", "Creative_Length", "Platform", "Region", "Audience", "Cost", "Impression", "Clicks", "ctr_bm"],
+        tablename="report_campaign_creative",
+        filters=active_filters,
+        start_date=start_date,
+        end_date=end_date,
+        aggregations={"Cost": "SUM", "Impression": "SUM", "Clicks": "SUM", "ctr_bm": "AVG"},
+        group_by=["Format", "Creative_Type", "Creative_Length", "Platform", "Region", "Audience"]
+    )
+
+
+def queries(active_filters, start_date, end_date):
+    """Every query display() makes, declared up front so they can run concurrently."""
+    return [
+        platform_query(platform, active_filters, start_date, end_date) for platform in PLATFORMS
+    ] + [grid_query(active_filters, start_date, end_date)]
+
 
 def generate_platform_analysis(platform_name, query_data, active_filters, start_date, end_date):
     """
@@ -33,17 +72,7 @@ def generate_platform_analysis(platform_name, query_data, active_filters, start_
             )
 
         # --- Data Fetching and Processing ---
-        platform_filters = active_filters.copy()
-        platform_filters["Platform"] = platform_name
-
-        query_columns = ["Format", "Creative_Type", "Creative_Length", "Content", "Clicks", "Impression", "ctr_bm"]
-        df_platform = query_data(
-            columns=query_columns,
-            tablename="report_campaign_creative",
-            filters=platform_filters,
-            start_date=start_date,
-            end_date=end_date
-        )
+        df_platform = query_data(**platform_query(platform_name, active_filters, start_date, end_date))
 
         if df_platform.empty:
             st.warning(f"No data available for {platform_name} with the current filters.")
@@ -66,7 +95,7 @@ def generate_platform_analysis(platform_name, query_data, active_filters, start_
         header_cols[-1].markdown(f"**{metric_choice} Chart by Content**")
 
         # Group data by the three attributes to create a separate row for each combination
-        grouped = df_platform.groupby(["Format", "Creative_Type", "Creative_Length"])
+        grouped = df_platform.groupby(["Format", "Creative_Type", "Creative_Length"], observed=True)
 
         for (format_val, type_val, length_val), group_df in grouped:
             # For each group, create a row in the UI
@@ -91,7 +120,7 @@ def generate_platform_analysis(platform_name, query_data, active_filters, start_
                     continue
 
                 # Aggregate summary CTR and ctr_bm by Content
-                agg_df = group_df.groupby("Content").agg({
+                agg_df = group_df.groupby("Content", observed=True).agg({
                     "CTR": "mean",
                     "ctr_bm": "mean" if "ctr_bm" in group_df.columns else "min"
                 }).reset_index()
@@ -140,7 +169,7 @@ def display(query_data, active_filters, start_date, end_date):
             }
             """,
     ):
-        campaign_name = active_filters.get("Campaign_code", "All Campaigns")
+        campaign_name = campaign_title(active_filters)
                 # Stylable title with custom CSS
         st.markdown(
             f"""
@@ -176,20 +205,11 @@ def display(query_data, active_filters, start_date, end_date):
             unsafe_allow_html=True
         )
 
-        platforms_to_show = ["Facebook", "Google", "Tiktok"]
-        for platform in platforms_to_show:
+        for platform in PLATFORMS:
             generate_platform_analysis(platform, query_data, active_filters, start_date, end_date)
 
         st.subheader("Creative Performance Data")
-        aggrid_df = query_data(
-            columns=["Format", "Creative_Type", "Creative_Length", "Platform", "Region", "Audience", "Cost", "Impression", "Clicks", "ctr_bm"],
-            tablename="report_campaign_creative",
-            filters=active_filters,
-            start_date=start_date,
-            end_date=end_date,
-            aggregations={"Cost": "SUM", "Impression": "SUM", "Clicks": "SUM", "ctr_bm": "AVG"},
-            group_by=["Format", "Creative_Type", "Creative_Length", "Platform", "Region", "Audience"]
-        )
+        aggrid_df = query_data(**grid_query(active_filters, start_date, end_date))
 
         if not aggrid_df.empty:
             gb = GridOptionsBuilder.from_dataframe(aggrid_df)
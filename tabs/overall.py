@@ -4,10 +4,10 @@ from st_aggrid import JsCode, AgGrid, GridOptionsBuilder, ColumnsAutoSizeMode
 from streamlit_extras.stylable_container import stylable_container
 import plotly.express as px
 import plotly.graph_objects as go
-from components import kpi_card, styled_metric_card_with_bar, styled_kpi_card, styled_kpi_card
+from components import campaign_title, kpi_card, styled_metric_card_with_bar, styled_kpi_card, styled_kpi_card
 
-def display(query_data, active_filters, min_date, max_date):
-    # Query summary data from the first table
+def summary_query(active_filters, min_date, max_date):
+    """query_data arguments for the campaign-level summary behind the KPI cards."""
     summary_columns = [
         "net_media_cost", "Cost", "plan_active_day", "active_day", "Impression", 
         "Engagements", "Clicks", "Views", "impression_plan", "engagement_plan", 
@@ -15,7 +15,7 @@ def display(query_data, active_filters, min_date, max_date):
         "Plan_Start_Date", "Plan_End_Date"
     ]
 
-    summary_df = query_data(
+    return dict(
         columns=summary_columns,
         tablename="report_campaign_overall_total_notcs",
         filters=active_filters,
@@ -31,14 +31,13 @@ def display(query_data, active_filters, min_date, max_date):
         },
         group_by=[]
     )
-    
-    if summary_df.empty:
-        st.warning("No data available for the selected filters.")
-        return
-        
+
+
+def detail_query(active_filters, min_date, max_date):
+    """query_data arguments for the dimension breakdown shown in the AgGrid table."""
     # Query detailed data for the AgGrid table with enhanced dimensions and metrics
     # First, let's get the data grouped by dimensions
-    dimension_columns = ["Funnel", "Brand", "Platform", "Region", "Format", "Audience", "Buying_Type", "Plan_Start_Date", "Plan_End_Date", "KPI_Metric "]
+    dimension_columns = ["Funnel", "Brand", "Platform", "Region", "Format", "Audience", "Buying_Type", "Plan_Start_Date", "Plan_End_Date", "KPI_Metric"]
     metric_columns = [
         "net_media_cost", "Cost", "plan_active_day", "active_day", "KPI", "KPI_actual"
     ]
@@ -52,7 +51,7 @@ def display(query_data, active_filters, min_date, max_date):
     #     },
    
     # Get aggregated data grouped by dimensions
-    df = query_data(
+    return dict(
         columns=dimension_columns + metric_columns,
         tablename="report_campaign_overall_total",
         filters=active_filters,
@@ -65,6 +64,24 @@ def display(query_data, active_filters, min_date, max_date):
         group_by=dimension_columns
     )
 
+
+def queries(active_filters, min_date, max_date):
+    """Every query display() makes, declared up front so they can run concurrently."""
+    return [
+        summary_query(active_filters, min_date, max_date),
+        detail_query(active_filters, min_date, max_date),
+    ]
+
+
+def display(query_data, active_filters, min_date, max_date):
+    summary_df = query_data(**summary_query(active_filters, min_date, max_date))
+    
+    if summary_df.empty:
+        st.warning("No data available for the selected filters.")
+        return
+        
+    df = query_data(**detail_query(active_filters, min_date, max_date))
+
     # Calculate enhanced metrics for the detailed dataframe with error handling
     if not df.empty:
         try:
@@ -137,19 +154,12 @@ def display(query_data, active_filters, min_date, max_date):
     plan_start = total_data.get('Plan_Start_Date', min_date)
     plan_end = total_data.get('Plan_End_Date', max_date)
 
-    # --- FIX STARTS HERE ---
-    # Convert plan_start and plan_end to datetime objects if they are strings
-    if isinstance(plan_start, str):
-        plan_start = pd.to_datetime(plan_start)
-    if isinstance(plan_end, str):
-        plan_end = pd.to_datetime(plan_end)
-    # --- FIX ENDS HERE ---
-
-    if plan_start and plan_end:
+    # query_data returns plan dates as datetime64 (missing dates as NaT)
+    if pd.notna(plan_start) and pd.notna(plan_end):
         date_range = f"From {plan_start.strftime('%b %d, %Y')} to {plan_end.strftime('%b %d, %Y')}"
     else:
         date_range = f"From {min_date.strftime('%b %d, %Y')} to {max_date.strftime('%b %d, %Y')}"
-    campaign_name = active_filters.get("Campaign_code", "All Campaigns")
+    campaign_name = campaign_title(active_filters)
     
     # Stylable title with custom CSS
     st.markdown(
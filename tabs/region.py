@@ -6,6 +6,55 @@ import plotly.express as px
 import plotly.graph_objects as go
 from streamlit_extras.stylable_container import stylable_container
 from st_aggrid import AgGrid, GridOptionsBuilder
+from components import campaign_title
+
+PLATFORMS = ["YouTube", "Facebook", "TikTok"]
+TOP_REGIONS = 10
+
+
+def region_query(active_filters, start_date, end_date):
+    """query_data arguments for the per-region totals behind the map."""
+    table = "report_campaign_region_api2"
+    columns = ["Region", "Code", "Impression", "Cost", "Clicks"]
+    return dict(
+        columns=columns, tablename=table, filters=active_filters, start_date=start_date, end_date=end_date,
+        aggregations={"Impression": "SUM", "Cost": "SUM", "Clicks": "SUM"},
+        group_by=["Region", "Code"]
+    )
+
+
+def top_regions_query(active_filters, start_date, end_date):
+    """query_data arguments for the regions with the most impressions, with their CPM and CTR."""
+    query = region_query(active_filters, start_date, end_date)
+    query.update(
+        ratios={"CPM": ("Cost", "Impression", 1000), "CTR": ("Clicks", "Impression", 100)},
+        order_by=[("Impression", "DESC")],
+        limit=TOP_REGIONS,
+    )
+    return query
+
+
+def platform_query(platform, active_filters, start_date, end_date):
+    """query_data arguments for one platform's per-region breakdown table."""
+    platform_filters = active_filters.copy()
+    platform_filters["Platform"] = platform
+    return dict(
+        columns=["Region", "Cost", "Impression", "Clicks"], 
+        tablename="report_campaign_region_api2", 
+        filters=platform_filters, 
+        start_date=start_date, 
+        end_date=end_date,
+        aggregations={"Cost": "SUM", "Impression": "SUM", "Clicks": "SUM"},
+        group_by=["Region"]
+    )
+
+
+def queries(active_filters, start_date, end_date):
+    """Every query display() makes, declared up front so they can run concurrently."""
+    return [region_query(active_filters, start_date, end_date), top_regions_query(active_filters, start_date, end_date)] + [
+        platform_query(platform, active_filters, start_date, end_date) for platform in PLATFORMS
+    ]
+
 
 def display(query_data, active_filters, start_date, end_date):
     with stylable_container(
@@ -16,7 +65,7 @@ def display(query_data, active_filters, start_date, end_date):
             }
             """,
     ):
-        campaign_name = active_filters.get("Campaign_code", "All Campaigns")
+        campaign_name = campaign_title(active_filters)
                 # Stylable title with custom CSS
         st.markdown(
             f"""
@@ -52,21 +101,12 @@ def display(query_data, active_filters, start_date, end_date):
             unsafe_allow_html=True
         )    
 
-        table = "report_campaign_region_api2"
-        columns = ["Region", "Code", "Impression", "Cost", "Clicks"]
-        
-        df = query_data(columns, table, filters=active_filters, start_date=start_date, end_date=end_date)
+        df_grouped = query_data(**region_query(active_filters, start_date, end_date))
 
-        if df.empty:
+        if df_grouped.empty:
             st.warning("No region data available for the selected filters.")
             return
 
-        df_grouped = df.groupby(["Region", "Code"]).agg({
-            "Impression": "sum",
-            "Cost": "sum",
-            "Clicks": "sum"
-        }).reset_index()
-
         json_path = os.path.join("region", "vietnam_state.geojson")
         with open(json_path, "r", encoding="utf-8") as f:
             vietnam_geo = json.load(f)
@@ -97,9 +137,7 @@ def display(query_data, active_filters, start_date, end_date):
         )
 
         # --- Bar Charts ---
-        df_grouped['CPM'] = (df_grouped['Cost'] / df_grouped['Impression']) * 1000
-        df_grouped['CTR'] = (df_grouped['Clicks'] / df_grouped['Impression']) * 100
-        df_top10 = df_grouped.sort_values(by='Impression', ascending=False).head(10)
+        df_top10 = query_data(**top_regions_query(active_filters, start_date, end_date))
 
         # Bar Chart 1: Impressions and CPM
         fig1 = go.Figure()
@@ -170,10 +208,9 @@ def display(query_data, active_filters, start_date, end_date):
         # --- Platform Breakdown Tables ---
         st.subheader("Platform Breakdown")
         col_yt, col_fb, col_tk = st.columns(3)
-        platforms = ["YouTube", "Facebook", "TikTok"]
         cols = [col_yt, col_fb, col_tk]
 
-        for platform, col in zip(platforms, cols):
+        for platform, col in zip(PLATFORMS, cols):
             with col:
                 with stylable_container(
                     key=f"vmk_platform_container_{platform}",
@@ -188,17 +225,7 @@ def display(query_data, active_filters, start_date, end_date):
                     """
                 ):
                     st.header(platform)
-                    platform_filters = active_filters.copy()
-                    platform_filters["Platform"] = platform
-                    df_platform = query_data(
-                        ["Region", "Cost", "Impression", "Clicks"], 
-                        "report_campaign_region_api2", 
-                        platform_filters, 
-                        start_date, 
-                        end_date,
-                        aggregations={"Cost": "SUM", "Impression": "SUM", "Clicks": "SUM"},
-                        group_by=["Region"]
-                    )
+                    df_platform = query_data(**platform_query(platform, active_filters, start_date, end_date))
                     if not df_platform.empty:
                         gb = GridOptionsBuilder.from_dataframe(df_platform)
                         gb.configure_column("Cost", type=["numericColumn", "numberColumnFilter", "customNumericFormat"], valueFormatter="data.Cost.toLocaleString('en-US')")
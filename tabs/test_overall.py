@@ -3,50 +3,19 @@ import pandas as pd
 from components import styled_kpi_card
 from streamlit_extras.stylable_container import stylable_container
 
-def display(query_data, active_filters, min_date, max_date):
-    # Helper function to safely handle None values
-    def safe_value(val, default=0):
-        return val if pd.notna(val) else default
-    
-    # Query summary data from the first table - adding KPI_Metric for filtering
-    summary_columns = [
-        "net_media_cost", "Cost", "plan_active_day", "active_day", "Impression", 
-        "Engagements", "Clicks", "Views", "sessions", "add_to_carts", "ecommerce_purchases",
-        "impression_plan", "engagement_plan", "click_plan", "views_plan"
-    ]
-    
-    # Get all data for committed value calculation (without aggregations)
-    all_data_df = query_data(
-        columns=summary_columns + ["KPI_Metric"],  # Add KPI_Metric for filtering
-        tablename="report_campaign_overall_total",
-        filters=active_filters,
-        start_date=min_date,
-        end_date=max_date,
-        aggregations=None,  # No aggregations to get individual rows
-        group_by=None
-    )
-    
-    if all_data_df.empty:
-        st.warning("No data available for the selected filters.")
-        return
-    
-    # Calculate committed values based on KPI_Metric filtering
-    committed_values = {}
-    for _, row in all_data_df.iterrows():
-        kpi_metric = row.get('KPI_Metric', '')
-        if kpi_metric:
-            if kpi_metric == 'Impression':
-                committed_values['Impression'] = committed_values.get('Impression', 0) + safe_value(row['Impression'])
-            elif kpi_metric == 'Engagement':
-                committed_values['Engagements'] = committed_values.get('Engagements', 0) + safe_value(row['Engagements'])
-            elif kpi_metric == 'Click':
-                committed_values['Clicks'] = committed_values.get('Clicks', 0) + safe_value(row['Clicks'])
-            elif kpi_metric == 'View':
-                committed_values['Views'] = committed_values.get('Views', 0) + safe_value(row['Views'])
-    
-    # Get total data (sum of all rows)
-    total_data_df = query_data(
-        columns=summary_columns,
+SUMMARY_COLUMNS = [
+    "net_media_cost", "Cost", "plan_active_day", "active_day", "Impression", 
+    "Engagements", "Clicks", "Views", "sessions", "add_to_carts", "ecommerce_purchases",
+    "impression_plan", "engagement_plan", "click_plan", "views_plan"
+]
+# Metric column -> the KPI_Metric value of the rows whose metric counts as committed
+COMMITTED_METRICS = {"Impression": "Impression", "Engagements": "Engagement", "Clicks": "Click", "Views": "View"}
+
+
+def total_query(active_filters, min_date, max_date):
+    """query_data arguments for the campaign totals (sum of all rows)."""
+    return dict(
+        columns=SUMMARY_COLUMNS,
         tablename="report_campaign_overall_total",
         filters=active_filters,
         start_date=min_date,
@@ -60,6 +29,46 @@ def display(query_data, active_filters, min_date, max_date):
         },
         group_by=[]  # No grouping for total values
     )
+
+
+def committed_query(active_filters, min_date, max_date):
+    """query_data arguments for the committed values: each metric summed over rows whose KPI_Metric is that metric."""
+    return dict(
+        columns=["report_date"],  # counted, to tell whether there are any rows
+        aggregations={"report_date": "COUNT"},
+        tablename="report_campaign_overall_total",
+        filters=active_filters,
+        start_date=min_date,
+        end_date=max_date,
+        conditions={
+            f"committed_{col}": ("SUM", col, {"KPI_Metric": kpi_metric})
+            for col, kpi_metric in COMMITTED_METRICS.items()
+        },
+    )
+
+
+def queries(active_filters, min_date, max_date):
+    """Every query display() makes, declared up front so they can run concurrently."""
+    return [
+        committed_query(active_filters, min_date, max_date),
+        total_query(active_filters, min_date, max_date),
+    ]
+
+
+def display(query_data, active_filters, min_date, max_date):
+    # Helper function to safely handle None values
+    def safe_value(val, default=0):
+        return val if pd.notna(val) else default
+    
+    # Committed values, summed per KPI_Metric by the database
+    committed_row = query_data(**committed_query(active_filters, min_date, max_date)).iloc[0]
+    if committed_row["report_date"] == 0:
+        st.warning("No data available for the selected filters.")
+        return
+    committed_values = {col: safe_value(committed_row[f"committed_{col}"]) for col in COMMITTED_METRICS}
+    
+    # Get total data (sum of all rows)
+    total_data_df = query_data(**total_query(active_filters, min_date, max_date))
     
     if total_data_df.empty:
         st.warning("No data available for the selected filters.")
@@ -3,6 +3,37 @@ import pandas as pd
 from components import styled_kpi_card
 from streamlit_extras.stylable_container import stylable_container
 
+SUMMARY_COLUMNS = [
+    "net_media_cost", "Cost", "plan_active_day", "active_day", "Impression", 
+    "Engagements", "Clicks", "Views", "sessions", "add_to_carts", "ecommerce_purchases",
+    "impression_plan", "engagement_plan", "click_plan", "views_plan"
+]
+
+
+def total_query(active_filters, min_date, max_date):
+    """query_data arguments for the campaign totals (sum of all rows)."""
+    return dict(
+        columns=SUMMARY_COLUMNS,
+        tablename="report_campaign_overall_total",
+        filters=active_filters,
+        start_date=min_date,
+        end_date=max_date,
+        aggregations={
+            "net_media_cost": "AVG", "plan_active_day": "AVG", "impression_plan": "AVG",
+            "engagement_plan": "AVG", "click_plan": "AVG", "views_plan": "AVG",
+            "Cost": "SUM", "active_day": "SUM", "Impression": "SUM", "Engagements": "SUM",
+            "Clicks": "SUM", "Views": "SUM", "sessions": "SUM", "add_to_carts": "SUM",
+            "ecommerce_purchases": "SUM"
+        },
+        group_by=[]  # No grouping for total values
+    )
+
+
+def queries(active_filters, min_date, max_date):
+    """Every query display() makes, declared up front so they can run concurrently."""
+    return [total_query(active_filters, min_date, max_date)]
+
+
 def display(query_data, active_filters, min_date, max_date):
     st.markdown("""
     <style>
@@ -24,29 +55,8 @@ def display(query_data, active_filters, min_date, max_date):
     def safe_value(val, default=0):
         return val if pd.notna(val) else default
     
-    # Query summary data from the first table - adding KPI_Metric for filtering
-    summary_columns = [
-        "net_media_cost", "Cost", "plan_active_day", "active_day", "Impression", 
-        "Engagements", "Clicks", "Views", "sessions", "add_to_carts", "ecommerce_purchases",
-        "impression_plan", "engagement_plan", "click_plan", "views_plan"
-    ]
-    
     # Get total data (sum of all rows)
-    total_data_df = query_data(
-        columns=summary_columns,
-        tablename="report_campaign_overall_total",
-        filters=active_filters,
-        start_date=min_date,
-        end_date=max_date,
-        aggregations={
-            "net_media_cost": "AVG", "plan_active_day": "AVG", "impression_plan": "AVG",
-            "engagement_plan": "AVG", "click_plan": "AVG", "views_plan": "AVG",
-            "Cost": "SUM", "active_day": "SUM", "Impression": "SUM", "Engagements": "SUM",
-            "Clicks": "SUM", "Views": "SUM", "sessions": "SUM", "add_to_carts": "SUM",
-            "ecommerce_purchases": "SUM"
-        },
-        group_by=[]  # No grouping for total values
-    )
+    total_data_df = query_data(**total_query(active_filters, min_date, max_date))
     
     if total_data_df.empty:
         st.warning("No data available for the selected filters.")